@@ -0,0 +1,7 @@
+import sys
+
+from movielens.cli import main
+
+if __name__ == "__main__":
+    # Same as `movielens generate <overrides>`
+    main(["generate", *sys.argv[1:]])
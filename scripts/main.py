@@ -1,17 +1,7 @@
-import hydra
-from omegaconf import DictConfig
-from prefect import flow
-
-from movielens.conf.config import CONFIG_PATH
-from movielens.pipelines.classic import ClassicPipeline
-
-
-@hydra.main(version_base=None, config_path=str(CONFIG_PATH), config_name="config")
-@flow
-def main(cfg: DictConfig) -> None:
-    pipe = ClassicPipeline(cfg)
-    pipe.run()
+import sys
 
+from movielens.cli import main
 
 if __name__ == "__main__":
-    main()
+    # Same as `movielens run <overrides>`
+    main(["run", *sys.argv[1:]])
@@ -0,0 +1,5 @@
+def main() -> None:
+    """Entry point of the movielens script. The CLI is only imported when it runs, keeping `import movielens` free."""
+    from movielens.cli import main as cli_main  # noqa: PLC0415
+
+    cli_main()
@@ -0,0 +1,89 @@
+import logging
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+
+import pandas as pd
+from omegaconf import DictConfig, OmegaConf
+
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig, ratings_schema
+from movielens.models.factory import get_factory, model_cfg
+from movielens.utils.dataset import keep_by_count, load_data, remove_nulls, write_data
+from movielens.utils.evaluate import evaluate_model
+from movielens.utils.instrument import INSTRUMENTATION
+from movielens.utils.synthetic import SyntheticRatings
+from movielens.utils.validation import fast_validate
+
+from .runner import run_case
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+
+def data_cases(cfg: DictConfig, df: pd.DataFrame, workdir: Path) -> Iterator[dict]:
+    """load_data, remove_nulls, keep_by_count and full and fast schema validation on df."""
+    size, repeats = len(df), cfg.bench.repeats
+    path = workdir / f"ratings_{size}.{cfg.data.format}"
+    write_data(df, path)
+    yield run_case("load_data", size, lambda: load_data(path, dtypes=RATINGS_DTYPES), size, repeats)
+    yield run_case("remove_nulls", size, lambda: remove_nulls(df), size, repeats)
+    yield run_case(
+        "keep_by_count",
+        size,
+        lambda: keep_by_count(df, ccfg.movie_id, min_count=cfg.exp.min_movie_rating_count),
+        size,
+        repeats,
+    )
+    yield run_case("validate", size, lambda: ratings_schema.validate(df), size, repeats)
+    yield run_case(
+        "validate_fast",
+        size,
+        lambda: fast_validate(df, ratings_schema, sample_size=cfg.features.validation_sample, seed=cfg.exp.seed),
+        size,
+        repeats,
+    )
+
+
+def model_cases(cfg: DictConfig, df: pd.DataFrame) -> Iterator[dict]:
+    """fit, predict, recommend_batch and evaluate_model for each model in bench.models."""
+    split = int(len(df) * (1 - cfg.training.test_size))
+    train_df, test_df = df.iloc[:split], df.iloc[split:]
+    for name, params in cfg.bench.models.items():
+        yield from single_model_cases(model_cfg(cfg, name, params), train_df, test_df)
+
+
+def single_model_cases(cfg: DictConfig, train_df: pd.DataFrame, test_df: pd.DataFrame) -> Iterator[dict]:
+    name, repeats = cfg.exp.model.name, cfg.bench.repeats
+    size = len(train_df) + len(test_df)
+    users = test_df[ccfg.user_id].unique()[: cfg.bench.recommend_users]
+    fitted = {}
+
+    def fit() -> None:
+        fitted["model"] = get_factory(name).create(cfg)
+        fitted["model"].fit(train_df)
+
+    yield run_case(f"{name}.fit", size, fit, len(train_df), repeats)
+    model = fitted["model"]
+    yield run_case(
+        f"{name}.predict",
+        size,
+        lambda: model.predict(test_df[ccfg.user_id], test_df[ccfg.movie_id]),
+        len(test_df),
+        repeats,
+    )
+    yield run_case(f"{name}.recommend_batch", size, lambda: model.recommend_batch(users, 10), len(users), repeats)
+    yield run_case(f"{name}.evaluate", size, lambda: evaluate_model(model, test_df), len(test_df), repeats)
+
+
+def run_suite(cfg: DictConfig) -> list[dict]:
+    """Run every case at every size in bench.sizes on synthetic data, entirely offline."""
+    # Stages reset the RSS high-water mark the cases are measured with
+    INSTRUMENTATION.enabled = False
+    results = []
+    with tempfile.TemporaryDirectory(prefix="movielens-bench-") as tmp:
+        for size in cfg.bench.sizes:
+            log.info(f"Benchmarking {size} rows")
+            df = SyntheticRatings(OmegaConf.merge(cfg.synthetic, {"n_rows": size})).frame()
+            results.extend(data_cases(cfg, df, Path(tmp)))
+            results.extend(model_cases(cfg, df))
+    return results
@@ -0,0 +1,45 @@
+import logging
+import os
+import subprocess
+import sys
+
+from omegaconf import DictConfig
+
+log = logging.getLogger(__name__)
+
+
+def import_seconds(module: str, repeats: int = 3) -> float:
+    """
+    Best of repeats cumulative import times of module in a fresh interpreter, from python -X importtime.
+
+    A fresh interpreter per run means nothing is already imported, as when a command or serving worker starts.
+    """
+    env = {**os.environ, "DISABLE_PANDERA_IMPORT_WARNING": "True"}
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run(  # noqa: S603
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=env,
+        )
+        # Lines are "import time: self [us] | cumulative | imported package", the module itself unindented
+        cumulative = [
+            int(line.split("|")[1])
+            for line in result.stderr.splitlines()
+            if line.startswith("import time:") and line.split("|")[2].strip() == module
+        ]
+        times.append(max(cumulative, default=0) / 1e6)
+    return min(times)
+
+
+def check_import_budget(budget: DictConfig, repeats: int = 3) -> list[str]:
+    """Modules of bench.import_budget whose import time exceeds their budget in seconds."""
+    violations = []
+    for entry in budget:
+        seconds = import_seconds(entry.module, repeats)
+        log.info(f"import {entry.module}: {seconds * 1000:.0f}ms (budget {entry.seconds * 1000:.0f}ms)")
+        if seconds > entry.seconds:
+            violations.append(f"import {entry.module}: {seconds:.3f}s vs {entry.seconds:.3f}s budget")
+    return violations
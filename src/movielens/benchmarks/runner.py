@@ -0,0 +1,108 @@
+import gc
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from movielens.utils.instrument import peak_rss, reset_peak_rss
+
+log = logging.getLogger(__name__)
+
+
+def measure(fn: Callable[[], object], repeats: int = 3) -> dict:
+    """
+    Time fn over repeats runs, then run it once more under tracemalloc for its peak memory.
+
+    Memory is measured in a separate run because tracing every allocation slows the timed runs down. tracemalloc
+    does not see pyarrow's allocator, so the RSS high-water mark (Linux only) is recorded next to it.
+    """
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    rss_before = reset_peak_rss()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rss_peak = peak_rss()
+    return {
+        "seconds": float(np.median(times)),
+        "min_seconds": min(times),
+        "peak_mb": peak / 2**20,
+        "peak_rss_mb": (rss_peak - rss_before) / 2**20 if rss_before is not None and rss_peak is not None else None,
+    }
+
+
+def run_case(name: str, size: int, fn: Callable[[], object], items: int, repeats: int = 3) -> dict:
+    """Measure one case and attach its throughput in items per second."""
+    result = {"case": name, "size": size, **measure(fn, repeats)}
+    result["throughput"] = items / result["seconds"] if result["seconds"] else 0.0
+    log.info(
+        f"{name} @ {size}: {result['seconds'] * 1000:.1f}ms, {result['throughput']:.0f} items/s, "
+        f"{result['peak_mb']:.1f}MB peak"
+    )
+    return result
+
+
+def environment() -> dict:
+    """Where the results were recorded, so results from different machines are not compared blindly."""
+    return {
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def write_results(results: list[dict], path: str) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"environment": environment(), "results": results}, indent=2))
+    log.info(f"Benchmark results written to {path}")
+
+
+def load_results(path: str) -> list[dict]:
+    return json.loads(Path(path).read_text())["results"]
+
+
+def find_regressions(
+    results: list[dict], baseline: list[dict], max_time: float, max_memory: float, min_seconds: float = 0.0
+) -> list[str]:
+    """
+    Compare results to a baseline by (case, size).
+
+    A case regresses when its median time or traced peak memory exceeds the baseline by more than the max_time or
+    max_memory fraction. The RSS peak is recorded for reference only, as allocator reuse makes it noisy. Cases
+    faster than min_seconds in the baseline are too noisy to time and only have their memory compared. Cases
+    missing from the baseline are ignored.
+    """
+    reference = {(r["case"], r["size"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = reference.get((result["case"], result["size"]))
+        if base is None:
+            continue
+        label = f"{result['case']} @ {result['size']}"
+        if base["seconds"] >= min_seconds and result["seconds"] > base["seconds"] * (1 + max_time):
+            regressions.append(f"{label}: {result['seconds']:.4f}s vs {base['seconds']:.4f}s baseline")
+        # Allow 1MB of slack so tiny allocations do not trip the relative threshold
+        if result["peak_mb"] > base["peak_mb"] * (1 + max_memory) + 1:
+            regressions.append(f"{label}: {result['peak_mb']:.1f}MB vs {base['peak_mb']:.1f}MB baseline peak")
+    return regressions
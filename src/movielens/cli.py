@@ -0,0 +1,162 @@
+"""
+The movielens command line.
+
+Every command imports what it needs when it runs, so starting the CLI only costs argparse; the remaining arguments
+are Hydra overrides, e.g. `movielens train exp=als_test`.
+"""
+
+import argparse
+import logging
+import sys
+from collections.abc import Callable
+
+from omegaconf import DictConfig
+
+from movielens.conf.config import CONFIG_PATH
+
+log = logging.getLogger(__name__)
+
+
+def features(cfg: DictConfig) -> None:
+    from movielens.pipelines.factory import get_pipeline
+    from movielens.utils.instrument import INSTRUMENTATION
+
+    INSTRUMENTATION.configure(cfg.instrumentation)
+    get_pipeline(cfg).features()
+
+
+def train(cfg: DictConfig) -> None:
+    from movielens.pipelines.factory import get_pipeline
+    from movielens.utils.instrument import INSTRUMENTATION
+
+    INSTRUMENTATION.configure(cfg.instrumentation)
+    get_pipeline(cfg).train()
+
+
+def run(cfg: DictConfig) -> None:
+    from prefect import flow
+
+    from movielens.pipelines.factory import get_pipeline
+    from movielens.utils.instrument import INSTRUMENTATION
+
+    INSTRUMENTATION.configure(cfg.instrumentation)
+    flow(name="movielens")(get_pipeline(cfg).run)()
+
+
+def materialize(cfg: DictConfig) -> None:
+    from movielens.features.store import materialize
+    from movielens.utils.instrument import INSTRUMENTATION
+
+    INSTRUMENTATION.configure(cfg.instrumentation)
+    materialize(cfg)
+
+
+def profile(cfg: DictConfig) -> None:
+    from pathlib import Path
+
+    import mlflow
+
+    from movielens.utils.analysis import log_profile, profile_data
+    from movielens.utils.instrument import INSTRUMENTATION, log_stages
+
+    INSTRUMENTATION.configure(cfg.instrumentation)
+    path = Path(cfg.profiling.path)
+    report = profile_data(str(path), cfg.profiling)
+    mlflow.set_experiment(cfg.exp.mlflow.experiment_name)
+    with mlflow.start_run(run_name=f"profile-{path.stem}"):
+        mlflow.log_params({"path": str(path), "mode": cfg.profiling.mode})
+        log_profile(report, path.stem)
+        log_stages()
+
+
+def tune(cfg: DictConfig) -> None:
+    from movielens.pipelines.factory import get_pipeline
+    from movielens.tuning.search import run_tuning
+    from movielens.utils.instrument import INSTRUMENTATION
+
+    INSTRUMENTATION.configure(cfg.instrumentation)
+    get_pipeline(cfg).features()
+    run_tuning(cfg)
+
+
+def serve(cfg: DictConfig) -> None:
+    if cfg.serving.mode == "local":
+        from movielens.serving.loadtest import run_local_test
+
+        run_local_test(cfg)
+    else:
+        import uvicorn
+
+        from movielens.serving.app import create_app
+
+        uvicorn.run(create_app(cfg), host=cfg.serving.host, port=cfg.serving.port)
+
+
+def bench(cfg: DictConfig) -> None:
+    from pathlib import Path
+
+    from movielens.benchmarks.cases import run_suite
+    from movielens.benchmarks.imports import check_import_budget
+    from movielens.benchmarks.runner import find_regressions, load_results, write_results
+
+    regressions = check_import_budget(cfg.bench.import_budget, repeats=cfg.bench.repeats)
+    results = run_suite(cfg)
+    if results:
+        write_results(results, cfg.bench.results)
+        if cfg.bench.update_baseline or not Path(cfg.bench.baseline).exists():
+            write_results(results, cfg.bench.baseline)
+        else:
+            regressions += find_regressions(
+                results,
+                load_results(cfg.bench.baseline),
+                max_time=cfg.bench.max_time_regression,
+                max_memory=cfg.bench.max_memory_regression,
+                min_seconds=cfg.bench.min_seconds,
+            )
+    for regression in regressions:
+        log.error(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    log.info("No regressions")
+
+
+def generate(cfg: DictConfig) -> None:
+    from movielens.utils.synthetic import SyntheticRatings
+
+    SyntheticRatings(cfg.synthetic).write(cfg.synthetic.output)
+
+
+COMMANDS: dict[str, tuple[Callable[[DictConfig], None], str]] = {
+    "features": (features, "Build the processed ratings and interaction matrix"),
+    "train": (train, "Train and evaluate exp.model on the processed ratings, logging the run to MLflow"),
+    "run": (run, "Run the features and train commands as one flow"),
+    "materialize": (materialize, "Materialize the user and movie aggregate features into the local Feast store"),
+    "profile": (profile, "Profile the columns of profiling.path in one pass and log the report to MLflow"),
+    "tune": (tune, "Search exp.model's params over tuning.space with Optuna"),
+    "serve": (serve, "Serve the trained model over HTTP, or load test it in-process with serving.mode=local"),
+    "bench": (bench, "Benchmark the hot paths and import times, failing on regressions"),
+    "generate": (generate, "Write synthetic ratings of synthetic.n_rows rows to synthetic.output"),
+}
+
+
+def run_hydra(command: str, overrides: list[str]) -> None:
+    """Run a command under Hydra, with the overrides and Hydra flags (--cfg, -m, ...) as if on its own command line."""
+    import hydra
+
+    task, _ = COMMANDS[command]
+    sys.argv = [f"movielens {command}", f"hydra.job.name={command}", *overrides]
+    hydra.main(version_base=None, config_path=str(CONFIG_PATH), config_name="config")(task)()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="movielens", description="MovieLens recommender pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, help_text) in COMMANDS.items():
+        command = commands.add_parser(name, help=help_text, description=help_text)
+        command.add_argument("overrides", nargs="*", help="Hydra overrides, e.g. exp=als_test")
+    args, hydra_args = parser.parse_known_args(argv)
+    run_hydra(args.command, [*args.overrides, *hydra_args])
+
+
+if __name__ == "__main__":
+    main()
@@ -12,11 +12,21 @@ class DataColumnsConfig:
     timestamp: str = "timestamp"
 
 
+# Compact on-disk and in-memory dtypes for the ratings columns
+RATINGS_DTYPES = {
+    DataColumnsConfig.user_id: "int32",
+    DataColumnsConfig.movie_id: "int32",
+    DataColumnsConfig.rating: "float32",
+    DataColumnsConfig.timestamp: "int64",
+}
+
 ratings_schema = DataFrameSchema(
     {
-        DataColumnsConfig.user_id: Column(int, nullable=False),
-        DataColumnsConfig.movie_id: Column(int, nullable=False),
-        DataColumnsConfig.rating: Column(float, nullable=False, checks=pa.Check.in_range(0.5, 5.0)),
-        DataColumnsConfig.timestamp: Column(int, nullable=False),
+        DataColumnsConfig.user_id: Column(RATINGS_DTYPES[DataColumnsConfig.user_id], nullable=False),
+        DataColumnsConfig.movie_id: Column(RATINGS_DTYPES[DataColumnsConfig.movie_id], nullable=False),
+        DataColumnsConfig.rating: Column(
+            RATINGS_DTYPES[DataColumnsConfig.rating], nullable=False, checks=pa.Check.in_range(0.5, 5.0)
+        ),
+        DataColumnsConfig.timestamp: Column(RATINGS_DTYPES[DataColumnsConfig.timestamp], nullable=False),
     }
 )
@@ -0,0 +1,207 @@
+import json
+import logging
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.utils.storage import remove_path
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+USER_FEATURES = ("user_mean", "user_log_count", "user_bias")
+MOVIE_FEATURES = ("movie_mean", "movie_log_count", "movie_bias")
+TIME_FEATURE = "days_since_first_rating"
+NO_GENRES = "(no genres listed)"
+SECONDS_PER_DAY = 86_400
+# Files making up saved RatingAggregates
+ARRAYS = ("user_stats", "user_first_ts", "user_last_ts", "movie_stats")
+META_FILE = "meta.json"
+# Per-id sums accumulated over the chunks in the first pass of RatingAggregates.fit_chunks
+TOTALS = ("user_count", "user_sum", "movie_count", "movie_sum", "user_first_ts", "user_last_ts")
+
+
+def table_index(ids: np.ndarray, size: int) -> np.ndarray:
+    """Rows of a table indexed by raw id, with ids outside it mapped to its last row, which holds the defaults."""
+    ids = np.asarray(ids, dtype=np.int64)
+    return np.where((ids >= 0) & (ids < size - 1), ids, size - 1)
+
+
+def grow(array: np.ndarray, size: int, fill: float = 0) -> np.ndarray:
+    """The array padded with fill up to size, or unchanged if already that long."""
+    if len(array) >= size:
+        return array
+    return np.concatenate([array, np.full(size - len(array), fill, dtype=array.dtype)])
+
+
+def add_counts(totals: np.ndarray, ids: np.ndarray, weights: np.ndarray | None = None) -> np.ndarray:
+    """Add the (weighted) counts of ids to totals indexed by id, growing totals to the largest id."""
+    counts = np.bincount(ids, weights=weights)
+    totals = grow(totals, len(counts))
+    totals[: len(counts)] += counts
+    return totals
+
+
+def movie_genres(path: str, size: int) -> tuple[np.ndarray, list[str]]:
+    """One-hot genres of movies.csv as a float32 table indexed by raw movie id, and the genre names."""
+    movies = pd.read_csv(path, usecols=[ccfg.movie_id, "genres"])
+    movies = movies[movies[ccfg.movie_id] < size - 1]
+    genres = movies["genres"].str.get_dummies(sep="|").drop(columns=NO_GENRES, errors="ignore")
+    table = np.zeros((size, genres.shape[1]), dtype=np.float32)
+    table[movies[ccfg.movie_id].to_numpy()] = genres.to_numpy(dtype=np.float32)
+    log.info(f"Loaded {genres.shape[1]} genres of {len(movies)} movies from {path}")
+    return table, list(genres.columns)
+
+
+@dataclass
+class RatingAggregates:
+    """
+    Per-user and per-movie rating statistics, turned into a numeric feature row for any (user, movie, time).
+
+    The statistics are tables indexed directly by raw id, so fitting is a handful of bincounts and transforming is a
+    gather, with no sort or groupby. The last row of each table holds the values for unseen ids: the global mean,
+    a count of zero and no bias. Fit only on training ratings, so no held-out rating leaks into the features.
+    """
+
+    global_mean: float
+    user_stats: np.ndarray
+    user_first_ts: np.ndarray
+    user_last_ts: np.ndarray
+    movie_stats: np.ndarray
+    genres: list[str] = field(default_factory=list)
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def feature_names(self) -> list[str]:
+        return [*USER_FEATURES, TIME_FEATURE, *MOVIE_FEATURES, *(f"genre_{genre}" for genre in self.genres)]
+
+    @classmethod
+    def fit(
+        cls, df: pd.DataFrame, shrinkage: float = 10.0, movies_path: str | None = None, meta: dict | None = None
+    ) -> "RatingAggregates":
+        """Fit the statistics on a ratings frame."""
+        return cls.fit_chunks(lambda: [df], shrinkage=shrinkage, movies_path=movies_path, meta=meta)
+
+    @classmethod
+    def fit_chunks(
+        cls,
+        chunks: Callable[[], Iterable[pd.DataFrame]],
+        shrinkage: float = 10.0,
+        movies_path: str | None = None,
+        meta: dict | None = None,
+    ) -> "RatingAggregates":
+        """
+        Fit the statistics on ratings streamed in chunks, calling chunks() once for each of two passes.
+
+        Biases are the regularised mean residuals of the baseline model, the movie's from the global mean and the
+        user's from the global mean plus the movie bias, each shrunk towards zero by shrinkage pseudo-ratings. The
+        first pass sums the ratings per user and movie, the second the user residuals once the movie biases are known.
+        """
+        totals = {name: np.zeros(0, dtype=np.float64 if name.endswith("_sum") else np.int64) for name in TOTALS}
+        rows = 0
+        for chunk in chunks():
+            if len(chunk):
+                rows += len(chunk)
+                cls._add_chunk(totals, chunk)
+        ratings_sum = totals["user_sum"].sum()
+        global_mean = float(ratings_sum / rows) if rows else 0.0
+        # One extra row at the end of every table holds the values of unseen ids
+        n_users = len(totals["user_count"]) + 1
+        n_movies = len(totals["movie_count"]) + 1
+        user_count, user_sum = grow(totals["user_count"], n_users), grow(totals["user_sum"], n_users)
+        movie_count, movie_sum = grow(totals["movie_count"], n_movies), grow(totals["movie_sum"], n_movies)
+        movie_bias = (movie_sum - movie_count * global_mean) / (movie_count + shrinkage)
+
+        residuals = np.zeros(0)
+        for chunk in chunks():
+            if len(chunk):
+                ratings = chunk[ccfg.rating].to_numpy(dtype=np.float64)
+                movies = chunk[ccfg.movie_id].to_numpy()
+                residuals = add_counts(
+                    residuals, chunk[ccfg.user_id].to_numpy(), ratings - global_mean - movie_bias[movies]
+                )
+        user_bias = grow(residuals, n_users) / (user_count + shrinkage)
+
+        genre_table, genres = (
+            movie_genres(movies_path, n_movies)
+            if movies_path and Path(movies_path).exists()
+            else (np.zeros((n_movies, 0), dtype=np.float32), [])
+        )
+        aggregates = cls(
+            global_mean=global_mean,
+            user_stats=cls._stats(user_count, user_sum, user_bias, global_mean),
+            user_first_ts=grow(totals["user_first_ts"], n_users, np.iinfo(np.int64).max),
+            user_last_ts=grow(totals["user_last_ts"], n_users),
+            movie_stats=np.hstack([cls._stats(movie_count, movie_sum, movie_bias, global_mean), genre_table]),
+            genres=genres,
+            meta=meta or {},
+        )
+        log.info(
+            f"Rating aggregates of {np.count_nonzero(user_count)} users and {np.count_nonzero(movie_count)} movies "
+            f"from {rows} ratings, {len(aggregates.feature_names)} features"
+        )
+        return aggregates
+
+    @staticmethod
+    def _add_chunk(totals: dict, chunk: pd.DataFrame) -> None:
+        """Add a chunk's ratings to the per-user and per-movie counts, sums and first and last timestamps."""
+        users = chunk[ccfg.user_id].to_numpy()
+        movies = chunk[ccfg.movie_id].to_numpy()
+        ratings = chunk[ccfg.rating].to_numpy(dtype=np.float64)
+        timestamps = chunk[ccfg.timestamp].to_numpy(dtype=np.int64)
+        totals["user_count"] = add_counts(totals["user_count"], users)
+        totals["user_sum"] = add_counts(totals["user_sum"], users, ratings)
+        totals["movie_count"] = add_counts(totals["movie_count"], movies)
+        totals["movie_sum"] = add_counts(totals["movie_sum"], movies, ratings)
+        size = int(users.max()) + 1
+        totals["user_first_ts"] = grow(totals["user_first_ts"], size, np.iinfo(np.int64).max)
+        np.minimum.at(totals["user_first_ts"], users, timestamps)
+        totals["user_last_ts"] = grow(totals["user_last_ts"], size)
+        np.maximum.at(totals["user_last_ts"], users, timestamps)
+
+    @staticmethod
+    def _stats(count: np.ndarray, total: np.ndarray, bias: np.ndarray, global_mean: float) -> np.ndarray:
+        """Mean, log count and bias columns, with the global mean for ids without ratings."""
+        mean = np.divide(total, count, out=np.full(len(count), global_mean), where=count > 0)
+        return np.column_stack([mean, np.log1p(count), bias]).astype(np.float32)
+
+    def transform(self, x: pd.DataFrame) -> np.ndarray:
+        """
+        Feature rows of the (user, movie) pairs of x, as a float32 array in feature_names order.
+
+        The time feature uses x's timestamp column when present, otherwise the user's last training rating, as
+        when recommending.
+        """
+        users = table_index(x[ccfg.user_id].to_numpy(), len(self.user_stats))
+        movies = table_index(x[ccfg.movie_id].to_numpy(), len(self.movie_stats))
+        has_time = ccfg.timestamp in x
+        timestamps = x[ccfg.timestamp].to_numpy(dtype=np.int64) if has_time else self.user_last_ts[users]
+        n_user = len(USER_FEATURES)
+        features = np.empty((len(x), len(self.feature_names)), dtype=np.float32)
+        features[:, :n_user] = self.user_stats[users]
+        # Unseen users have a first timestamp of int64 max, which clips to zero days
+        features[:, n_user] = np.maximum(timestamps - self.user_first_ts[users], 0) / SECONDS_PER_DAY
+        features[:, n_user + 1 :] = self.movie_stats[movies]
+        return features
+
+    def save(self, path: str) -> None:
+        """Write every table as its own .npy file in the path directory."""
+        path = Path(path)
+        remove_path(path)
+        path.mkdir(parents=True)
+        for name in ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        meta = {"global_mean": self.global_mean, "genres": self.genres, "meta": self.meta}
+        (path / META_FILE).write_text(json.dumps(meta, default=str))
+        log.info(f"Rating aggregates saved to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "RatingAggregates":
+        path = Path(path)
+        meta = json.loads((path / META_FILE).read_text())
+        arrays = {name: np.load(path / f"{name}.npy") for name in ARRAYS}
+        return cls(global_mean=meta["global_mean"], genres=meta["genres"], meta=meta["meta"], **arrays)
@@ -1,14 +1,21 @@
 import logging
 
 import pandas as pd
-import pandera as pa
 from omegaconf import DictConfig
 from prefect import flow, task
+from prefect.cache_policies import NO_CACHE
+from prefect.futures import wait
 
-from movielens.conf.schema import DataColumnsConfig, ratings_schema
-from movielens.utils.dataset import keep_by_count, load_data, remove_nulls, write_data
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
+from movielens.training.splits import split_indices, split_params
+from movielens.utils.cache import feature_cache
+from movielens.utils.dataset import keep_by_count, load_data, remove_nulls, to_columnar, write_data
+from movielens.utils.instrument import instrument
 
 from .base import BaseFeature
+from .interactions import InteractionMatrix
+from .streaming import StreamingFeature
+from .tasks import validate_ratings
 
 log = logging.getLogger(__name__)
 ccfg = DataColumnsConfig
@@ -20,14 +27,18 @@ class BaselineFeature(BaseFeature):
         self.ccfg = ccfg
         self.df = pd.DataFrame
 
-    @task()
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.load")
     def load(self) -> pd.DataFrame:
-        df = load_data(self.cfg.data.ratings_raw, n=self.cfg.exp.n_rows)
+        path = to_columnar(self.cfg.data.ratings_raw, fmt=self.cfg.data.format, dtypes=RATINGS_DTYPES)
+        df = load_data(path, n=self.cfg.exp.n_rows, dtypes=RATINGS_DTYPES)
         return df
 
-    @task()
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.clean")
     def clean(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = remove_nulls(df, subset=[self.ccfg.movie_id, self.ccfg.rating, self.ccfg.timestamp, self.ccfg.user_id])
+        subset = [self.ccfg.movie_id, self.ccfg.rating, self.ccfg.timestamp, self.ccfg.user_id]
+        df = remove_nulls(df, subset=subset, dtypes=RATINGS_DTYPES)
         df = keep_by_count(df, self.ccfg.movie_id, min_count=self.cfg.exp.min_movie_rating_count)
         return df
 
@@ -35,25 +46,42 @@ class BaselineFeature(BaseFeature):
     def transform() -> None:
         pass
 
-    @task()
-    def validate(self, df: pd.DataFrame) -> None:
-        try:
-            df = ratings_schema.validate(df)
-        except pa.errors.SchemaError:
-            msg = "Schema fail."
-            log.exception(msg)
-            raise
-        return df
+    @instrument("features.validate")
+    def validate(self, df: pd.DataFrame) -> pd.DataFrame:
+        return validate_ratings(df, self.cfg)
 
-    @task()
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.write")
     def write(self, df: pd.DataFrame) -> None:
         write_data(df, path=self.cfg.data.ratings_processed)
 
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.write_interactions")
+    def write_interactions(self, df: pd.DataFrame) -> None:
+        """Save the matrix of the train rows of the training.split only, so trainers can load it without leakage."""
+        train_idx, _ = split_indices(df, self.cfg)
+        matrix = InteractionMatrix.from_frame(df.take(train_idx), meta=split_params(self.cfg, len(df)))
+        matrix.save(self.cfg.data.interactions)
+
     @flow()
+    @instrument("features.run")
     def run(self) -> None:
-        df = self.load()
-        log.info(f"df size: {len(df)}")
-        df = self.clean(df)
-        df = self.validate(df)
-        log.info(f"df size: {len(df)}")
-        self.write(df)
+        cache = feature_cache(self.cfg, "baseline_features", split=split_params(self.cfg, self.cfg.exp.n_rows))
+        if self.cfg.features.cache and cache.is_fresh():
+            log.info(f"Features in {self.cfg.data.ratings_processed} are up to date, skipping")
+            return
+        cache.invalidate()
+        if self.cfg.features.streaming:
+            StreamingFeature(self.cfg, self.ccfg).run()
+        else:
+            df = self.load()
+            log.info(f"df size: {len(df)}")
+            df = self.clean(df)
+            df = self.validate(df)
+            log.info(f"df size: {len(df)}")
+            # The processed file and the interaction matrix only depend on df, so they are written concurrently
+            writes = [self.write.submit(df), self.write_interactions.submit(df)]
+            wait(writes)
+            for future in writes:
+                future.result()
+        cache.commit()
@@ -1,14 +1,25 @@
 import logging
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
-import pandera as pa
 from omegaconf import DictConfig
 from prefect import flow, task
+from prefect.cache_policies import NO_CACHE
+from prefect.futures import wait
 
-from movielens.conf.schema import DataColumnsConfig, ratings_schema
-from movielens.utils.dataset import keep_by_count, load_data, remove_nulls, write_data
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
+from movielens.training.splits import split_indices, split_params
+from movielens.utils.cache import feature_cache
+from movielens.utils.dataset import keep_by_count, load_data, remove_nulls, to_columnar, write_data
+from movielens.utils.instrument import instrument
+from movielens.utils.storage import remove_path
 
+from .aggregates import RatingAggregates
 from .base import BaseFeature
+from .interactions import InteractionMatrix
+from .streaming import StreamingFeature
+from .tasks import validate_ratings
 
 log = logging.getLogger(__name__)
 ccfg = DataColumnsConfig
@@ -18,43 +29,99 @@ class ClassicFeature(BaseFeature):
     def __init__(self, cfg: DictConfig, ccfg: DataColumnsConfig) -> None:
         self.cfg = cfg
         self.ccfg = ccfg
-        self.df = pd.DataFrame
 
-    @task()
-    def load(self) -> None:
-        self.df = load_data(self.cfg.data.ratings_raw, n=self.cfg.exp.n_rows)
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.load")
+    def load(self) -> pd.DataFrame:
+        path = to_columnar(self.cfg.data.ratings_raw, fmt=self.cfg.data.format, dtypes=RATINGS_DTYPES)
+        return load_data(path, n=self.cfg.exp.n_rows, dtypes=RATINGS_DTYPES)
 
-    @task()
-    def clean(self) -> None:
-        self.df = remove_nulls(
-            self.df, subset=[self.ccfg.movie_id, self.ccfg.rating, self.ccfg.timestamp, self.ccfg.user_id]
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.clean")
+    def clean(self, df: pd.DataFrame) -> pd.DataFrame:
+        subset = [self.ccfg.movie_id, self.ccfg.rating, self.ccfg.timestamp, self.ccfg.user_id]
+        df = remove_nulls(df, subset=subset, dtypes=RATINGS_DTYPES)
+        return keep_by_count(df, self.ccfg.movie_id, min_count=self.cfg.exp.min_movie_rating_count)
+
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.transform")
+    def transform(self, df: pd.DataFrame, train_idx: np.ndarray) -> tuple[RatingAggregates, np.ndarray]:
+        """
+        Numeric features of every rating: user and movie mean, log count and bias, days since the user's first
+        rating and the movie's genres.
+
+        The statistics are fitted on the train rows of the training.split only, so the held-out ratings never
+        contribute to the features they are scored with.
+        """
+        aggregates = RatingAggregates.fit(
+            df.take(train_idx),
+            shrinkage=self.cfg.features.bias_shrinkage,
+            movies_path=self.cfg.data.movies_raw,
+            meta=split_params(self.cfg, len(df)),
         )
-        self.df = keep_by_count(self.df, self.ccfg.movie_id, min_count=self.cfg.exp.min_movie_rating_count)
-
-    @task()
-    def transform(self) -> None:
-        self.x = self.df[[ccfg.user_id, ccfg.movie_id]]
-        self.y = self.df[ccfg.rating]
-
-    @task()
-    def validate(self) -> None:
-        try:
-            self.df = ratings_schema.validate(self.df)
-        except pa.errors.SchemaError:
-            msg = "Schema fail."
-            log.exception(msg)
-            raise
-
-    @task()
-    def write(self) -> None:
-        write_data(self.df, path=self.cfg.data.ratings_processed)
+        return aggregates, aggregates.transform(df)
+
+    @instrument("features.validate")
+    def validate(self, df: pd.DataFrame) -> pd.DataFrame:
+        return validate_ratings(df, self.cfg)
+
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.write")
+    def write(self, df: pd.DataFrame) -> None:
+        write_data(df, path=self.cfg.data.ratings_processed)
+
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.write_interactions")
+    def write_interactions(self, df: pd.DataFrame, train_idx: np.ndarray) -> None:
+        """Save the matrix of the train rows only, like the aggregates."""
+        matrix = InteractionMatrix.from_frame(df.take(train_idx), meta=split_params(self.cfg, len(df)))
+        matrix.save(self.cfg.data.interactions)
+
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.write_features")
+    def write_features(self, aggregates: RatingAggregates, features: np.ndarray) -> None:
+        aggregates.save(self.cfg.data.aggregates)
+        np.save(self.cfg.data.features, features)
+        log.info(f"Feature matrix {features.shape} saved to {self.cfg.data.features}")
 
     @flow()
+    @instrument("features.run")
     def run(self) -> None:
-        self.load()
-        log.info(f"df size: {len(self.df)}")
-        self.clean()
-        self.validate()
-        self.transform()
-        log.info(f"self.df size: {len(self.df)}")
-        self.write()
+        cache = feature_cache(
+            self.cfg,
+            "classic_features",
+            # Streaming leaves the aggregates and features to the trainer, so they are only outputs without it
+            outputs=() if self.cfg.features.streaming else (self.cfg.data.aggregates, self.cfg.data.features),
+            # The genre one-hots come from movies_raw when it exists
+            inputs=tuple(path for path in [self.cfg.data.movies_raw] if Path(path).exists()),
+            split=split_params(self.cfg, self.cfg.exp.n_rows),
+            bias_shrinkage=self.cfg.features.bias_shrinkage,
+            streaming=self.cfg.features.streaming,
+        )
+        if self.cfg.features.cache and cache.is_fresh():
+            log.info(f"Features in {self.cfg.data.ratings_processed} are up to date, skipping")
+            return
+        cache.invalidate()
+        if self.cfg.features.streaming:
+            StreamingFeature(self.cfg, self.ccfg).run()
+            # The feature matrix needs every rating in memory, so the trainer fits the aggregates itself instead
+            remove_path(Path(self.cfg.data.aggregates))
+            remove_path(Path(self.cfg.data.features))
+        else:
+            df = self.load()
+            log.info(f"df size: {len(df)}")
+            df = self.clean(df)
+            df = self.validate(df)
+            train_idx, _ = split_indices(df, self.cfg)
+            aggregates, features = self.transform(df, train_idx)
+            log.info(f"df size: {len(df)}")
+            # The processed file, interaction matrix and features only depend on df, so they are written concurrently
+            writes = [
+                self.write.submit(df),
+                self.write_interactions.submit(df, train_idx),
+                self.write_features.submit(aggregates, features),
+            ]
+            wait(writes)
+            for future in writes:
+                future.result()
+        cache.commit()
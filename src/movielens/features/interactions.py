@@ -0,0 +1,199 @@
+import itertools
+import json
+import logging
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.utils.storage import remove_path
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+# Files making up a saved InteractionMatrix, all plain .npy so they can be memory-mapped
+ARRAYS = ("user_ids", "movie_ids", "csr_indptr", "csr_indices", "csr_data", "csc_indptr", "csc_indices", "csc_data")
+META_FILE = "meta.json"
+
+
+def encode_ids(index: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Map raw ids to their position in the sorted index array, -1 for ids not in it."""
+    ids = np.asarray(ids)
+    if len(index) == 0:
+        return np.full(len(ids), -1, dtype=np.int32)
+    pos = np.searchsorted(index, ids).clip(max=len(index) - 1)
+    return np.where(index[pos] == ids, pos, -1).astype(np.int32)
+
+
+def _index_dtype(nnz: int) -> type:
+    """Smallest index dtype scipy accepts without upcasting for this many entries."""
+    return np.int32 if nnz < np.iinfo(np.int32).max else np.int64
+
+
+@dataclass
+class InteractionMatrix:
+    """
+    Ratings as a sparse user x movie matrix with contiguous int32 row/column indices.
+
+    Row i is the user user_ids[i] and column j is the movie movie_ids[j]. Both id arrays are sorted so raw ids are
+    encoded with a binary search. The same ratings are held in CSR (fast per-user access) and CSC (fast per-movie
+    access) layouts. meta describes the rows the matrix was built from, e.g. the train split, and is saved with it.
+    """
+
+    user_ids: np.ndarray
+    movie_ids: np.ndarray
+    csr: sp.csr_matrix
+    csc: sp.csc_matrix
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.csr.shape
+
+    @property
+    def nnz(self) -> int:
+        return self.csr.nnz
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, meta: dict | None = None) -> "InteractionMatrix":
+        """Build the matrix from a ratings frame, keeping the last rating of any duplicate user-movie pair."""
+        user_ids, user_idx = np.unique(df[ccfg.user_id].to_numpy(), return_inverse=True)
+        movie_ids, movie_idx = np.unique(df[ccfg.movie_id].to_numpy(), return_inverse=True)
+        ratings = df[ccfg.rating].to_numpy(dtype=np.float32)
+        n_users, n_movies = len(user_ids), len(movie_ids)
+
+        keys = user_idx.astype(np.int64) * n_movies + movie_idx
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        keys, ratings = keys[last], ratings[order][last]
+
+        idx_dtype = _index_dtype(len(keys))
+        rows = keys // n_movies
+        indptr = np.zeros(n_users + 1, dtype=idx_dtype)
+        np.cumsum(np.bincount(rows, minlength=n_users), out=indptr[1:])
+        indices = (keys % n_movies).astype(idx_dtype)
+
+        csr = sp.csr_matrix((ratings, indices, indptr), shape=(n_users, n_movies), copy=False)
+        csr.has_sorted_indices = True
+        log.info(f"Interaction matrix: {n_users} users x {n_movies} movies, {csr.nnz} ratings")
+        return cls(user_ids.astype(np.int32), movie_ids.astype(np.int32), csr, csr.tocsc(), meta=meta or {})
+
+    @classmethod
+    def from_chunks(
+        cls, chunks: Callable[[], Iterable[pd.DataFrame]], block_size: int = 1_000_000, meta: dict | None = None
+    ) -> "InteractionMatrix":
+        """
+        Build the matrix from ratings streamed in chunks, calling chunks() once for each of three passes.
+
+        The first pass collects the ids, the second counts every user's ratings into the CSR indptr and the third
+        writes each rating into the next free slot of its row. Rows are then sorted and duplicate user-movie pairs
+        reduced to their last rating, as in from_frame, block_size ratings at a time. Only one chunk is held in
+        memory besides the matrix itself.
+        """
+        user_ids, movie_ids = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        for chunk in chunks():
+            user_ids = np.union1d(user_ids, chunk[ccfg.user_id].unique()).astype(np.int32)
+            movie_ids = np.union1d(movie_ids, chunk[ccfg.movie_id].unique()).astype(np.int32)
+        n_users, n_movies = len(user_ids), len(movie_ids)
+
+        counts = np.zeros(n_users, dtype=np.int64)
+        for chunk in chunks():
+            counts += np.bincount(encode_ids(user_ids, chunk[ccfg.user_id].to_numpy()), minlength=n_users)
+        nnz = int(counts.sum())
+        idx_dtype = _index_dtype(nnz)
+        indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        indices = np.empty(nnz, dtype=idx_dtype)
+        data = np.empty(nnz, dtype=np.float32)
+        next_free = indptr[:-1].copy()
+        for chunk in chunks():
+            rows = encode_ids(user_ids, chunk[ccfg.user_id].to_numpy())
+            order = np.argsort(rows, kind="stable")
+            rows = rows[order]
+            # Rank of every rating among the chunk's ratings of the same user, in file order
+            starts = np.flatnonzero(np.append(True, rows[1:] != rows[:-1]))
+            rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.append(starts, len(rows))))
+            positions = next_free[rows] + rank
+            indices[positions] = encode_ids(movie_ids, chunk[ccfg.movie_id].to_numpy())[order]
+            data[positions] = chunk[ccfg.rating].to_numpy(dtype=np.float32)[order]
+            next_free += np.bincount(rows, minlength=n_users)
+
+        indptr, indices, data = cls._sort_rows(indptr, indices, data, n_movies, block_size)
+        csr = sp.csr_matrix((data, indices, indptr.astype(idx_dtype)), shape=(n_users, n_movies), copy=False)
+        csr.has_sorted_indices = True
+        log.info(f"Interaction matrix: {n_users} users x {n_movies} movies, {csr.nnz} ratings")
+        return cls(user_ids, movie_ids, csr, csr.tocsc(), meta=meta or {})
+
+    @staticmethod
+    def _sort_rows(
+        indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_movies: int, block_size: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sort the columns of every row and keep the last of duplicate columns, compacting the arrays in place."""
+        n_users, nnz = len(indptr) - 1, indptr[-1]
+        edges = np.unique(
+            np.concatenate([[0], np.searchsorted(indptr, np.arange(block_size, nnz, block_size)), [n_users]])
+        )
+        counts = np.zeros(n_users, dtype=np.int64)
+        out = 0
+        for first, last in itertools.pairwise(edges):
+            lo, hi = indptr[first], indptr[last]
+            rows = np.repeat(np.arange(last - first), np.diff(indptr[first : last + 1]))
+            keys = rows * n_movies + indices[lo:hi]
+            order = np.argsort(keys, kind="stable")
+            kept = order[np.append(keys[order][1:] != keys[order][:-1], True)]
+            # The kept ratings never move forward, so writing them at out cannot overwrite unread ones
+            indices[out : out + len(kept)] = indices[lo:hi][kept]
+            data[out : out + len(kept)] = data[lo:hi][kept]
+            counts[first:last] = np.bincount(rows[kept], minlength=last - first)
+            out += len(kept)
+        np.cumsum(counts, out=indptr[1:])
+        if out < nnz:
+            indices, data = indices[:out].copy(), data[:out].copy()
+        return indptr, indices, data
+
+    def encode_users(self, user_ids: np.ndarray) -> np.ndarray:
+        """Map raw user ids to row indices, -1 for users not in the matrix."""
+        return encode_ids(self.user_ids, user_ids)
+
+    def encode_movies(self, movie_ids: np.ndarray) -> np.ndarray:
+        """Map raw movie ids to column indices, -1 for movies not in the matrix."""
+        return encode_ids(self.movie_ids, movie_ids)
+
+    def save(self, path: str) -> None:
+        """Write every array as its own .npy file in the path directory."""
+        path = Path(path)
+        remove_path(path)
+        path.mkdir(parents=True)
+        arrays = {
+            "user_ids": self.user_ids,
+            "movie_ids": self.movie_ids,
+            "csr_indptr": self.csr.indptr,
+            "csr_indices": self.csr.indices,
+            "csr_data": self.csr.data,
+            "csc_indptr": self.csc.indptr,
+            "csc_indices": self.csc.indices,
+            "csc_data": self.csc.data,
+        }
+        for name, arr in arrays.items():
+            np.save(path / f"{name}.npy", arr)
+        (path / META_FILE).write_text(json.dumps({"shape": list(self.shape), "nnz": self.nnz, "meta": self.meta}))
+        log.info(f"Interaction matrix saved to {path}")
+
+    @classmethod
+    def load(cls, path: str, *, mmap: bool = True) -> "InteractionMatrix":
+        """Load a saved matrix. With mmap the arrays are read-only views of the files and nothing is copied."""
+        path = Path(path)
+        info = json.loads((path / META_FILE).read_text())
+        shape = tuple(info["shape"])
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None) for name in ARRAYS}
+        csr = sp.csr_matrix((arrays["csr_data"], arrays["csr_indices"], arrays["csr_indptr"]), shape=shape, copy=False)
+        csc = sp.csc_matrix((arrays["csc_data"], arrays["csc_indices"], arrays["csc_indptr"]), shape=shape, copy=False)
+        csr.has_sorted_indices = True
+        csc.has_sorted_indices = True
+        return cls(arrays["user_ids"], arrays["movie_ids"], csr, csc, meta=info.get("meta", {}))
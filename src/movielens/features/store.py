@@ -0,0 +1,179 @@
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from feast import Entity, FeatureStore, FeatureView, Field, FileSource, RepoConfig
+from feast.types import Array, Float32, Int64
+from omegaconf import DictConfig
+
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
+from movielens.utils.cache import StageCache
+from movielens.utils.dataset import load_data
+from movielens.utils.instrument import instrument
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+EVENT_TIMESTAMP = "event_timestamp"
+USER_VIEW = "user_stats"
+MOVIE_VIEW = "movie_stats"
+SECONDS_PER_DAY = 86_400
+
+STATS_SCHEMA = [
+    Field(name="rating_count", dtype=Int64),
+    Field(name="rating_mean", dtype=Float32),
+    Field(name="rating_var", dtype=Float32),
+    Field(name="last_rating_ts", dtype=Int64),
+    Field(name="days_since_last_rating", dtype=Float32),
+]
+
+
+def last_items(items: np.ndarray, starts: np.ndarray, counts: np.ndarray, n: int) -> list[np.ndarray]:
+    """Last n items of each group of the grouped items array, most recent first."""
+    offsets = np.arange(n)
+    positions = (starts + counts - 1)[:, None] - offsets[None, :]
+    valid = offsets[None, :] < counts[:, None]
+    recent = np.where(valid, items[np.where(valid, positions, 0)], -1)
+    return [row[:count] for row, count in zip(recent, np.minimum(counts, n), strict=True)]
+
+
+def aggregate_features(df: pd.DataFrame, key: str, reference_ts: int, last_n: int = 0) -> pd.DataFrame:
+    """
+    Rating count, mean, population variance and recency of each key, plus its last_n rated movies if last_n.
+
+    One sort by (key, timestamp) groups the ratings, after which every feature is a reduceat or a gather over the
+    group boundaries. Recency is measured from reference_ts, the newest rating, so it does not depend on the
+    wall clock. The event timestamp of a row is its last rating.
+    """
+    keys = df[key].to_numpy()
+    timestamps = df[ccfg.timestamp].to_numpy()
+    order = np.lexsort((timestamps, keys))
+    keys, timestamps = keys[order], timestamps[order]
+    ratings = df[ccfg.rating].to_numpy(dtype=np.float64)[order]
+
+    ids, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    mean = np.add.reduceat(ratings, starts) / counts
+    var = np.maximum(np.add.reduceat(ratings**2, starts) / counts - mean**2, 0)
+    last_ts = timestamps[starts + counts - 1]
+    features = pd.DataFrame(
+        {
+            key: ids.astype(np.int64),
+            "rating_count": counts.astype(np.int64),
+            "rating_mean": mean.astype(np.float32),
+            "rating_var": var.astype(np.float32),
+            "last_rating_ts": last_ts.astype(np.int64),
+            "days_since_last_rating": ((reference_ts - last_ts) / SECONDS_PER_DAY).astype(np.float32),
+            EVENT_TIMESTAMP: pd.to_datetime(last_ts, unit="s", utc=True),
+        }
+    )
+    if last_n:
+        movies = df[ccfg.movie_id].to_numpy().astype(np.int64)[order]
+        features["recent_movies"] = last_items(movies, starts, counts, last_n)
+    return features
+
+
+def feature_paths(cfg: DictConfig) -> dict[str, Path]:
+    root = Path(cfg.feature_store.dir)
+    return {
+        USER_VIEW: root / f"{USER_VIEW}.parquet",
+        MOVIE_VIEW: root / f"{MOVIE_VIEW}.parquet",
+        "registry": root / "registry.db",
+        "online_store": root / "online_store.db",
+    }
+
+
+def feature_views(cfg: DictConfig) -> list:
+    """Feast entities and feature views over the aggregate parquet files."""
+    paths = feature_paths(cfg)
+    user = Entity(name="user", join_keys=[ccfg.user_id], description="MovieLens user")
+    movie = Entity(name="movie", join_keys=[ccfg.movie_id], description="MovieLens movie")
+    user_stats = FeatureView(
+        name=USER_VIEW,
+        entities=[user],
+        # ttl 0 keeps a user's features valid however long ago they last rated
+        ttl=timedelta(0),
+        schema=[*STATS_SCHEMA, Field(name="recent_movies", dtype=Array(Int64))],
+        source=FileSource(name=f"{USER_VIEW}_source", path=str(paths[USER_VIEW]), timestamp_field=EVENT_TIMESTAMP),
+    )
+    movie_stats = FeatureView(
+        name=MOVIE_VIEW,
+        entities=[movie],
+        ttl=timedelta(0),
+        schema=STATS_SCHEMA,
+        source=FileSource(name=f"{MOVIE_VIEW}_source", path=str(paths[MOVIE_VIEW]), timestamp_field=EVENT_TIMESTAMP),
+    )
+    return [user, movie, user_stats, movie_stats]
+
+
+def feature_store(cfg: DictConfig) -> FeatureStore:
+    """The local Feast store: file offline store over the parquet files, SQLite online store and registry."""
+    paths = feature_paths(cfg)
+    paths["registry"].parent.mkdir(parents=True, exist_ok=True)
+    config = RepoConfig(
+        project=cfg.feature_store.project,
+        provider="local",
+        registry=str(paths["registry"]),
+        offline_store={"type": "file"},
+        online_store={"type": "sqlite", "path": str(paths["online_store"])},
+        repo_path=paths["registry"].parent,
+        entity_key_serialization_version=3,
+    )
+    return FeatureStore(config=config)
+
+
+def feature_store_cache(cfg: DictConfig) -> StageCache:
+    paths = feature_paths(cfg)
+    return StageCache(
+        "feature_store",
+        inputs=[cfg.data.ratings_processed],
+        outputs=[paths[USER_VIEW], paths[MOVIE_VIEW], paths["online_store"]],
+        params={"project": cfg.feature_store.project, "last_n": cfg.feature_store.last_n},
+    )
+
+
+@instrument("feature_store.write_aggregates")
+def write_aggregates(cfg: DictConfig) -> tuple[pd.Timestamp, pd.Timestamp]:
+    """Write the user and movie aggregates of the processed ratings, returning their event timestamp range."""
+    df = load_data(cfg.data.ratings_processed, dtypes=RATINGS_DTYPES)
+    reference_ts = int(df[ccfg.timestamp].max())
+    paths = feature_paths(cfg)
+    frames = {
+        USER_VIEW: aggregate_features(df, ccfg.user_id, reference_ts, last_n=cfg.feature_store.last_n),
+        MOVIE_VIEW: aggregate_features(df, ccfg.movie_id, reference_ts),
+    }
+    for name, features in frames.items():
+        features.to_parquet(paths[name], index=False)
+        log.info(f"Wrote {len(features)} rows of {name} to {paths[name]}")
+    timestamps = pd.concat([features[EVENT_TIMESTAMP] for features in frames.values()])
+    return timestamps.min(), timestamps.max()
+
+
+@instrument("feature_store.materialize")
+def materialize(cfg: DictConfig) -> FeatureStore:
+    """
+    Compute the aggregates, register the feature views and load the latest values into the online store.
+
+    Skipped when features.cache is set and the processed ratings and parameters are unchanged since the last run.
+    """
+    store = feature_store(cfg)
+    cache = feature_store_cache(cfg)
+    if cfg.features.cache and cache.is_fresh():
+        log.info("Feature store is up to date, skipping materialization")
+        return store
+    cache.invalidate()
+    start, end = write_aggregates(cfg)
+    store.apply(feature_views(cfg))
+    store.materialize(start_date=start.to_pydatetime(), end_date=(end + pd.Timedelta(seconds=1)).to_pydatetime())
+    cache.commit()
+    log.info(f"Materialized {USER_VIEW} and {MOVIE_VIEW} up to {end}")
+    return store
+
+
+def online_features(store: FeatureStore, view: str, ids: list[int]) -> pd.DataFrame:
+    """Latest features of view for the given user or movie ids, read by key from the online store."""
+    key = ccfg.user_id if view == USER_VIEW else ccfg.movie_id
+    features = [f"{view}:{field.name}" for field in store.get_feature_view(view).features]
+    rows = [{key: int(i)} for i in ids]
+    return store.get_online_features(features=features, entity_rows=rows).to_df()
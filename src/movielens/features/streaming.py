@@ -0,0 +1,138 @@
+import logging
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+import pandera as pa
+from omegaconf import DictConfig
+from prefect import flow, task
+from prefect.cache_policies import NO_CACHE
+
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig, ratings_schema
+from movielens.training.splits import split_indices, split_params
+from movielens.utils.cache import fingerprint_cache_key
+from movielens.utils.dataset import (
+    count_by_chunks,
+    iter_data,
+    remove_nulls,
+    to_columnar,
+    valid_by_count,
+    write_data_chunks,
+)
+from movielens.utils.instrument import instrument
+from movielens.utils.validation import validate_frame
+
+from .interactions import InteractionMatrix
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+
+def clean_chunks(path: str, chunk_size: int, n_rows: int | None = None) -> Iterator[pd.DataFrame]:
+    """Stream the ratings at path with nulls removed, stopping after n_rows rows."""
+    subset = [ccfg.movie_id, ccfg.rating, ccfg.timestamp, ccfg.user_id]
+    for chunk in iter_data(path, chunk_size, n=n_rows, dtypes=RATINGS_DTYPES):
+        yield remove_nulls(chunk, subset=subset, dtypes=RATINGS_DTYPES)
+
+
+@task(cache_key_fn=fingerprint_cache_key, persist_result=True)
+@instrument("features.count")
+def count_valid_movies(path: str, chunk_size: int, n_rows: int | None, min_count: int | None) -> pd.Index:
+    """First pass: the movies rated at least min_count times. Cached on the file contents and the arguments."""
+    counts = count_by_chunks(clean_chunks(path, chunk_size, n_rows), ccfg.movie_id)
+    valid_movies = valid_by_count(counts, min_count=min_count)
+    log.info(f"df size: {counts.sum()}, movies kept: {len(valid_movies)} of {len(counts)}")
+    return valid_movies
+
+
+class StreamingFeature:
+    """
+    Chunked version of the load, clean, validate and write feature steps for ratings larger than memory.
+
+    The first pass counts movie frequencies, the second pass filters each chunk against them and appends it to the
+    processed file, so only one chunk is held in memory at a time.
+    """
+
+    def __init__(self, cfg: DictConfig, ccfg: DataColumnsConfig) -> None:
+        self.cfg = cfg
+        self.ccfg = ccfg
+        self.path = cfg.data.ratings_raw
+
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        """Stream the raw ratings with nulls removed, stopping after exp.n_rows rows."""
+        return clean_chunks(self.path, self.cfg.features.chunk_size, self.cfg.exp.n_rows)
+
+    def filtered(self, valid_movies: pd.Index) -> Iterator[pd.DataFrame]:
+        """Stream the cleaned and validated chunks that keep only valid movies."""
+        for chunk in self.chunks():
+            kept = chunk[chunk[self.ccfg.movie_id].isin(valid_movies)].reset_index(drop=True)
+            yield self.validate(kept)
+
+    def validate(self, df: pd.DataFrame) -> pd.DataFrame:
+        try:
+            # Each chunk is validated on its own, so in fast mode every chunk also gets a full-detail sample
+            df = validate_frame(
+                df,
+                ratings_schema,
+                self.cfg.features.validation,
+                sample_size=self.cfg.features.validation_sample,
+                seed=self.cfg.exp.seed,
+            )
+        except pa.errors.SchemaError:
+            msg = "Schema fail."
+            log.exception(msg)
+            raise
+        return df
+
+    def count(self) -> pd.Index:
+        return count_valid_movies(
+            str(self.path), self.cfg.features.chunk_size, self.cfg.exp.n_rows, self.cfg.exp.min_movie_rating_count
+        )
+
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.write")
+    def write(self, valid_movies: pd.Index) -> int:
+        return write_data_chunks(self.filtered(valid_movies), self.cfg.data.ratings_processed)
+
+    @task(cache_policy=NO_CACHE)
+    @instrument("features.write_interactions")
+    def write_interactions(self) -> None:
+        """
+        Save the matrix of the train rows of the training.split only, so trainers can load it without leakage.
+
+        The split is computed on the user and timestamp columns alone, and the sparse matrix is then built from the
+        compact processed columns rather than the raw chunks, a chunk at a time.
+        """
+        path, chunk_size = self.cfg.data.ratings_processed, self.cfg.features.chunk_size
+        keys = pd.concat(
+            [chunk[[ccfg.user_id, ccfg.timestamp]] for chunk in iter_data(path, chunk_size, dtypes=RATINGS_DTYPES)],
+            ignore_index=True,
+        )
+        train_idx, _ = split_indices(keys, self.cfg)
+        train = np.zeros(len(keys), dtype=bool)
+        train[train_idx] = True
+
+        def train_chunks() -> Iterator[pd.DataFrame]:
+            start = 0
+            for chunk in iter_data(path, chunk_size, dtypes=RATINGS_DTYPES):
+                yield chunk[train[start : start + len(chunk)]]
+                start += len(chunk)
+
+        matrix = InteractionMatrix.from_chunks(
+            train_chunks, block_size=chunk_size, meta=split_params(self.cfg, len(keys))
+        )
+        matrix.save(self.cfg.data.interactions)
+
+    @flow()
+    @instrument("features.run")
+    def run(self) -> None:
+        self.path = to_columnar(
+            self.cfg.data.ratings_raw,
+            fmt=self.cfg.data.format,
+            dtypes=RATINGS_DTYPES,
+            chunksize=self.cfg.features.chunk_size,
+        )
+        valid_movies = self.count()
+        rows = self.write(valid_movies)
+        log.info(f"df size: {rows}")
+        self.write_interactions()
@@ -0,0 +1,46 @@
+import logging
+
+import pandas as pd
+import pandera as pa
+from omegaconf import DictConfig
+from prefect import task
+from prefect.cache_policies import NO_CACHE
+from prefect.futures import wait
+
+from movielens.conf.schema import ratings_schema
+from movielens.utils.validation import validate_frame
+
+log = logging.getLogger(__name__)
+
+
+# Tasks receiving frames opt out of input hashing, which would pickle the whole frame on every call
+@task(cache_policy=NO_CACHE)
+def validate_column(df: pd.DataFrame, column: str) -> None:
+    ratings_schema.columns[column].validate(df)
+
+
+def validate_ratings(df: pd.DataFrame, cfg: DictConfig) -> pd.DataFrame:
+    """
+    Validate df against the ratings schema in the features.validation mode.
+
+    Full validation runs one concurrent pandera task per column and must run inside a flow.
+    """
+    try:
+        if cfg.features.validation == "full":
+            futures = [validate_column.submit(df, column) for column in ratings_schema.columns]
+            wait(futures)
+            for future in futures:
+                future.result()
+        else:
+            validate_frame(
+                df,
+                ratings_schema,
+                cfg.features.validation,
+                sample_size=cfg.features.validation_sample,
+                seed=cfg.exp.seed,
+            )
+    except pa.errors.SchemaError:
+        msg = "Schema fail."
+        log.exception(msg)
+        raise
+    return df
@@ -0,0 +1,165 @@
+import logging
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from omegaconf import DictConfig
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.features.interactions import InteractionMatrix
+
+from .ann import IVFIndex
+from .base import BaseRecommender
+from .ranking import recommend_top_n
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+
+def solve_block(
+    matrix: sp.csr_matrix | sp.csc_matrix, data: np.ndarray, other: np.ndarray, reg: float, rows: range
+) -> np.ndarray:
+    """
+    Solve the regularised least squares problem for a range of rows of a compressed sparse matrix.
+
+    For each row the normal equations (V^T V + reg * n I) x = V^T r are built from the factors of the n columns it
+    rated, then the whole block is solved in one batched call. data holds the targets aligned with matrix.indices.
+    """
+    k = other.shape[1]
+    reg_eye = reg * np.eye(k, dtype=other.dtype)
+    a = np.empty((len(rows), k, k), dtype=other.dtype)
+    b = np.empty((len(rows), k), dtype=other.dtype)
+    for i, row in enumerate(rows):
+        lo, hi = matrix.indptr[row], matrix.indptr[row + 1]
+        factors = other[matrix.indices[lo:hi]]
+        a[i] = factors.T @ factors + max(hi - lo, 1) * reg_eye
+        b[i] = factors.T @ data[lo:hi]
+    return np.linalg.solve(a, b[..., None])[..., 0]
+
+
+class ALSRecommender(BaseRecommender):
+    """
+    Matrix factorization of the mean-centred ratings trained with alternating least squares.
+
+    Each half-iteration solves every user (or movie) independently, so rows are split into blocks that are solved in
+    a thread pool; numpy releases the GIL inside the matrix products and the batched solve.
+    """
+
+    iterative = True
+    uses_interactions = True
+
+    def __init__(self, cfg: DictConfig) -> None:
+        """Init."""
+        self.cfg = cfg
+        params = cfg.exp.model.params
+        self.factors = params.get("factors", 64)
+        self.regularization = params.get("regularization", 0.05)
+        self.iterations = params.get("iterations", 10)
+        self.block_size = params.get("block_size", 2048)
+        self.n_threads = params.get("n_threads") or os.cpu_count()
+        self.seed = cfg.exp.seed
+        self.global_avg = None
+        self.interactions = None
+        self.user_factors = None
+        self.item_factors = None
+        self.index = None
+
+    def fit(
+        self,
+        df: pd.DataFrame,
+        callback: Callable[[int], None] | None = None,
+        interactions: InteractionMatrix | None = None,
+    ) -> None:
+        """
+        Fit, calling callback with the iteration index after each iteration, e.g. to evaluate or stop early.
+
+        interactions, the matrix of df's ratings, is built from df unless given, e.g. memory-mapped from the feature
+        stage.
+        """
+        # Imported here so that loading a saved model for serving does not import mlflow
+        import mlflow  # noqa: PLC0415
+
+        self.interactions = interactions if interactions is not None else InteractionMatrix.from_frame(df)
+        self.global_avg = float(self.interactions.csr.data.mean())
+        csr = self.interactions.csr
+        csc = self.interactions.csc
+        centred_rows = (csr.data - self.global_avg).astype(np.float32)
+        centred_cols = (csc.data - self.global_avg).astype(np.float32)
+
+        rng = np.random.default_rng(self.seed)
+        n_users, n_movies = self.interactions.shape
+        self.user_factors = np.zeros((n_users, self.factors), dtype=np.float32)
+        self.item_factors = (rng.standard_normal((n_movies, self.factors)) * 0.01).astype(np.float32)
+
+        log.info(f"Fitting ALS: {n_users} users, {n_movies} movies, {self.factors} factors, {self.n_threads} threads")
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            for iteration in range(self.iterations):
+                start = time.perf_counter()
+                self._solve(pool, csr, centred_rows, self.item_factors, self.user_factors)
+                self._solve(pool, csc, centred_cols, self.user_factors, self.item_factors)
+                elapsed = time.perf_counter() - start
+                log.info(f"ALS iteration {iteration + 1}/{self.iterations} took {elapsed:.2f}s")
+                if mlflow.active_run():
+                    mlflow.log_metric("als_iteration_seconds", elapsed, step=iteration)
+                if callback is not None:
+                    callback(iteration)
+
+    def _solve(
+        self,
+        pool: ThreadPoolExecutor,
+        matrix: sp.csr_matrix | sp.csc_matrix,
+        data: np.ndarray,
+        other: np.ndarray,
+        out: np.ndarray,
+    ) -> None:
+        """Solve every row of out given the fixed other factors, one block per pool task."""
+
+        def run(start: int) -> None:
+            stop = min(start + self.block_size, len(out))
+            out[start:stop] = solve_block(matrix, data, other, self.regularization, range(start, stop))
+
+        list(pool.map(run, range(0, len(out), self.block_size)))
+
+    def predict(self, user_id: list[int], item_id: list[int]) -> np.ndarray:
+        """Predict."""
+        users = self.interactions.encode_users(user_id)
+        movies = self.interactions.encode_movies(item_id)
+        known = (users >= 0) & (movies >= 0)
+        preds = np.full(len(users), self.global_avg, dtype=np.float32)
+        preds[known] += np.einsum("ij,ij->i", self.user_factors[users[known]], self.item_factors[movies[known]])
+        return preds
+
+    def set_index(self, index: IVFIndex | None) -> None:
+        """Serve single-user recommendations from an approximate index over the item factors, or exactly if None."""
+        self.index = index
+
+    def recommend(self, user_id: int, n: int = 10) -> list:
+        """Recommend top N unseen movies."""
+        user = self.interactions.encode_users([user_id])[0]
+        if self.index is None or user < 0:
+            recs = self.recommend_batch([user_id], n)[0]
+            return recs[recs >= 0].tolist()
+        top = self.index.search(self.user_factors[user], n, seen=self.interactions.csr, rows=[user])[0]
+        return self.interactions.movie_ids[top[top >= 0]].tolist()
+
+    def recommend_batch(self, user_ids: list[int], n: int = 10, block_size: int = 1024) -> np.ndarray:
+        """
+        Recommend top N unseen movies for many users at once, as a (users, n) array padded with -1.
+
+        Users are scored against every movie with one matrix product per block; users unknown to the model get
+        the most rated movies.
+        """
+        users = self.interactions.encode_users(user_ids)
+        top = recommend_top_n(
+            lambda rows: self.user_factors[rows] @ self.item_factors.T,
+            users,
+            n,
+            seen=self.interactions.csr,
+            fallback=np.diff(self.interactions.csc.indptr).astype(np.float32),
+            block_size=block_size,
+        )
+        return np.where(top >= 0, self.interactions.movie_ids[top], -1)
@@ -0,0 +1,136 @@
+import logging
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from .ranking import top_n
+
+log = logging.getLogger(__name__)
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 42) -> np.ndarray:
+    """Plain Lloyd's k-means in numpy, returning the (k, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest_centroid(vectors, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.column_stack([np.bincount(assign, weights=col, minlength=k) for col in vectors.T])
+        filled = counts > 0
+        centroids[filled] = (sums[filled] / counts[filled, None]).astype(centroids.dtype)
+    return centroids
+
+
+def nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (L2) for each vector."""
+    dists = (centroids**2).sum(axis=1) - 2 * vectors @ centroids.T
+    return dists.argmin(axis=1)
+
+
+class IVFIndex:
+    """
+    Inverted-file index for maximum inner product search over item vectors.
+
+    Items are partitioned with k-means. A query scores the centroids, then scores exactly only the items in its
+    n_probe best partitions. n_probe is the recall-vs-latency knob: n_probe == n_lists is an exact search.
+    """
+
+    def __init__(self, n_lists: int | None = None, n_probe: int = 8, iterations: int = 10, seed: int = 42) -> None:
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_items = None
+        self.list_vectors = None
+
+    def build(self, vectors: np.ndarray) -> "IVFIndex":
+        """Partition the item vectors; row i of vectors is item index i."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.n_lists = min(self.n_lists or int(np.sqrt(len(vectors))) or 1, len(vectors))
+        # Train on a sample, as is usual for IVF, then assign every item
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), 256 * self.n_lists), replace=False)]
+        self.centroids = kmeans(sample, self.n_lists, iterations=self.iterations, seed=self.seed)
+        assign = nearest_centroid(vectors, self.centroids)
+
+        self.list_items = np.argsort(assign, kind="stable").astype(np.int32)
+        self.list_vectors = vectors[self.list_items]
+        self.list_offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=self.n_lists), out=self.list_offsets[1:])
+        log.info(f"Built IVF index: {len(vectors)} items in {self.n_lists} lists, n_probe={self.n_probe}")
+        return self
+
+    def search(
+        self, queries: np.ndarray, n: int = 10, seen: sp.csr_matrix | None = None, rows: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Return the approximate top-n item indices per query, best first, padded with -1.
+
+        If seen and rows are given, items seen[rows[i]] are excluded from the results of query i.
+        """
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+        probes = top_n(queries @ self.centroids.T, min(self.n_probe, self.n_lists))
+        recs = np.full((len(queries), n), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            spans = [np.arange(self.list_offsets[p], self.list_offsets[p + 1]) for p in probes[i]]
+            positions = np.concatenate(spans)
+            if len(positions) == 0:
+                continue
+            scores = self.list_vectors[positions] @ query
+            items = self.list_items[positions]
+            if seen is not None:
+                row = rows[i]
+                scores[np.isin(items, seen.indices[seen.indptr[row] : seen.indptr[row + 1]])] = -np.inf
+            top = top_n(scores[None, :], n)[0]
+            recs[i, : len(top)] = np.where(top >= 0, items[top], -1)
+        return recs
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_items=self.list_items,
+            list_vectors=self.list_vectors,
+            params=np.array([self.n_lists, self.n_probe, self.iterations, self.seed]),
+        )
+        log.info(f"IVF index saved to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            n_lists, n_probe, iterations, seed = data["params"].tolist()
+            index = cls(n_lists=n_lists, n_probe=n_probe, iterations=iterations, seed=seed)
+            index.centroids = data["centroids"]
+            index.list_offsets = data["list_offsets"]
+            index.list_items = data["list_items"]
+            index.list_vectors = data["list_vectors"]
+        return index
+
+
+def benchmark_index(
+    index: IVFIndex, item_vectors: np.ndarray, queries: np.ndarray, n: int = 10, probes: list[int] | None = None
+) -> dict:
+    """
+    Compare the index to exact brute-force scoring on the same queries, one query at a time as in serving.
+
+    Returns exact latency and, for each n_probe setting, recall@n against the exact top-n and mean latency.
+    """
+    start = time.perf_counter()
+    exact = np.vstack([top_n((item_vectors @ query)[None, :], n) for query in queries])
+    results = {"exact_ms": 1000 * (time.perf_counter() - start) / len(queries), "probes": {}}
+
+    original = index.n_probe
+    for n_probe in probes or [index.n_probe]:
+        index.n_probe = n_probe
+        start = time.perf_counter()
+        approx = np.vstack([index.search(query, n) for query in queries])
+        elapsed_ms = 1000 * (time.perf_counter() - start) / len(queries)
+        hits = sum(len(np.intersect1d(a[a >= 0], e)) for a, e in zip(approx, exact, strict=True))
+        results["probes"][n_probe] = {"recall": hits / exact.size, "ms": elapsed_ms}
+        log.info(f"n_probe={n_probe}: recall@{n}={hits / exact.size:.3f}, {elapsed_ms:.2f}ms per query")
+    index.n_probe = original
+    return results
@@ -1,11 +1,19 @@
 from abc import ABC, abstractmethod
 
+import numpy as np
 import pandas as pd
 
 
 class BaseRecommender(ABC):
     """Base class for interface of recommender models."""
 
+    # Iterative models accept fit(df, callback=...), calling callback(iteration) after every iteration
+    iterative = False
+    # Incremental models learn from one chunk of ratings at a time: prepare(chunks) once, then partial_fit(df) per chunk
+    incremental = False
+    # Models built on the interaction matrix accept fit(df, interactions=...), a prebuilt matrix of df's ratings
+    uses_interactions = False
+
     @abstractmethod
     def fit(self, df: pd.DataFrame) -> None:
         """Train the model on the provided data."""
@@ -20,3 +28,11 @@ class BaseRecommender(ABC):
     def recommend(self, user_id: int, n: int = 10) -> list:
         """Return top-n recommendations for a given user."""
         raise NotImplementedError
+
+    def recommend_batch(self, user_ids: list[int], n: int = 10) -> np.ndarray:
+        """Return top-n recommendations for many users as a (users, n) array of movie ids padded with -1."""
+        recs = np.full((len(user_ids), n), -1, dtype=np.int64)
+        for i, user_id in enumerate(user_ids):
+            items = self.recommend(user_id, n)[:n]
+            recs[i, : len(items)] = items
+        return recs
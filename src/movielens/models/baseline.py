@@ -1,38 +1,105 @@
 import logging
 
-import mlflow
+import numpy as np
 import pandas as pd
 from omegaconf import DictConfig
-from sklearn import linear_model
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.features.interactions import InteractionMatrix, encode_ids
 
 from .base import BaseRecommender
+from .ranking import recommend_top_n
 
 log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
 
 
 class BaselineRecommender(BaseRecommender):
-    """A simple recommender that always predicts the global average rating."""
+    """
+    Predicts the global average rating plus regularised user and movie biases.
+
+    Everything is precomputed at fit time, so predict is an array gather and recommend is a slice of the movies
+    ranked by their regularised mean rating, skipping those the user already rated.
+    """
+
+    uses_interactions = True
 
     def __init__(self, cfg: DictConfig) -> None:
         """Init."""
-        self.global_avg = None
-        self.ratings_df = None
         self.cfg = cfg
-        self.model = linear_model
+        self.reg_user = cfg.exp.model.params.get("reg_user", 10.0)
+        self.reg_movie = cfg.exp.model.params.get("reg_movie", 25.0)
+        self.global_avg = None
+        self.interactions = None
+        self.user_ids = np.empty(0, dtype=np.int32)
+        self.movie_ids = np.empty(0, dtype=np.int32)
+        self.user_bias = np.empty(0, dtype=np.float32)
+        self.movie_bias = np.empty(0, dtype=np.float32)
+        self.ranked_movies = np.empty(0, dtype=np.int32)
+        self.rank_scores = np.empty(0, dtype=np.float32)
 
-    def fit(self, df: pd.DataFrame) -> None:
-        """Fit."""
-        self.ratings_df = df
-        self.global_avg = df["rating"].mean()
-        mlflow.sklearn.log_model(self.model, self.cfg.exp.model.name)
+    def fit(self, df: pd.DataFrame, interactions: InteractionMatrix | None = None) -> None:
+        """Fit, on the interactions of df when given, e.g. memory-mapped from the feature stage."""
+        self.interactions = interactions if interactions is not None else InteractionMatrix.from_frame(df)
+        self.user_ids = self.interactions.user_ids
+        self.movie_ids = self.interactions.movie_ids
+        csr = self.interactions.csr
+        users = np.repeat(np.arange(csr.shape[0]), np.diff(csr.indptr))
+        movies = csr.indices
+        ratings = csr.data.astype(np.float64)
 
-    def predict(self, user_id: list[int], item_id: list[int]) -> list[float]:
+        self.global_avg = ratings.mean()
+        residual = ratings - self.global_avg
+        movie_counts = np.bincount(movies, minlength=len(self.movie_ids))
+        movie_bias = np.bincount(movies, weights=residual, minlength=len(self.movie_ids)) / (
+            movie_counts + self.reg_movie
+        )
+        residual -= movie_bias[movies]
+        user_counts = np.bincount(users, minlength=len(self.user_ids))
+        user_bias = np.bincount(users, weights=residual, minlength=len(self.user_ids)) / (user_counts + self.reg_user)
+
+        self.movie_bias = movie_bias.astype(np.float32)
+        self.user_bias = user_bias.astype(np.float32)
+        ranking = np.argsort(-self.movie_bias, kind="stable")
+        self.ranked_movies = self.movie_ids[ranking]
+        # Score each movie by its position in the ranking so batched recommendations break ties the same way
+        self.rank_scores = np.empty(len(ranking), dtype=np.float32)
+        self.rank_scores[ranking] = np.arange(len(ranking), 0, -1)
+        log.info(f"Fitted biases for {len(self.user_ids)} users and {len(self.movie_ids)} movies")
+
+    def predict(self, user_id: list[int], item_id: list[int]) -> np.ndarray:
         """Predict."""
-        log.debug(f"{user_id}, {item_id}")
-        return [self.global_avg] * len(user_id)
+        return (
+            self.global_avg
+            + self._gather(self.user_bias, self.user_ids, user_id)
+            + self._gather(self.movie_bias, self.movie_ids, item_id)
+        )
 
     def recommend(self, user_id: int, n: int = 10) -> list:
         """Recommend top N."""
-        log.debug(f"{user_id}")
-        top_items = self.ratings_df.groupby("item_id")["rating"].mean().sort_values(ascending=False).head(n)
-        return list(top_items.index)
+        user = self.interactions.encode_users([user_id])[0]
+        if user < 0:
+            return self.ranked_movies[:n].tolist()
+        csr = self.interactions.csr
+        seen = self.movie_ids[csr.indices[csr.indptr[user] : csr.indptr[user + 1]]]
+        candidates = self.ranked_movies[: n + len(seen)]
+        return candidates[~np.isin(candidates, seen)][:n].tolist()
+
+    def recommend_batch(self, user_ids: list[int], n: int = 10, block_size: int = 256) -> np.ndarray:
+        """Recommend top N unseen movies for many users at once, as a (users, n) array padded with -1."""
+        users = self.interactions.encode_users(user_ids)
+        top = recommend_top_n(
+            lambda rows: np.tile(self.rank_scores, (len(rows), 1)),
+            users,
+            n,
+            seen=self.interactions.csr,
+            fallback=self.rank_scores,
+            block_size=block_size,
+        )
+        return np.where(top >= 0, self.movie_ids[top], -1)
+
+    @staticmethod
+    def _gather(bias: np.ndarray, index: np.ndarray, ids: list[int]) -> np.ndarray:
+        """Look up the bias for each raw id, 0 for ids not seen at fit time."""
+        idx = encode_ids(index, ids)
+        return np.where(idx >= 0, bias[idx], 0.0)
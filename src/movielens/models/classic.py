@@ -1,21 +1,83 @@
 import logging
 
 import numpy as np
+import pandas as pd
 from sklearn import linear_model
 
+from movielens.conf.schema import DataColumnsConfig
+from movielens.features.aggregates import USER_FEATURES, RatingAggregates, table_index
+from movielens.features.interactions import InteractionMatrix
+
+from .ranking import recommend_top_n
+
 log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
 
 
 class SKLearnRegression:
+    """
+    Linear regression on the rating aggregate features of each (user, movie) pair rather than on the raw ids.
+    """
+
     def __init__(self) -> None:
         self.model = linear_model.LinearRegression()
+        self.interactions = None
+        self.aggregates = None
+
+
+    def fit(
+        self,
+        x: pd.DataFrame,
+        y: np.ndarray,
+        aggregates: RatingAggregates | None = None,
+        features: np.ndarray | None = None,
+        interactions: InteractionMatrix | None = None,
+    ) -> None:
+        """
+        Fit on the features of x's pairs.
 
+        aggregates default to statistics fitted on x and y, features, the rows of x precomputed by the feature
+        stage, to the aggregates applied to x and interactions, the matrix of x's ratings, to one built from x.
+        """
+        # x may already hold the ratings, as the trainer's train rows do
+        ratings = x if ccfg.rating in x else x.assign(**{ccfg.rating: np.asarray(y)})
+        self.aggregates = aggregates or RatingAggregates.fit(ratings)
+        self.model.fit(self.aggregates.transform(x) if features is None else features, y)
+        coefs = self.model.coef_.astype(np.float64).round(4).tolist()
+        log.info(f"Coefficients: {dict(zip(self.aggregates.feature_names, coefs, strict=True))}")
+        self.interactions = interactions if interactions is not None else InteractionMatrix.from_frame(ratings)
 
-    def fit(self, x: np.ndarray, y: np.ndarray) -> None:
-        self.model.fit(x, y)
+    def predict(self, user_id: list[int], item_id: list[int]) -> np.ndarray:
+        """Predict the ratings of (user, movie) pairs, timed at each user's last training rating."""
+        return self.predict_frame(pd.DataFrame({ccfg.user_id: user_id, ccfg.movie_id: item_id}))
 
-    def predict(self, x: np.ndarray) -> list:
-        return self.model.predict(x)
+    def predict_frame(self, x: pd.DataFrame) -> np.ndarray:
+        """Predict the ratings of the pairs in x, using its timestamp column when present."""
+        return self.model.predict(self.aggregates.transform(x))
 
     def recommend(self, user_id: id, n: int = 10) -> list:
-        return [user_id] * n
+        recs = self.recommend_batch([user_id], n)[0]
+        return recs[recs >= 0].tolist()
+
+    def recommend_batch(self, user_ids: list[int], n: int = 10, block_size: int = 256) -> np.ndarray:
+        """
+        The n best unseen movies of each user, padded with -1.
+
+        The features add up a user part and a movie part, so the movie part of the score is computed once for every
+        movie and each user's scores are it plus the user part, rather than a regression over a user x movie grid.
+        """
+        movie_ids = self.interactions.movie_ids
+        user_columns = slice(None, len(USER_FEATURES) + 1)
+        movie_columns = slice(len(USER_FEATURES) + 1, None)
+        movie_stats = self.aggregates.movie_stats[table_index(movie_ids, len(self.aggregates.movie_stats))]
+        movie_scores = movie_stats @ self.model.coef_[movie_columns] + self.model.intercept_
+
+        def score(rows: np.ndarray) -> np.ndarray:
+            # Pairs with an unknown movie hold the user part of the features and the default movie part
+            users = pd.DataFrame({ccfg.user_id: self.interactions.user_ids[rows], ccfg.movie_id: -1})
+            user_scores = self.aggregates.transform(users)[:, user_columns] @ self.model.coef_[user_columns]
+            return user_scores[:, None] + movie_scores
+
+        users = self.interactions.encode_users(user_ids)
+        top = recommend_top_n(score, users, n, seen=self.interactions.csr, block_size=block_size)
+        return np.where(top >= 0, movie_ids[top], -1)
@@ -1,10 +1,24 @@
-from omegaconf import DictConfig
+from __future__ import annotations
 
-from .base import BaseRecommender
-from .baseline import BaselineRecommender
-from .classic import SKLearnRegression
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING
 
+import joblib
+from omegaconf import DictConfig, OmegaConf, open_dict
 
+if TYPE_CHECKING:
+    from .als import ALSRecommender
+    from .base import BaseRecommender
+    from .baseline import BaselineRecommender
+    from .classic import SKLearnRegression
+    from .knn import ItemKNNRecommender
+    from .streaming import SGDRecommender, StreamingBiasRecommender
+
+log = logging.getLogger(__name__)
+
+
+# Each factory imports its model when creating it, so only the model in use pays for its dependencies
 class BaseFactory:
     def create(self) -> BaseRecommender:
         raise NotImplementedError
@@ -15,6 +29,8 @@ class BaselineRecommenderFactory(BaseFactory):
         pass
 
     def create(self, cfg: DictConfig) -> BaselineRecommender:
+        from .baseline import BaselineRecommender  # noqa: PLC0415
+
         return BaselineRecommender(cfg)
 
 
@@ -23,10 +39,59 @@ class SKLearnRegressionFactory(BaseFactory):
         pass
 
     def create(self) -> SKLearnRegression:
+        from .classic import SKLearnRegression  # noqa: PLC0415
+
         return SKLearnRegression()
 
 
-FACTORY_REGISTRY = {"baseline": BaselineRecommenderFactory, "sklearnregression": SKLearnRegressionFactory}
+class ALSRecommenderFactory(BaseFactory):
+    def __init__(self) -> None:
+        pass
+
+    def create(self, cfg: DictConfig) -> ALSRecommender:
+        from .als import ALSRecommender  # noqa: PLC0415
+
+        return ALSRecommender(cfg)
+
+
+class ItemKNNRecommenderFactory(BaseFactory):
+    def __init__(self) -> None:
+        pass
+
+    def create(self, cfg: DictConfig) -> ItemKNNRecommender:
+        from .knn import ItemKNNRecommender  # noqa: PLC0415
+
+        return ItemKNNRecommender(cfg)
+
+
+class StreamingBiasRecommenderFactory(BaseFactory):
+    def __init__(self) -> None:
+        pass
+
+    def create(self, cfg: DictConfig) -> StreamingBiasRecommender:
+        from .streaming import StreamingBiasRecommender  # noqa: PLC0415
+
+        return StreamingBiasRecommender(cfg)
+
+
+class SGDRecommenderFactory(BaseFactory):
+    def __init__(self) -> None:
+        pass
+
+    def create(self, cfg: DictConfig) -> SGDRecommender:
+        from .streaming import SGDRecommender  # noqa: PLC0415
+
+        return SGDRecommender(cfg)
+
+
+FACTORY_REGISTRY = {
+    "baseline": BaselineRecommenderFactory,
+    "sklearnregression": SKLearnRegressionFactory,
+    "als": ALSRecommenderFactory,
+    "itemknn": ItemKNNRecommenderFactory,
+    "streamingbias": StreamingBiasRecommenderFactory,
+    "sgd": SGDRecommenderFactory,
+}
 
 
 def get_factory(factory_name: str) -> BaseFactory:
@@ -35,3 +100,24 @@ def get_factory(factory_name: str) -> BaseFactory:
         msg = f"Unknown model type '{factory_name}'."
         raise ValueError(msg)
     return factory_class()
+
+
+def model_cfg(cfg: DictConfig, name: str, params: dict) -> DictConfig:
+    """A copy of the run config with exp.model replaced by the named model and params."""
+    cfg = cfg.copy()
+    with open_dict(cfg):
+        cfg.exp.model = OmegaConf.create({"name": name, "params": params})
+    return cfg
+
+
+def save_model(model: BaseRecommender, path: str) -> None:
+    """Persist a fitted model with joblib, which stores its numpy arrays uncompressed so they can be mmapped."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model, path)
+    log.info(f"Model saved to {path}")
+
+
+def load_model(path: str, *, mmap: bool = True) -> BaseRecommender:
+    """Load a model saved with save_model, memory-mapping its arrays read-only by default."""
+    return joblib.load(path, mmap_mode="r" if mmap else None)
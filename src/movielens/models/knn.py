@@ -0,0 +1,201 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from omegaconf import DictConfig
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.features.interactions import InteractionMatrix
+from movielens.utils.shared import SharedArrays, SharedArraySpec
+
+from .base import BaseRecommender
+from .ranking import recommend_top_n, top_n
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+SIMILARITIES = ("cosine", "adjusted_cosine")
+
+# Item vectors of a worker process, mapped from shared memory once by the pool initializer
+_worker: dict = {}
+
+
+def item_vectors(csr: sp.csr_matrix, csc: sp.csc_matrix, centre: np.ndarray | None) -> tuple:
+    """
+    Unit-length item rating vectors as (users x items CSR, items x users CSR) sharing the same values.
+
+    With centre, each rating has its user's value subtracted first, which makes the dot products adjusted cosine.
+    """
+    csr_data = csr.data.astype(np.float32)
+    csc_data = csc.data.astype(np.float32)
+    if centre is not None:
+        csr_data -= np.repeat(centre, np.diff(csr.indptr))
+        csc_data -= centre[csc.indices]
+    norms = np.sqrt(np.bincount(csr.indices, weights=csr_data.astype(np.float64) ** 2, minlength=csr.shape[1]))
+    norms = np.where(norms > 0, norms, 1).astype(np.float32)
+    csr_data /= norms[csr.indices]
+    csc_data /= np.repeat(norms, np.diff(csc.indptr))
+    users = sp.csr_matrix((csr_data, csr.indices, csr.indptr), shape=csr.shape)
+    items = sp.csr_matrix((csc_data, csc.indices, csc.indptr), shape=csr.shape[::-1])
+    return users, items
+
+
+def neighbours_block(users: sp.csr_matrix, items: sp.csr_matrix, start: int, stop: int, k: int) -> tuple:
+    """
+    Top-k positive similarities of items [start, stop) to every other item, as (block, k) index and value arrays.
+
+    Only this block's rows of the similarity matrix are ever dense; indices of unfilled slots are -1.
+    """
+    scores = (items[start:stop] @ users).toarray()
+    scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+    scores[scores <= 0] = -np.inf
+    top = top_n(scores, k)
+    values = np.take_along_axis(scores, np.maximum(top, 0), axis=1)
+    return top, np.where(top >= 0, values, 0).astype(np.float32)
+
+
+def _init_worker(specs: dict[str, SharedArraySpec], shape: tuple[int, int]) -> None:
+    arrays, segments = {}, []
+    for key, spec in specs.items():
+        shm, arrays[key] = spec.attach()
+        segments.append(shm)
+    # The segments stay open for the life of the worker
+    _worker["segments"] = segments
+    _worker["users"] = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=shape)
+    _worker["items"] = sp.csr_matrix((arrays["t_data"], arrays["t_indices"], arrays["t_indptr"]), shape=shape[::-1])
+
+
+def _worker_block(start: int, stop: int, k: int) -> tuple:
+    return neighbours_block(_worker["users"], _worker["items"], start, stop, k)
+
+
+class ItemKNNRecommender(BaseRecommender):
+    """
+    Item-based neighbourhood model over the k most similar items of each movie.
+
+    Similarities are cosine or adjusted cosine (centred by user mean) between the movies' rating vectors. They are
+    computed a block of movies at a time, across processes, and only the top-k per movie are kept, so the full
+    movies x movies matrix is never held. A rating is predicted as the user's mean plus the similarity-weighted
+    mean of their centred ratings of the neighbours; recommendations score every movie by its similarity to the
+    user's centred ratings. Both are sparse matrix products.
+    """
+
+    uses_interactions = True
+
+    def __init__(self, cfg: DictConfig) -> None:
+        """Init."""
+        self.cfg = cfg
+        params = cfg.exp.model.params
+        self.k = params.get("k", 50)
+        self.similarity = params.get("similarity", "adjusted_cosine")
+        if self.similarity not in SIMILARITIES:
+            msg = f"Unknown similarity '{self.similarity}'."
+            raise ValueError(msg)
+        self.block_size = params.get("block_size", 256)
+        self.n_jobs = params.get("n_jobs") or os.cpu_count()
+        self.global_avg = None
+        self.interactions = None
+        self.user_mean = None
+        self.centred = None
+        self.neighbours = None
+        self.neighbours_t = None
+
+    def fit(self, df: pd.DataFrame, interactions: InteractionMatrix | None = None) -> None:
+        """Fit, on the interactions of df when given, e.g. memory-mapped from the feature stage."""
+        self.interactions = interactions if interactions is not None else InteractionMatrix.from_frame(df)
+        csr, csc = self.interactions.csr, self.interactions.csc
+        self.global_avg = float(csr.data.mean())
+        counts = np.diff(csr.indptr)
+        rows = np.repeat(np.arange(csr.shape[0]), counts)
+        self.user_mean = (np.bincount(rows, weights=csr.data, minlength=csr.shape[0]) / counts).astype(np.float32)
+        centred = csr.data.astype(np.float32) - self.user_mean[rows]
+        self.centred = sp.csr_matrix((centred, csr.indices, csr.indptr), shape=csr.shape)
+
+        users, items = item_vectors(csr, csc, self.user_mean if self.similarity == "adjusted_cosine" else None)
+        top, values = self._neighbours(users, items)
+        keep = top >= 0
+        indptr = np.zeros(len(top) + 1, dtype=np.int64)
+        np.cumsum(keep.sum(axis=1), out=indptr[1:])
+        self.neighbours = sp.csr_matrix((values[keep], top[keep], indptr), shape=(len(top), len(top)))
+        # Recommendation scores need the transpose, so it is converted once here
+        self.neighbours_t = self.neighbours.T.tocsr()
+        log.info(f"Kept {self.neighbours.nnz} neighbours for {len(top)} movies ({self.similarity}, k={self.k})")
+
+    def _neighbours(self, users: sp.csr_matrix, items: sp.csr_matrix) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k neighbour indices and similarities of every movie, one block of movies per task."""
+        n_items = items.shape[0]
+        k = min(self.k, max(n_items - 1, 1))
+        blocks = [(start, min(start + self.block_size, n_items)) for start in range(0, n_items, self.block_size)]
+        log.info(f"Computing {self.similarity} similarities of {n_items} movies in {len(blocks)} blocks")
+        if self.n_jobs == 1 or len(blocks) == 1:
+            results = [neighbours_block(users, items, start, stop, k) for start, stop in blocks]
+        else:
+            arrays = {
+                "data": users.data,
+                "indices": users.indices,
+                "indptr": users.indptr,
+                "t_data": items.data,
+                "t_indices": items.indices,
+                "t_indptr": items.indptr,
+            }
+            # Workers map the item vectors from shared memory instead of receiving a pickled copy per block
+            with (
+                SharedArrays(arrays) as shared,
+                ProcessPoolExecutor(
+                    max_workers=min(self.n_jobs, len(blocks)),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(shared.specs, users.shape),
+                ) as pool,
+            ):
+                starts, stops = zip(*blocks, strict=True)
+                results = list(pool.map(_worker_block, starts, stops, repeat(k)))
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    def predict(self, user_id: list[int], item_id: list[int], chunk_size: int = 100_000) -> np.ndarray:
+        """Predict."""
+        users = self.interactions.encode_users(user_id)
+        movies = self.interactions.encode_movies(item_id)
+        known = (users >= 0) & (movies >= 0)
+        preds = np.full(len(users), self.global_avg, dtype=np.float32)
+        preds[users >= 0] = self.user_mean[users[users >= 0]]
+        known_idx = np.flatnonzero(known)
+        # Pairs are handled in chunks as each gathers a sparse row of the user's ratings and of the movie's neighbours
+        for start in range(0, len(known_idx), chunk_size):
+            idx = known_idx[start : start + chunk_size]
+            sims = self.neighbours[movies[idx]]
+            ratings = self.centred[users[idx]]
+            weighted = np.asarray(sims.multiply(ratings).sum(axis=1)).ravel()
+            ratings.data[:] = 1
+            weights = np.asarray(abs(sims).multiply(ratings).sum(axis=1)).ravel()
+            has = weights > 0
+            preds[idx[has]] += weighted[has] / weights[has]
+        return preds
+
+    def recommend(self, user_id: int, n: int = 10) -> list:
+        """Recommend top N unseen movies."""
+        recs = self.recommend_batch([user_id], n)[0]
+        return recs[recs >= 0].tolist()
+
+    def recommend_batch(self, user_ids: list[int], n: int = 10, block_size: int = 256) -> np.ndarray:
+        """
+        Recommend top N unseen movies for many users at once, as a (users, n) array padded with -1.
+
+        A block of users' centred ratings is multiplied by the sparse neighbour matrix; users unknown to the model
+        get the most rated movies.
+        """
+        users = self.interactions.encode_users(user_ids)
+        top = recommend_top_n(
+            lambda rows: (self.centred[rows] @ self.neighbours_t).toarray(),
+            users,
+            n,
+            seen=self.interactions.csr,
+            fallback=np.diff(self.interactions.csc.indptr).astype(np.float32),
+            block_size=block_size,
+        )
+        return np.where(top >= 0, self.interactions.movie_ids[top], -1)
@@ -0,0 +1,71 @@
+from collections.abc import Callable
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def top_n(scores: np.ndarray, n: int) -> np.ndarray:
+    """
+    Return the column indices of the n highest scores in each row, best first.
+
+    Uses a partial sort so the cost is linear in the number of columns. Slots whose score is -inf (masked items)
+    are returned as -1.
+    """
+    n = min(n, scores.shape[1])
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return np.where(np.isneginf(top_scores), -1, top)
+
+
+def mask_seen(scores: np.ndarray, seen: sp.csr_matrix, rows: np.ndarray) -> None:
+    """Set the scores of items each row's user has already rated to -inf, in place."""
+    block = seen[rows]
+    row_idx = np.repeat(np.arange(len(rows)), np.diff(block.indptr))
+    scores[row_idx, block.indices] = -np.inf
+
+
+def recommend_top_n(  # noqa: PLR0913
+    score_fn: Callable[[np.ndarray], np.ndarray],
+    users: np.ndarray,
+    n: int,
+    *,
+    seen: sp.csr_matrix | None = None,
+    fallback: np.ndarray | None = None,
+    block_size: int = 256,
+) -> np.ndarray:
+    """
+    Batched top-n item indices for encoded users.
+
+    Args:
+        score_fn (Callable): Maps an array of user rows to a dense (rows, items) score block.
+        users (np.ndarray): Encoded user rows, -1 for users unknown to the model.
+        n (int): Number of items to return per user.
+        seen (sp.csr_matrix): Training interactions; items rated by a user are never recommended to them.
+        fallback (np.ndarray): Item scores for unknown users. Without it their rows are all -1.
+        block_size (int): Users scored per block, bounding the dense score block to block_size x items.
+
+    Returns:
+        A (users, n) int array of item indices, best first, padded with -1.
+
+    """
+    users = np.asarray(users)
+    recs = np.full((len(users), n), -1, dtype=np.int64)
+    for start in range(0, len(users), block_size):
+        block = users[start : start + block_size]
+        known = block >= 0
+        scores = score_fn(block[known]).astype(np.float32, copy=False)
+        if seen is not None:
+            mask_seen(scores, seen, block[known])
+        if known.all():
+            block_scores = scores
+        else:
+            block_scores = np.full((len(block), scores.shape[1]), -np.inf, dtype=np.float32)
+            block_scores[known] = scores
+            if fallback is not None:
+                block_scores[~known] = fallback
+        top = top_n(block_scores, n)
+        recs[start : start + len(block), : top.shape[1]] = top
+    return recs
@@ -0,0 +1,197 @@
+import logging
+from collections.abc import Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.features.aggregates import USER_FEATURES, RatingAggregates, add_counts, grow
+
+from .base import BaseRecommender
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+Chunks = Callable[[], Iterable[pd.DataFrame]]
+
+
+def chunk_bounds(n_rows: int, chunk_size: int) -> list[tuple[int, int]]:
+    """[start, stop) row ranges of consecutive chunks of at most chunk_size rows."""
+    return [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+
+
+def shuffled_chunks(df: pd.DataFrame, chunk_size: int, rng: np.random.Generator | None) -> Iterator[pd.DataFrame]:
+    """Chunks of df in a random order with their rows shuffled, or in order without rng."""
+    bounds = chunk_bounds(len(df), chunk_size)
+    order = rng.permutation(len(bounds)) if rng is not None else range(len(bounds))
+    for i in order:
+        chunk = df.iloc[slice(*bounds[i])]
+        yield chunk.take(rng.permutation(len(chunk))) if rng is not None else chunk
+
+
+def fit_in_chunks(model: BaseRecommender, df: pd.DataFrame, cfg: DictConfig) -> None:
+    """
+    Fit an incremental model on an in-memory frame with the schedule of the out-of-core trainer: prepare, then
+    training.out_of_core.epochs passes of partial_fit over chunks of df.
+    """
+    ooc = cfg.training.out_of_core
+    model.prepare(lambda: shuffled_chunks(df, ooc.chunk_size, None))
+    rng = np.random.default_rng(cfg.exp.seed) if ooc.shuffle else None
+    for _ in range(ooc.epochs):
+        for chunk in shuffled_chunks(df, ooc.chunk_size, rng):
+            model.partial_fit(chunk)
+
+
+def lookup(table: np.ndarray, ids: np.ndarray, default: float = 0.0) -> np.ndarray:
+    """Values of a table indexed by raw id, default for ids outside it."""
+    ids = np.asarray(ids, dtype=np.int64)
+    valid = (ids >= 0) & (ids < len(table))
+    return np.where(valid, table[np.where(valid, ids, 0)] if len(table) else default, default)
+
+
+def top_movies(scores: np.ndarray, known: np.ndarray, n_users: int, n: int) -> np.ndarray:
+    """The same n best known movies for every user, as a (users, n) array of raw ids padded with -1."""
+    movies = np.flatnonzero(known)
+    best = movies[np.argsort(-scores[movies], kind="stable")[:n]]
+    recs = np.full((n_users, n), -1, dtype=np.int64)
+    recs[:, : len(best)] = best
+    return recs
+
+
+class StreamingBiasRecommender(BaseRecommender):
+    """
+    Global average plus user and movie biases, learned by mini-batch SGD one chunk of ratings at a time.
+
+    The bias tables are indexed by raw id and grow as new ids arrive, so no pass over the full data is needed to
+    size them. Each mini-batch moves the bias of every id in it by its mean error, minus an L2 penalty. Without a
+    per-user record of seen movies, every user is recommended the movies with the highest bias.
+    """
+
+    incremental = True
+
+    def __init__(self, cfg: DictConfig) -> None:
+        """Init."""
+        self.cfg = cfg
+        params = cfg.exp.model.params
+        self.learning_rate = params.get("learning_rate", 0.1)
+        self.reg = params.get("reg", 0.05)
+        self.batch_size = params.get("batch_size", 10_000)
+        self.global_avg = None
+        self.user_bias = np.zeros(0)
+        self.movie_bias = np.zeros(0)
+        self.movie_count = np.zeros(0, dtype=np.int64)
+
+    def prepare(self, chunks: Chunks) -> None:
+        """Global average of the ratings, in one pass over the chunks."""
+        total, rows = 0.0, 0
+        for chunk in chunks():
+            total += chunk[ccfg.rating].to_numpy(dtype=np.float64).sum()
+            rows += len(chunk)
+        self.global_avg = total / rows if rows else 0.0
+
+    def partial_fit(self, df: pd.DataFrame) -> None:
+        if not len(df):
+            return
+        users = df[ccfg.user_id].to_numpy()
+        movies = df[ccfg.movie_id].to_numpy()
+        ratings = df[ccfg.rating].to_numpy(dtype=np.float64)
+        self.user_bias = grow(self.user_bias, int(users.max()) + 1)
+        self.movie_bias = grow(self.movie_bias, int(movies.max()) + 1)
+        self.movie_count = add_counts(self.movie_count, movies)
+        for start in range(0, len(df), self.batch_size):
+            u, m = users[start : start + self.batch_size], movies[start : start + self.batch_size]
+            errors = ratings[start : start + self.batch_size] - self.global_avg - self.user_bias[u] - self.movie_bias[m]
+            self.user_bias = self._step(self.user_bias, u, errors)
+            self.movie_bias = self._step(self.movie_bias, m, errors)
+
+    def _step(self, bias: np.ndarray, ids: np.ndarray, errors: np.ndarray) -> np.ndarray:
+        # Aggregating over the batch's own ids keeps a step proportional to the batch rather than the table
+        unique, inverse = np.unique(ids, return_inverse=True)
+        mean_error = np.bincount(inverse, weights=errors) / np.bincount(inverse)
+        bias[unique] += self.learning_rate * (mean_error - self.reg * bias[unique])
+        return bias
+
+    def fit(self, df: pd.DataFrame) -> None:
+        """Fit."""
+        fit_in_chunks(self, df, self.cfg)
+        log.info(f"Fitted biases around {self.global_avg:.3f} for {np.count_nonzero(self.movie_count)} movies")
+
+    def predict(self, user_id: list[int], item_id: list[int]) -> np.ndarray:
+        """Predict."""
+        return self.global_avg + lookup(self.user_bias, user_id) + lookup(self.movie_bias, item_id)
+
+    def recommend(self, user_id: int, n: int = 10) -> list:
+        """Recommend top N."""
+        recs = self.recommend_batch([user_id], n)[0]
+        return recs[recs >= 0].tolist()
+
+    def recommend_batch(self, user_ids: list[int], n: int = 10) -> np.ndarray:
+        """The movies with the highest bias for every user, as a (users, n) array padded with -1."""
+        return top_movies(self.movie_bias, self.movie_count > 0, len(user_ids), n)
+
+
+class SGDRecommender(BaseRecommender):
+    """
+    Linear model on the rating aggregate features, trained by scikit-learn's SGDRegressor one chunk at a time.
+
+    prepare fits the aggregates and the feature scaler in passes over the training chunks, so the features only
+    ever come from training ratings. As the features add up a user part and a movie part, movies rank the same for
+    every user, by the movie part of their score.
+    """
+
+    incremental = True
+
+    def __init__(self, cfg: DictConfig) -> None:
+        """Init."""
+        self.cfg = cfg
+        params = cfg.exp.model.params
+        self.model = SGDRegressor(
+            alpha=params.get("alpha", 1e-4),
+            learning_rate=params.get("learning_rate", "invscaling"),
+            eta0=params.get("eta0", 0.01),
+            random_state=cfg.exp.seed,
+        )
+        self.scaler = StandardScaler()
+        self.aggregates = None
+
+    def prepare(self, chunks: Chunks) -> None:
+        """Fit the aggregates (two passes) and then the feature scaler (one pass) on the chunks."""
+        self.aggregates = RatingAggregates.fit_chunks(
+            chunks, shrinkage=self.cfg.features.bias_shrinkage, movies_path=self.cfg.data.movies_raw
+        )
+        for chunk in chunks():
+            self.scaler.partial_fit(self.aggregates.transform(chunk))
+
+    def features(self, x: pd.DataFrame) -> np.ndarray:
+        return self.scaler.transform(self.aggregates.transform(x))
+
+    def partial_fit(self, df: pd.DataFrame) -> None:
+        if len(df):
+            self.model.partial_fit(self.features(df), df[ccfg.rating].to_numpy(dtype=np.float64))
+
+    def fit(self, df: pd.DataFrame) -> None:
+        """Fit."""
+        fit_in_chunks(self, df, self.cfg)
+        coefs = self.model.coef_.astype(np.float64).round(4).tolist()
+        log.info(f"Coefficients: {dict(zip(self.aggregates.feature_names, coefs, strict=True))}")
+
+    def predict(self, user_id: list[int], item_id: list[int]) -> np.ndarray:
+        """Predict."""
+        return self.model.predict(self.features(pd.DataFrame({ccfg.user_id: user_id, ccfg.movie_id: item_id})))
+
+    def recommend(self, user_id: int, n: int = 10) -> list:
+        """Recommend top N."""
+        recs = self.recommend_batch([user_id], n)[0]
+        return recs[recs >= 0].tolist()
+
+    def recommend_batch(self, user_ids: list[int], n: int = 10) -> np.ndarray:
+        """The movies with the best movie part of the score for every user, as a (users, n) array padded with -1."""
+        movie_columns = slice(len(USER_FEATURES) + 1, None)
+        movie_stats = self.aggregates.movie_stats[:-1]
+        scaled = (movie_stats - self.scaler.mean_[movie_columns]) / self.scaler.scale_[movie_columns]
+        scores = scaled @ self.model.coef_[movie_columns]
+        # The log count column is zero exactly for movies without training ratings
+        return top_movies(scores, movie_stats[:, 1] > 0, len(user_ids), n)
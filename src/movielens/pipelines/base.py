@@ -3,5 +3,13 @@ from abc import ABC, abstractmethod
 
 class BasePipeline(ABC):
     @abstractmethod
-    def run() -> None:
+    def features(self) -> None:
         raise NotImplementedError
+
+    @abstractmethod
+    def train(self) -> None:
+        raise NotImplementedError
+
+    def run(self) -> None:
+        self.features()
+        self.train()
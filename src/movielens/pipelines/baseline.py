@@ -4,8 +4,6 @@ from omegaconf import DictConfig, OmegaConf
 
 from movielens.conf.config import PROJECT_ROOT
 from movielens.conf.schema import DataColumnsConfig
-from movielens.features.baseline import BaselineFeature
-from movielens.training.baseline import BaselineTrainer
 
 from .base import BasePipeline
 
@@ -14,16 +12,28 @@ conf_path = str(PROJECT_ROOT / "conf")
 ccfg = DataColumnsConfig
 
 
+# Stages import their modules when run, so each CLI command only imports what it uses
 class BaselinePipeline(BasePipeline):
     def __init__(self, cfg: DictConfig) -> None:
         self.cfg = cfg
 
-    def run(self) -> None:
+    def features(self) -> None:
         log.info("Starting training with configuration:")
         log.info(OmegaConf.to_yaml(self.cfg))
 
+        from movielens.features.baseline import BaselineFeature  # noqa: PLC0415
+
         bsf = BaselineFeature(self.cfg, ccfg)
         bsf.run()
 
+    def train(self) -> None:
+        if self.cfg.training.out_of_core.enabled:
+            from movielens.training.streaming import StreamingTrainer  # noqa: PLC0415
+
+            StreamingTrainer(self.cfg).run()
+            return
+
+        from movielens.training.baseline import BaselineTrainer  # noqa: PLC0415
+
         blt = BaselineTrainer(self.cfg)
         blt.run()
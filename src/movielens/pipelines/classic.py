@@ -4,8 +4,6 @@ from omegaconf import DictConfig, OmegaConf
 
 from movielens.conf.config import PROJECT_ROOT
 from movielens.conf.schema import DataColumnsConfig
-from movielens.features.classic import ClassicFeature
-from movielens.training.classic import ClassicTrainer
 
 from .base import BasePipeline
 
@@ -14,16 +12,28 @@ conf_path = str(PROJECT_ROOT / "conf")
 ccfg = DataColumnsConfig
 
 
+# Stages import their modules when run, so each CLI command only imports what it uses
 class ClassicPipeline(BasePipeline):
     def __init__(self, cfg: DictConfig) -> None:
         self.cfg = cfg
 
-    def run(self) -> None:
+    def features(self) -> None:
         log.info("Starting training with configuration:")
         log.info(OmegaConf.to_yaml(self.cfg))
 
+        from movielens.features.classic import ClassicFeature  # noqa: PLC0415
+
         bsf = ClassicFeature(self.cfg, ccfg)
         bsf.run()
 
+    def train(self) -> None:
+        if self.cfg.training.out_of_core.enabled:
+            from movielens.training.streaming import StreamingTrainer  # noqa: PLC0415
+
+            StreamingTrainer(self.cfg).run()
+            return
+
+        from movielens.training.classic import ClassicTrainer  # noqa: PLC0415
+
         blt = ClassicTrainer(self.cfg)
         blt.run()
@@ -0,0 +1,15 @@
+from omegaconf import DictConfig
+
+from .base import BasePipeline
+from .baseline import BaselinePipeline
+from .classic import ClassicPipeline
+
+PIPELINE_REGISTRY = {"baseline": BaselinePipeline, "classic": ClassicPipeline}
+
+
+def get_pipeline(cfg: DictConfig) -> BasePipeline:
+    pipeline_class = PIPELINE_REGISTRY.get(cfg.exp.pipeline.lower())
+    if not pipeline_class:
+        msg = f"Unknown pipeline type '{cfg.exp.pipeline}'."
+        raise ValueError(msg)
+    return pipeline_class(cfg)
@@ -0,0 +1,102 @@
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Annotated
+
+import numpy as np
+from fastapi import FastAPI, Query, Request
+from omegaconf import DictConfig
+from pydantic import BaseModel
+
+from movielens.models.ann import IVFIndex
+from movielens.models.base import BaseRecommender
+from movielens.models.factory import load_model
+
+from .batching import MicroBatcher
+
+log = logging.getLogger(__name__)
+
+
+class PredictRequest(BaseModel):
+    user_id: int
+    movie_id: int
+
+
+class PredictResponse(BaseModel):
+    user_id: int
+    movie_id: int
+    rating: float
+
+
+class RecommendResponse(BaseModel):
+    user_id: int
+    movies: list[int]
+
+
+def load_recommender(cfg: DictConfig) -> BaseRecommender:
+    """Load the trained model from the artifacts dir, attaching its ANN index when serving.use_ann is set."""
+    log.info(f"Loading model from {cfg.artifacts.model}")
+    model = load_model(cfg.artifacts.model)
+    index_path = Path(cfg.artifacts.ann_index)
+    if cfg.serving.use_ann and index_path.exists() and hasattr(model, "set_index"):
+        log.info(f"Using ANN index {index_path}")
+        model.set_index(IVFIndex.load(index_path))
+    return model
+
+
+def predict_batch(model: BaseRecommender, items: list[tuple[int, int]]) -> list[float]:
+    """Score a batch of (user_id, movie_id) pairs with one vectorized predict call."""
+    users, movies = zip(*items, strict=True)
+    return np.asarray(model.predict(np.array(users), np.array(movies)), dtype=float).tolist()
+
+
+def recommend_batch(model: BaseRecommender, items: list[tuple[int, int]]) -> list[list[int]]:
+    """Recommend for a batch of (user_id, n) requests with one recommend_batch call."""
+    if len(items) == 1:
+        user_id, n = items[0]
+        return [list(model.recommend(user_id, n))]
+    recs = model.recommend_batch([user_id for user_id, _ in items], max(n for _, n in items))
+    return [row[row >= 0][:n].tolist() for row, (_, n) in zip(recs, items, strict=True)]
+
+
+def create_app(cfg: DictConfig, model: BaseRecommender | None = None) -> FastAPI:
+    """
+    Build the serving app. The model is loaded once at startup unless one is passed in.
+
+    Concurrent predict and recommend requests are coalesced into micro-batches so they hit the vectorized model
+    paths, bounded by serving.max_batch_size and serving.max_wait_ms.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        recommender = model if model is not None else load_recommender(cfg)
+        batch_args = {"max_batch_size": cfg.serving.max_batch_size, "max_wait_ms": cfg.serving.max_wait_ms}
+        app.state.model = recommender
+        app.state.predictor = MicroBatcher(lambda items: predict_batch(recommender, items), **batch_args)
+        app.state.recommender = MicroBatcher(lambda items: recommend_batch(recommender, items), **batch_args)
+        await app.state.predictor.start()
+        await app.state.recommender.start()
+        yield
+        await app.state.predictor.stop()
+        await app.state.recommender.stop()
+
+    app = FastAPI(title="movielens", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health() -> dict:
+        return {"status": "ok"}
+
+    @app.post("/predict")
+    async def predict(body: PredictRequest, request: Request) -> PredictResponse:
+        rating = await request.app.state.predictor.submit((body.user_id, body.movie_id))
+        return PredictResponse(user_id=body.user_id, movie_id=body.movie_id, rating=rating)
+
+    @app.get("/recommend/{user_id}")
+    async def recommend(
+        user_id: int, request: Request, n: Annotated[int, Query(ge=1, le=1000)] = 10
+    ) -> RecommendResponse:
+        movies = await request.app.state.recommender.submit((user_id, n))
+        return RecommendResponse(user_id=user_id, movies=movies)
+
+    return app
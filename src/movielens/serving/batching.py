@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from collections.abc import Callable
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent requests into batches for a vectorized handler.
+
+    Each request waits at most max_wait_ms for others to join its batch, and a batch never exceeds max_batch_size.
+    The handler maps a list of request items to a list of results in the same order and runs in a worker thread so
+    the event loop keeps accepting requests while a batch is scored.
+    """
+
+    def __init__(self, handler: Callable[[list], list], max_batch_size: int = 256, max_wait_ms: float = 5.0) -> None:
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self._task = None
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def submit(self, item: Any) -> Any:  # noqa: ANN401
+        """Queue one request item and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[Any, asyncio.Future]]:
+        """Wait for one request, then gather more until the batch is full or the wait time runs out."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = [(item, future) for item, future in await self._collect() if not future.done()]
+            if not batch:
+                continue
+            try:
+                results = await asyncio.to_thread(self.handler, [item for item, _ in batch])
+            except Exception as e:
+                log.exception("Batch failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results, strict=True):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from omegaconf import DictConfig
+
+from .app import create_app, load_recommender
+
+log = logging.getLogger(__name__)
+
+
+def summarise(latencies: list[float], elapsed: float) -> dict:
+    """Throughput and latency percentiles (ms) for one set of requests."""
+    ms = 1000 * np.asarray(latencies)
+    return {
+        "requests": len(ms),
+        "throughput_rps": len(ms) / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else 0.0,
+        "p99_ms": float(np.percentile(ms, 99)) if len(ms) else 0.0,
+    }
+
+
+async def run_load_test(app: FastAPI, requests: list[tuple[str, int, int]], concurrency: int = 64, n: int = 10) -> dict:
+    """
+    Fire requests at the app in-process through an ASGI transport, with concurrency clients in flight at once.
+
+    Each request is ("predict", user_id, movie_id) or ("recommend", user_id, _). No network or external server is
+    involved, so the numbers measure the app, batching and model.
+    """
+    latencies = {"predict": [], "recommend": []}
+    pending = iter(requests)
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        for kind, user_id, movie_id in pending:
+            start = time.perf_counter()
+            if kind == "predict":
+                response = await client.post("/predict", json={"user_id": user_id, "movie_id": movie_id})
+            else:
+                response = await client.get(f"/recommend/{user_id}", params={"n": n})
+            response.raise_for_status()
+            latencies[kind].append(time.perf_counter() - start)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://movielens") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+    results = {kind: summarise(values, elapsed) for kind, values in latencies.items()}
+    results["total"] = summarise(latencies["predict"] + latencies["recommend"], elapsed)
+    return results
+
+
+def run_local_test(cfg: DictConfig) -> dict:
+    """Load the trained model and measure throughput and p99 latency with an in-process load test."""
+    model = load_recommender(cfg)
+    app = create_app(cfg, model=model)
+
+    test = cfg.serving.loadtest
+    rng = np.random.default_rng(cfg.exp.seed)
+    users = rng.choice(model.interactions.user_ids, size=test.requests)
+    movies = rng.choice(model.interactions.movie_ids, size=test.requests)
+    kinds = np.where(rng.random(test.requests) < test.predict_fraction, "predict", "recommend")
+    requests = list(zip(kinds.tolist(), users.tolist(), movies.tolist(), strict=True))
+
+    results = asyncio.run(run_load_test(app, requests, concurrency=test.concurrency, n=test.n))
+    for kind, summary in results.items():
+        log.info(f"{kind}: {summary}")
+    return results
@@ -0,0 +1,50 @@
+import logging
+
+import mlflow
+import numpy as np
+from mlflow import MlflowClient
+from omegaconf import DictConfig
+from prefect import task
+from prefect.cache_policies import NO_CACHE
+
+from movielens.models.ann import IVFIndex, benchmark_index
+from movielens.models.base import BaseRecommender
+from movielens.models.factory import save_model
+from movielens.utils.instrument import instrument
+
+log = logging.getLogger(__name__)
+
+
+@instrument("training.build_index")
+def build_index(cfg: DictConfig, model: BaseRecommender, run_id: str) -> IVFIndex:
+    """Build and save an IVF index over the model item factors, logging recall and latency against exact search."""
+    ann = cfg.ann
+    index = IVFIndex(n_lists=ann.n_lists, n_probe=ann.n_probe, iterations=ann.kmeans_iterations, seed=cfg.exp.seed)
+    index.build(model.item_factors)
+    index.save(cfg.artifacts.ann_index)
+
+    rng = np.random.default_rng(cfg.exp.seed)
+    n_queries = min(ann.benchmark_queries, len(model.user_factors))
+    queries = model.user_factors[rng.choice(len(model.user_factors), size=n_queries, replace=False)]
+    results = benchmark_index(index, model.item_factors, queries, probes=list(ann.benchmark_probes))
+    client = MlflowClient()
+    client.log_metric(run_id, "ann_exact_ms", results["exact_ms"])
+    for n_probe, result in results["probes"].items():
+        client.log_metric(run_id, "ann_recall", result["recall"], step=n_probe)
+        client.log_metric(run_id, "ann_ms", result["ms"], step=n_probe)
+    return index
+
+
+@task(cache_policy=NO_CACHE)
+@instrument("training.log_model_artifacts")
+def log_model_artifacts(cfg: DictConfig, model: BaseRecommender, run_id: str | None = None) -> None:
+    """
+    Save the fitted model, plus an ANN index for factor models, and log them to MLflow under model/.
+
+    Everything is logged to run_id, by default the active run, so this can run off the main thread.
+    """
+    run_id = run_id or mlflow.active_run().info.run_id
+    save_model(model, cfg.artifacts.model)
+    if cfg.ann.enabled and getattr(model, "item_factors", None) is not None:
+        build_index(cfg, model, run_id)
+    MlflowClient().log_artifacts(run_id, cfg.artifacts.dir, artifact_path="model")
@@ -3,17 +3,24 @@ import logging
 import mlflow
 import pandas as pd
 from omegaconf import DictConfig
-from sklearn.model_selection import train_test_split
+from prefect import flow
+from prefect.futures import wait
 
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
 from movielens.models.base import BaseRecommender
 from movielens.models.factory import get_factory
 from movielens.utils.dataset import load_data
-from movielens.utils.evaluate import evaluate_model
+from movielens.utils.evaluate import evaluate_model, evaluate_ranking
+from movielens.utils.instrument import instrument, log_stages
 from movielens.utils.plotting import Plotter
+from movielens.utils.registry import DatasetRegistry, log_dataset
 
+from .artifacts import log_model_artifacts
 from .base import BaseTrainer
+from .splits import load_train_interactions, split_frame_inplace, split_indices
 
 log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
 
 
 class BaselineTrainer(BaseTrainer):
@@ -28,6 +35,8 @@ class BaselineTrainer(BaseTrainer):
         self.prediction_data = {}
         self._model = None
         self.plotter = Plotter(cfg)
+        self.registry = DatasetRegistry(cfg.registry.dir)
+        self.interactions = None
 
     @property
     def model(self) -> BaseRecommender:
@@ -40,20 +49,45 @@ class BaselineTrainer(BaseTrainer):
     def setup_mlflow(self) -> None:
         mlflow.set_experiment(self.cfg.exp.mlflow.experiment_name)
 
+    @instrument("training.load")
     def load(self) -> pd.DataFrame:
-        return load_data(self.cfg.data.ratings_processed, n=self.cfg.exp.n_rows)
+        return load_data(self.cfg.data.ratings_processed, n=self.cfg.exp.n_rows, dtypes=RATINGS_DTYPES)
 
+    @instrument("training.split")
     def split(self, df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
-        return train_test_split(df, test_size=self.cfg.training.test_size, random_state=self.cfg.exp.seed)
+        """Split df, the frame load returned, in place: it is reordered into the train rows and then the test rows."""
+        train_idx, test_idx = split_indices(df, self.cfg)
+        if self.model.uses_interactions:
+            self.interactions = load_train_interactions(self.cfg, len(df))
+        return split_frame_inplace(df, train_idx, test_idx)
 
+    @instrument("training.fit")
     def train(self, train_df: pd.DataFrame) -> None:
         log.info("Fitting model")
-        self.model.fit(train_df)
+        if self.model.uses_interactions:
+            self.model.fit(train_df, interactions=self.interactions)
+        else:
+            self.model.fit(train_df)
 
+    @instrument("training.evaluate")
     def evaluate(self, test_df: pd.DataFrame) -> None:
         log.info("Evaluating model")
         eval_results = evaluate_model(self.model, test_df)
         self.metrics = eval_results["metrics"]
+        if self.cfg.evaluation.ranking:
+            self.metrics.update(
+                evaluate_ranking(
+                    self.model,
+                    test_df[ccfg.user_id],
+                    test_df[ccfg.movie_id],
+                    test_df[ccfg.rating],
+                    k=self.cfg.evaluation.k,
+                    relevance_threshold=self.cfg.evaluation.relevance_threshold,
+                    max_users=self.cfg.evaluation.max_users,
+                    n_jobs=self.cfg.evaluation.n_jobs,
+                    seed=self.cfg.exp.seed,
+                )
+            )
         self.prediction_data = {
             "preds": eval_results["preds"],
             "truths": eval_results["truths"],
@@ -63,19 +97,34 @@ class BaselineTrainer(BaseTrainer):
         mlflow.log_param("model_name", self.cfg.exp.model.name)
         mlflow.log_params(self.cfg.exp.model.params)
         mlflow.log_param("test_size", self.cfg.training.test_size)
+        mlflow.log_param("split", self.cfg.training.split)
         mlflow.log_metrics(self.metrics)
         mlflow.log_param("data_version", self.cfg.data.version)
-        mlflow.log_artifact(self.cfg.data.ratings_processed, artifact_path="data")
-
+        log_dataset(self.registry, self.cfg.data.ratings_processed)
+
+    @instrument("training.log_outputs")
+    def log_outputs(self, run_id: str) -> None:
+        """Log the run, save the model artifacts and render the plots concurrently, as they are independent."""
+        futures = [
+            log_model_artifacts.submit(self.cfg, self.model, run_id),
+            self.plotter.log_plots.submit(
+                truths=self.prediction_data["truths"], preds=self.prediction_data["preds"], run_id=run_id
+            ),
+        ]
+        self.log_run()
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    @flow()
     def run(self) -> None:
         log.info("Starting training pipeline")
 
         self.setup_mlflow()
-        df = self.load()
-        train_df, test_df = self.split(df)
+        train_df, test_df = self.split(self.load())
 
-        with mlflow.start_run():
+        with mlflow.start_run() as run:
             self.train(train_df)
             self.evaluate(test_df)
-            self.log_run()
-            self.plotter.log_plots(truths=self.prediction_data["truths"], preds=self.prediction_data["preds"])
+            self.log_outputs(run.info.run_id)
+            log_stages()
@@ -1,19 +1,29 @@
 import logging
+from pathlib import Path
 
 import mlflow
+import numpy as np
 import pandas as pd
 from omegaconf import DictConfig
-from sklearn.model_selection import train_test_split
+from prefect import flow
+from prefect.futures import wait
 
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
+from movielens.features.aggregates import RatingAggregates
 from movielens.models.base import BaseRecommender
 from movielens.models.factory import get_factory
-from movielens.utils.dataset import load_data, split
-from movielens.utils.evaluate import evaluate_model_xy
+from movielens.utils.dataset import load_data
+from movielens.utils.evaluate import evaluate_model_xy, evaluate_ranking
+from movielens.utils.instrument import instrument, log_stages
 from movielens.utils.plotting import Plotter
+from movielens.utils.registry import DatasetRegistry, log_dataset
 
+from .artifacts import log_model_artifacts
 from .base import BaseTrainer
+from .splits import load_train_interactions, split_frame_inplace, split_indices, split_params
 
 log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
 
 
 class ClassicTrainer(BaseTrainer):
@@ -28,11 +38,15 @@ class ClassicTrainer(BaseTrainer):
         self.prediction_data = {}
         self._model = None
         self.plotter = Plotter(cfg)
+        self.registry = DatasetRegistry(cfg.registry.dir)
         self.df = pd.DataFrame()
         self.x_test = None
         self.x_train = None
         self.y_test = None
         self.y_train = None
+        self.aggregates = None
+        self.features_train = None
+        self.interactions = None
 
     @property
     def model(self) -> BaseRecommender:
@@ -45,27 +59,78 @@ class ClassicTrainer(BaseTrainer):
     def setup_mlflow(self) -> None:
         mlflow.set_experiment(self.cfg.exp.mlflow.experiment_name)
 
+    @instrument("training.load")
     def load(self) -> pd.DataFrame:
-        self.df = load_data(self.cfg.data.ratings_processed, n=self.cfg.exp.n_rows)
-
+        self.df = load_data(self.cfg.data.ratings_processed, n=self.cfg.exp.n_rows, dtypes=RATINGS_DTYPES)
+
+    def load_aggregates(self, n_rows: int) -> RatingAggregates | None:
+        """The aggregates of the feature stage, if it wrote them and fitted them on the same train split as this run."""
+        if not Path(self.cfg.data.aggregates).exists() or not Path(self.cfg.data.features).exists():
+            return None
+        aggregates = RatingAggregates.load(self.cfg.data.aggregates)
+        if aggregates.meta != split_params(self.cfg, n_rows):
+            log.warning(f"Aggregates in {self.cfg.data.aggregates} are from another split, refitting them")
+            return None
+        return aggregates
+
+    @instrument("training.split")
     def split(self) -> None:
-        x, y = split(self.df)
-        self.x_train, self.x_test = train_test_split(
-            x, test_size=self.cfg.training.test_size, random_state=self.cfg.exp.seed
-        )
-        self.y_train, self.y_test = train_test_split(
-            y, test_size=self.cfg.training.test_size, random_state=self.cfg.exp.seed
-        )
+        """
+        Split the loaded ratings into train and test views of the same frame, then release the frame.
+
+        The trainer owns the frame load read, so it is reordered in place rather than copied.
+
+        x keeps the rating column, which the features ignore, so no copy without it is made.
+        """
+        n_rows = len(self.df)
+        train_idx, test_idx = split_indices(self.df, self.cfg)
+        self.aggregates = self.load_aggregates(n_rows)
+        self.interactions = load_train_interactions(self.cfg, n_rows)
+        if self.aggregates is not None:
+            # Only the train rows of the memory-mapped matrix are read, by their positions before the split
+            self.features_train = np.load(self.cfg.data.features, mmap_mode="r")[train_idx]
+        self.x_train, self.x_test = split_frame_inplace(self.df, train_idx, test_idx)
+        self.y_train, self.y_test = self.x_train[ccfg.rating], self.x_test[ccfg.rating]
+        self.df = None
+        if self.aggregates is None:
+            self.aggregates = RatingAggregates.fit(
+                self.x_train,
+                shrinkage=self.cfg.features.bias_shrinkage,
+                movies_path=self.cfg.data.movies_raw,
+                meta=split_params(self.cfg, n_rows),
+            )
         log.info(f"{len(self.x_train)}, {len(self.y_train)}, {len(self.x_test)}, {len(self.y_test)}")
 
+    @instrument("training.fit")
     def train(self) -> None:
         log.info("Fitting model")
-        self.model.fit(self.x_train, self.y_train)
+        self.model.fit(
+            self.x_train,
+            self.y_train,
+            aggregates=self.aggregates,
+            features=self.features_train,
+            interactions=self.interactions,
+        )
 
+    @instrument("training.evaluate")
     def evaluate(self) -> None:
         log.info("Evaluating model")
         eval_results = evaluate_model_xy(self.model, self.x_test, self.y_test)
         self.metrics = eval_results["metrics"]
+        if self.cfg.evaluation.ranking:
+            self.metrics.update(
+                evaluate_ranking(
+                    self.model,
+                    self.x_test[ccfg.user_id],
+                    self.x_test[ccfg.movie_id],
+                    self.y_test,
+                    k=self.cfg.evaluation.k,
+                    relevance_threshold=self.cfg.evaluation.relevance_threshold,
+                    max_users=self.cfg.evaluation.max_users,
+                    n_jobs=self.cfg.evaluation.n_jobs,
+                    seed=self.cfg.exp.seed,
+                )
+            )
         self.prediction_data = {
             "preds": eval_results["preds"],
             "truths": eval_results["truths"],
@@ -75,10 +140,26 @@ class ClassicTrainer(BaseTrainer):
         mlflow.log_param("model_name", self.cfg.exp.model.name)
         mlflow.log_params(self.cfg.exp.model.params)
         mlflow.log_param("test_size", self.cfg.training.test_size)
+        mlflow.log_param("split", self.cfg.training.split)
         mlflow.log_metrics(self.metrics)
         mlflow.log_param("data_version", self.cfg.data.version)
-        mlflow.log_artifact(self.cfg.data.ratings_processed, artifact_path="data")
-
+        log_dataset(self.registry, self.cfg.data.ratings_processed)
+
+    @instrument("training.log_outputs")
+    def log_outputs(self, run_id: str) -> None:
+        """Log the run, save the model artifacts and render the plots concurrently, as they are independent."""
+        futures = [
+            log_model_artifacts.submit(self.cfg, self.model, run_id),
+            self.plotter.log_plots.submit(
+                truths=self.prediction_data["truths"], preds=self.prediction_data["preds"], run_id=run_id
+            ),
+        ]
+        self.log_run()
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    @flow()
     def run(self) -> None:
         log.info("Starting training pipeline")
 
@@ -86,8 +167,8 @@ class ClassicTrainer(BaseTrainer):
         self.load()
         self.split()
 
-        with mlflow.start_run():
+        with mlflow.start_run() as run:
             self.train()
             self.evaluate()
-            self.log_run()
-            self.plotter.log_plots(truths=self.prediction_data["truths"], preds=self.prediction_data["preds"])
+            self.log_outputs(run.info.run_id)
+            log_stages()
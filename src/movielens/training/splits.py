@@ -0,0 +1,120 @@
+import logging
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.features.interactions import InteractionMatrix
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+Split = tuple[np.ndarray, np.ndarray]
+
+
+def random_split(df: pd.DataFrame, cfg: DictConfig) -> Split:
+    """Hold out a uniform random test_size fraction of the rows."""
+    n_test = round(len(df) * cfg.training.test_size)
+    order = np.random.default_rng(cfg.exp.seed).permutation(len(df))
+    return np.sort(order[n_test:]), np.sort(order[:n_test])
+
+
+def temporal_split(df: pd.DataFrame, cfg: DictConfig) -> Split:
+    """
+    Hold out every rating at or after one global cutoff time, chosen so about test_size of the rows fall after it.
+
+    The cutoff is found with a partial sort, so the timestamps are never fully sorted.
+    """
+    timestamps = df[ccfg.timestamp].to_numpy()
+    n_test = round(len(df) * cfg.training.test_size)
+    if n_test == 0:
+        return np.arange(len(df)), np.empty(0, dtype=np.int64)
+    cutoff = np.partition(timestamps, len(df) - n_test)[len(df) - n_test]
+    test = timestamps >= cutoff
+    log.info(f"Temporal split at timestamp {cutoff}")
+    return np.flatnonzero(~test), np.flatnonzero(test)
+
+
+def leave_last_n_split(df: pd.DataFrame, cfg: DictConfig) -> Split:
+    """
+    Hold out each user's n most recent ratings, with n = training.leave_last_n.
+
+    Every user keeps at least their first rating in the train set. Rows are ordered by (user, timestamp) in one
+    lexsort and each row's position within its user's group is computed from the group boundaries.
+    """
+    users = df[ccfg.user_id].to_numpy()
+    order = np.lexsort((df[ccfg.timestamp].to_numpy(), users))
+    sorted_users = users[order]
+    starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    group = np.repeat(np.arange(len(starts)), sizes)
+    position = np.arange(len(order)) - starts[group]
+    test = position >= np.maximum(sizes - cfg.training.leave_last_n, 1)[group]
+    return np.sort(order[~test]), np.sort(order[test])
+
+
+SPLIT_REGISTRY: dict[str, Callable[[pd.DataFrame, DictConfig], Split]] = {
+    "random": random_split,
+    "temporal": temporal_split,
+    "leave_last_n": leave_last_n_split,
+}
+
+
+def split_indices(df: pd.DataFrame, cfg: DictConfig) -> Split:
+    """Positional train and test row indices of df for the strategy in training.split."""
+    split_fn = SPLIT_REGISTRY.get(cfg.training.split.lower())
+    if not split_fn:
+        msg = f"Unknown split strategy '{cfg.training.split}'."
+        raise ValueError(msg)
+    train_idx, test_idx = split_fn(df, cfg)
+    log.info(f"{cfg.training.split} split: {len(train_idx)} train rows, {len(test_idx)} test rows")
+    return train_idx, test_idx
+
+
+def split_frame_inplace(
+    df: pd.DataFrame, train_idx: np.ndarray, test_idx: np.ndarray
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Rearrange df in place into its train rows followed by its test rows and return the two as row-slice views.
+
+    The caller's frame is modified, one column at a time, so the split costs one extra column instead of a second
+    copy of the data; pass a frame nothing else holds. The indices must cover every row once.
+    """
+    n_train = len(train_idx)
+    for col in df.columns:
+        values = df[col].to_numpy()
+        rearranged = np.empty_like(values)
+        np.take(values, train_idx, out=rearranged[:n_train])
+        np.take(values, test_idx, out=rearranged[n_train:])
+        df[col] = rearranged
+    return df.iloc[:n_train], df.iloc[n_train:]
+
+
+def split_params(cfg: DictConfig, n_rows: int) -> dict:
+    """Everything split_indices depends on, to check that state fitted on a train split matches the current one."""
+    return {
+        "split": cfg.training.split.lower(),
+        "test_size": cfg.training.test_size,
+        "leave_last_n": cfg.training.leave_last_n,
+        "seed": cfg.exp.seed,
+        "n_rows": n_rows,
+    }
+
+
+def load_train_interactions(cfg: DictConfig, n_rows: int) -> InteractionMatrix | None:
+    """
+    The interaction matrix of the feature stage, memory-mapped, if it holds the train rows of the same split as
+    this run. A matrix of another split would leak test ratings into training, so it is then ignored.
+    """
+    path = Path(cfg.data.interactions)
+    if not path.exists():
+        return None
+    interactions = InteractionMatrix.load(str(path), mmap=True)
+    if interactions.meta != split_params(cfg, n_rows):
+        log.warning(f"Interaction matrix in {path} is from another split, rebuilding it from the train rows")
+        return None
+    log.info(f"Loaded the train interaction matrix from {path}")
+    return interactions
@@ -0,0 +1,127 @@
+import logging
+import time
+from collections.abc import Iterable, Iterator
+
+import mlflow
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig
+from prefect import flow
+
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
+from movielens.models.streaming import chunk_bounds
+from movielens.utils.dataset import count_rows, prefetch, read_slice
+from movielens.utils.evaluate import evaluate_model
+from movielens.utils.instrument import instrument, log_stages
+from movielens.utils.registry import DatasetRegistry
+from movielens.utils.storage import infer_format
+
+from .baseline import BaselineTrainer
+from .splits import split_indices
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+
+class StreamingTrainer(BaselineTrainer):
+    """
+    Out-of-core training of incremental models on processed ratings larger than memory.
+
+    Only the user and timestamp columns are held to compute the usual training.split, as a test row mask, and the
+    test rows are collected for evaluation. The training rows stay on disk: every epoch reads them back a chunk at
+    a time, in a shuffled chunk order, while a background thread reads the next chunks, so memory is bounded by a
+    few chunks however large the data.
+    """
+
+    def __init__(self, cfg: DictConfig) -> None:
+        super().__init__(cfg)
+        self.ooc = cfg.training.out_of_core
+        self.path = cfg.data.ratings_processed
+        if infer_format(self.path) == "csv":
+            # Csv has no row index, so every chunk would be parsed from the start of the file
+            msg = f"Out-of-core training needs a columnar data.format (parquet, feather or numpy), not {self.path}."
+            raise ValueError(msg)
+        self.registry = DatasetRegistry(cfg.registry.dir, chunk_size=self.ooc.chunk_size)
+        self.bounds = []
+        self.test_mask = None
+
+    def read_chunks(self, order: Iterable[int]) -> Iterator[pd.DataFrame]:
+        """The chunks in order, read from disk."""
+        for i in order:
+            start, stop = self.bounds[i]
+            yield read_slice(self.path, start, stop, dtypes=RATINGS_DTYPES)
+
+    def train_chunks(self, rng: np.random.Generator | None = None) -> Iterator[pd.DataFrame]:
+        """The training rows of every chunk, prefetched; with rng in a random chunk order and with shuffled rows."""
+        order = rng.permutation(len(self.bounds)) if rng is not None else range(len(self.bounds))
+        for i, chunk in zip(order, prefetch(self.read_chunks(order), self.ooc.prefetch), strict=True):
+            start, stop = self.bounds[i]
+            train = chunk[~self.test_mask[start:stop]]
+            yield train.take(rng.permutation(len(train))) if rng is not None else train
+
+    @instrument("training.load")
+    def load(self) -> pd.DataFrame:
+        """The user and timestamp columns of the processed ratings, all the split strategies need."""
+        n_rows = count_rows(self.path)
+        n_rows = min(n_rows, self.cfg.exp.n_rows) if self.cfg.exp.n_rows else n_rows
+        self.bounds = chunk_bounds(n_rows, self.ooc.chunk_size)
+        log.info(f"Streaming {n_rows} ratings from {self.path} in {len(self.bounds)} chunks")
+        keys = [chunk[[ccfg.user_id, ccfg.timestamp]] for chunk in prefetch(self.read_chunks(range(len(self.bounds))))]
+        return pd.concat(keys, ignore_index=True) if keys else pd.DataFrame(columns=[ccfg.user_id, ccfg.timestamp])
+
+    @instrument("training.split")
+    def split(self, df: pd.DataFrame) -> tuple[None, pd.DataFrame]:
+        """Mark the test rows of the split and read them in. The training rows are left on disk for train."""
+        _, test_idx = split_indices(df, self.cfg)
+        self.test_mask = np.zeros(len(df), dtype=bool)
+        self.test_mask[test_idx] = True
+        test = [
+            chunk[self.test_mask[start:stop]]
+            for (start, stop), chunk in zip(
+                self.bounds, prefetch(self.read_chunks(range(len(self.bounds)))), strict=True
+            )
+        ]
+        return None, pd.concat(test, ignore_index=True)
+
+    @instrument("training.fit")
+    def train(self, train_df: pd.DataFrame | None = None, test_df: pd.DataFrame | None = None) -> None:  # noqa: ARG002
+        """
+        Prepare the model on the training chunks, then run training.out_of_core.epochs epochs of partial_fit.
+
+        With test_df, its RMSE is logged after every epoch.
+        """
+        if not self.model.incremental:
+            msg = f"Model '{self.cfg.exp.model.name}' does not support out-of-core training."
+            raise ValueError(msg)
+        self.model.prepare(self.train_chunks)
+        rng = np.random.default_rng(self.cfg.exp.seed) if self.ooc.shuffle else None
+        for epoch in range(self.ooc.epochs):
+            start, rows = time.perf_counter(), 0
+            for chunk in self.train_chunks(rng):
+                self.model.partial_fit(chunk)
+                rows += len(chunk)
+            seconds = time.perf_counter() - start
+            mlflow.log_metric("epoch_rows_per_s", rows / seconds if seconds else 0.0, step=epoch)
+            if test_df is not None and len(test_df):
+                rmse = evaluate_model(self.model, test_df)["metrics"]["rmse"]
+                mlflow.log_metric("epoch_rmse", rmse, step=epoch)
+                log.info(f"Epoch {epoch}: {rows} rows in {seconds:.1f}s, test RMSE {rmse:.4f}")
+
+    def log_run(self) -> None:
+        super().log_run()
+        mlflow.log_params(
+            {f"out_of_core_{key}": self.ooc[key] for key in ("chunk_size", "epochs", "shuffle", "prefetch")}
+        )
+
+    @flow()
+    def run(self) -> None:
+        log.info("Starting out-of-core training pipeline")
+
+        self.setup_mlflow()
+        _, test_df = self.split(self.load())
+
+        with mlflow.start_run() as run:
+            self.train(test_df=test_df)
+            self.evaluate(test_df)
+            self.log_outputs(run.info.run_id)
+            log_stages()
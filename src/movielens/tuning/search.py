@@ -0,0 +1,247 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import mlflow
+import optuna
+import pandas as pd
+from omegaconf import DictConfig, OmegaConf
+
+from movielens.conf.schema import RATINGS_DTYPES
+from movielens.models.factory import get_factory, model_cfg
+from movielens.training.splits import split_indices
+from movielens.utils.dataset import load_data
+from movielens.utils.evaluate import evaluate_model
+from movielens.utils.instrument import INSTRUMENTATION, log_stages
+from movielens.utils.shared import SharedArrays, SharedArraySpec, attach_frames
+
+log = logging.getLogger(__name__)
+
+SUGGESTERS = {
+    "float": lambda trial, name, spec: trial.suggest_float(name, spec.low, spec.high, log=spec.get("log", False)),
+    "int": lambda trial, name, spec: trial.suggest_int(name, spec.low, spec.high, log=spec.get("log", False)),
+    "categorical": lambda trial, name, spec: trial.suggest_categorical(name, list(spec.choices)),
+}
+
+
+def suggest_params(trial: optuna.Trial, space: DictConfig) -> dict:
+    """Sample one value per parameter of a tuning.space entry."""
+    params = {}
+    for name, spec in space.items():
+        suggest = SUGGESTERS.get(spec.type)
+        if not suggest:
+            msg = f"Unknown parameter type '{spec.type}' for '{name}'."
+            raise ValueError(msg)
+        params[name] = suggest(trial, name, spec)
+    return params
+
+
+def search_space(cfg: DictConfig) -> DictConfig:
+    space = cfg.tuning.space.get(cfg.exp.model.name.lower())
+    if not space:
+        msg = f"No search space for model '{cfg.exp.model.name}' in tuning.space."
+        raise ValueError(msg)
+    return space
+
+
+def storage(cfg: DictConfig) -> optuna.storages.RDBStorage:
+    """The study store, creating the directory of a SQLite file if needed."""
+    url = cfg.tuning.storage
+    if url.startswith("sqlite:///"):
+        Path(url.removeprefix("sqlite:///")).parent.mkdir(parents=True, exist_ok=True)
+    # Workers write to the same SQLite file, so wait on its lock rather than failing
+    return optuna.storages.RDBStorage(url, engine_kwargs={"connect_args": {"timeout": 60}})
+
+
+def median_pruner(cfg: DictConfig) -> optuna.pruners.MedianPruner:
+    return optuna.pruners.MedianPruner(
+        n_startup_trials=cfg.tuning.pruner.n_startup_trials, n_warmup_steps=cfg.tuning.pruner.n_warmup_steps
+    )
+
+
+def create_study(cfg: DictConfig) -> optuna.Study:
+    """Create the study in tuning.storage, or resume it if one of the same name exists."""
+    return optuna.create_study(
+        study_name=cfg.tuning.study_name,
+        storage=storage(cfg),
+        direction=cfg.tuning.direction,
+        pruner=median_pruner(cfg),
+        load_if_exists=True,
+    )
+
+
+class Objective:
+    """
+    Fits the model with sampled params on the training frame and scores it on the validation frame.
+
+    Iterative models report the validation metric after every iteration, so the median pruner can stop trials that
+    fall behind. Each trial is logged as an MLflow run nested under the tuning run.
+    """
+
+    def __init__(
+        self, cfg: DictConfig, frames: dict[str, pd.DataFrame], parent_run_id: str, experiment_id: str
+    ) -> None:
+        self.cfg = cfg
+        self.train_df = frames["train"]
+        self.valid_df = frames["valid"]
+        self.parent_run_id = parent_run_id
+        self.experiment_id = experiment_id
+        self.metric = cfg.tuning.metric
+        # Split the cores between the workers instead of every worker using all of them
+        self.n_threads = max((os.cpu_count() or 1) // cfg.tuning.n_workers, 1)
+
+    def params(self, trial: optuna.Trial) -> dict:
+        params = {**OmegaConf.to_container(self.cfg.exp.model.params), **suggest_params(trial, search_space(self.cfg))}
+        for key in ("n_threads", "n_jobs"):
+            if key in params and params[key] is None:
+                params[key] = self.n_threads
+        return params
+
+    def score(self, model: object) -> float:
+        return evaluate_model(model, self.valid_df)["metrics"][self.metric]
+
+    def __call__(self, trial: optuna.Trial) -> float:
+        params = self.params(trial)
+        model = get_factory(self.cfg.exp.model.name).create(model_cfg(self.cfg, self.cfg.exp.model.name, params))
+
+        def report(step: int) -> None:
+            value = self.score(model)
+            trial.report(value, step)
+            mlflow.log_metric(f"valid_{self.metric}", value, step=step)
+            if trial.should_prune():
+                raise optuna.TrialPruned
+
+        mlflow.start_run(
+            run_name=f"trial-{trial.number}",
+            experiment_id=self.experiment_id,
+            parent_run_id=self.parent_run_id,
+            nested=True,
+        )
+        status = "FAILED"
+        try:
+            mlflow.log_params({**params, "trial": trial.number})
+            if model.iterative:
+                model.fit(self.train_df, callback=report)
+            else:
+                model.fit(self.train_df)
+            value = self.score(model)
+            mlflow.log_metric(self.metric, value)
+            status = "FINISHED"
+        except optuna.TrialPruned:
+            mlflow.set_tag("optuna_state", "pruned")
+            status = "KILLED"
+            raise
+        finally:
+            mlflow.end_run(status)
+        return value
+
+
+def tune_worker(  # noqa: PLR0913
+    cfg: dict,
+    specs: dict[str, SharedArraySpec],
+    n_trials: int,
+    worker: int,
+    *,
+    tracking_uri: str,
+    parent_run_id: str,
+    experiment_id: str,
+) -> int:
+    """Run n_trials trials of the shared study in a worker process, on the frames in shared memory."""
+    logging.basicConfig(
+        level=logging.INFO, format=f"[%(asctime)s][worker {worker}][%(name)s][%(levelname)s] - %(message)s"
+    )
+    # Stage records of the workers are never logged
+    INSTRUMENTATION.enabled = False
+    cfg = OmegaConf.create(cfg)
+    mlflow.set_tracking_uri(tracking_uri)
+    study = optuna.load_study(
+        study_name=cfg.tuning.study_name,
+        storage=storage(cfg),
+        sampler=optuna.samplers.TPESampler(seed=cfg.exp.seed + worker),
+        pruner=median_pruner(cfg),
+    )
+    frames, segments = attach_frames(specs)
+    try:
+        study.optimize(Objective(cfg, frames, parent_run_id, experiment_id), n_trials=n_trials)
+    finally:
+        del frames
+        for shm in segments:
+            shm.close()
+    return n_trials
+
+
+def tuning_frames(cfg: DictConfig) -> dict[str, pd.DataFrame]:
+    """Training and validation frames, split from the training side of the usual split so the test rows stay unseen."""
+    df = load_data(cfg.data.ratings_processed, n=cfg.exp.n_rows, dtypes=RATINGS_DTYPES)
+    train_idx, _ = split_indices(df, cfg)
+    train_df = df.take(train_idx).reset_index(drop=True)
+    fit_idx, valid_idx = split_indices(train_df, cfg)
+    return {"train": train_df.take(fit_idx), "valid": train_df.take(valid_idx)}
+
+
+def run_tuning(cfg: DictConfig) -> optuna.Study:
+    """
+    Run tuning.n_trials trials of exp.model over tuning.space across tuning.n_workers processes.
+
+    The workers share one study through the storage, so the sampler and pruner see every finished trial, and read
+    the training and validation frames from shared memory rather than receiving a pickled copy each.
+    """
+    # Fail on a missing search space before any worker starts
+    search_space(cfg)
+    study = create_study(cfg)
+    n_workers = cfg.tuning.n_workers
+    trials = [cfg.tuning.n_trials // n_workers + (i < cfg.tuning.n_trials % n_workers) for i in range(n_workers)]
+
+    mlflow.set_experiment(cfg.exp.mlflow.experiment_name)
+    with (
+        SharedArrays.from_frames(tuning_frames(cfg)) as shared,
+        mlflow.start_run(run_name=f"tune-{cfg.exp.model.name}") as run,
+    ):
+        mlflow.log_params(
+            {"model_name": cfg.exp.model.name, "study": cfg.tuning.study_name, "n_trials": cfg.tuning.n_trials}
+        )
+        mlflow.log_dict(OmegaConf.to_container(search_space(cfg)), "tuning/space.json")
+        container = OmegaConf.to_container(cfg, resolve=True)
+        # Spawned workers start clean rather than inheriting the parent's threads and locks
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(
+                    tune_worker,
+                    container,
+                    shared.specs,
+                    n,
+                    worker,
+                    tracking_uri=mlflow.get_tracking_uri(),
+                    parent_run_id=run.info.run_id,
+                    experiment_id=run.info.experiment_id,
+                )
+                for worker, n in enumerate(trials)
+                if n
+            ]
+            for future in futures:
+                future.result()
+
+        log_study(study, cfg.tuning.metric)
+        log_stages()
+    return study
+
+
+def log_study(study: optuna.Study, metric: str) -> None:
+    """Log the best trial and the trial counts of the study to the active run."""
+    states = [trial.state for trial in study.trials]
+    mlflow.log_metrics(
+        {
+            "complete_trials": states.count(optuna.trial.TrialState.COMPLETE),
+            "pruned_trials": states.count(optuna.trial.TrialState.PRUNED),
+        }
+    )
+    if optuna.trial.TrialState.COMPLETE not in states:
+        log.warning("No trial completed")
+        return
+    mlflow.log_metric(f"best_{metric}", study.best_value)
+    mlflow.log_params({f"best_{name}": value for name, value in study.best_params.items()})
+    mlflow.log_dict(study.best_params, "tuning/best_params.json")
+    log.info(f"Best {metric} {study.best_value:.4f} with {study.best_params} (trial {study.best_trial.number})")
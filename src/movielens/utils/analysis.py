@@ -1,4 +1,16 @@
+import logging
+from collections.abc import Iterable
+
+import numpy as np
 import pandas as pd
+from omegaconf import DictConfig
+
+from .dataset import iter_data, load_data
+from .instrument import instrument
+
+log = logging.getLogger(__name__)
+
+PROFILE_MODES = ("exact", "sketch")
 
 
 def count_total_duplicates(row: pd.Series) -> int:
@@ -58,12 +70,311 @@ def print_column_checks(df: pd.DataFrame, max_return: int = 20) -> None:
         - Count of total unique values
         - Count of missing (NaN) values
         - Dictionary of each duplicate with its count
+
+    Every check comes from one value count per column, see profile_column.
     """
     for col in df.columns:
+        profile = profile_column(df[col], n_top=max_return)
         print(f"Column: {col}")
-        print("  dups:", count_total_duplicates(df[col]))
-        print("  distin:", count_distinct_duplicate_values(df[col]))
-        print("  uniq:", count_total_unique(df[col]))
-        print("  miss:", count_missing_values(df[col]))
-        print("  count:", top_n_duplicates(df[col], n=max_return))
+        print("  dups:", profile["duplicates"] + profile["nulls"])
+        print("  distin:", profile["distinct_duplicated"])
+        print("  uniq:", profile["distinct"])
+        print("  miss:", profile["nulls"])
+        print("  count:", dict(profile["top"]))
         print("-" * 40)
+
+
+def python_value(value: object) -> object:
+    """A numpy scalar as the equivalent Python value, so reports serialise to JSON."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def numeric_summary(counts: pd.Series) -> dict:
+    """Min, max and sum of a numeric column, computed from its value counts rather than from every row."""
+    if not len(counts) or not pd.api.types.is_numeric_dtype(counts.index):
+        return {}
+    values = counts.index.to_numpy(dtype=np.float64)
+    return {"min": values.min(), "max": values.max(), "sum": float(values @ counts.to_numpy(dtype=np.float64))}
+
+
+def profile_column(series: pd.Series, n_top: int = 20) -> dict:
+    """
+    Nulls, distinct values, duplicates, most duplicated values and numeric range of a column.
+
+    Everything is derived from a single value count, instead of separate nunique, value_counts and duplicated
+    passes. duplicates counts the extra occurrences of non-null values.
+    """
+    counts = series.value_counts(dropna=True, sort=False)
+    non_null = int(counts.sum())
+    repeated = counts[counts > 1]
+    summary = numeric_summary(counts)
+    profile = {
+        "dtype": str(series.dtype),
+        "rows": len(series),
+        "nulls": len(series) - non_null,
+        "distinct": len(counts),
+        "duplicates": non_null - len(counts),
+        "distinct_duplicated": len(repeated),
+        "top": [[python_value(v), int(c)] for v, c in repeated.nlargest(n_top).items()],
+    }
+    if summary:
+        profile.update(min=summary["min"], max=summary["max"], mean=summary["sum"] / non_null)
+    return profile
+
+
+def hash_values(values: np.ndarray) -> np.ndarray:
+    """64-bit hashes of the values, equal for equal values of the same dtype."""
+    return pd.util.hash_array(np.asarray(values))
+
+
+def is_number(dtype: object) -> bool:
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def float_keys(counts: pd.Series) -> pd.Series:
+    """
+    Value counts of a numeric column keyed by float64, so 5 and 5.0 are the same value whether or not nulls made
+    pandas parse their chunk as float. Integers beyond 2**53 may share a key.
+    """
+    if not is_number(counts.index.dtype) or counts.index.dtype == np.float64:
+        return counts
+    return counts.set_axis(counts.index.astype(np.float64))
+
+
+def common_dtype(current: np.dtype | None, new: np.dtype) -> np.dtype:
+    """The dtype holding the values of both dtypes: the wider of two numeric dtypes, otherwise object."""
+    new = np.dtype(getattr(new, "numpy_dtype", new))
+    if current is None or current == new:
+        return new
+    if is_number(current) and is_number(new):
+        return np.result_type(current, new)
+    return np.dtype(object)
+
+
+def bit_length(values: np.ndarray) -> np.ndarray:
+    """Number of bits needed to represent each uint64, by smearing the highest set bit down and counting."""
+    values = values.copy()
+    for shift in (1, 2, 4, 8, 16, 32):
+        values |= values >> np.uint64(shift)
+    return np.bitwise_count(values)
+
+
+class HyperLogLog:
+    """
+    Distinct count estimate in 2**precision one-byte registers, with a relative error of about 1.04 / sqrt(2**p).
+
+    Each register keeps the longest run of leading zeros seen among the hashes routed to it. Sketches of the same
+    precision merge by taking the register-wise maximum.
+    """
+
+    def __init__(self, precision: int = 14) -> None:
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, hashes: np.ndarray) -> None:
+        width = 64 - self.precision
+        buckets = (hashes >> np.uint64(width)).astype(np.intp)
+        rest = hashes & np.uint64((1 << width) - 1)
+        ranks = (width + 1 - bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        # Linear counting is more accurate while many registers are still empty
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)
+        return float(raw)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(len(self.registers))
+
+
+class CountMinSketch:
+    """
+    Frequency estimates in a depth x width table of counters, never below the true count.
+
+    Each value increments one counter per row, chosen by double hashing of its 64-bit hash, and its estimate is the
+    smallest of those counters. Estimates exceed the true count by at most e / width of the total with probability
+    1 - exp(-depth).
+    """
+
+    def __init__(self, width: int = 1 << 16, depth: int = 4) -> None:
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        low, high = hashes & np.uint64(0xFFFFFFFF), hashes >> np.uint64(32)
+        rows = np.arange(len(self.table), dtype=np.uint64)[:, None]
+        return ((low[None, :] + rows * high[None, :]) % np.uint64(self.width)).astype(np.intp)
+
+    def update(self, hashes: np.ndarray, counts: np.ndarray) -> None:
+        for i, columns in enumerate(self._columns(hashes)):
+            self.table[i] += np.bincount(columns, weights=counts, minlength=self.width).astype(np.int64)
+
+    def query(self, hashes: np.ndarray) -> np.ndarray:
+        columns = self._columns(hashes)
+        return np.take_along_axis(self.table, columns, axis=1).min(axis=0)
+
+
+class ColumnSketch:
+    """
+    Streaming profile of one column, updated a chunk at a time in bounded memory.
+
+    Distinct values come from a HyperLogLog and value frequencies from a count-min sketch. Heavy hitters are kept
+    space-saving style as n_candidates values with a count and an error bound: a value enters with its count-min
+    estimate, the part from earlier chunks being its error, and from then on adds its exact count of every chunk.
+    Every value above 1 / n_candidates of the rows is above that share of some chunk, so it enters from that chunk.
+    """
+
+    def __init__(self, precision: int = 14, width: int = 1 << 16, depth: int = 4, n_candidates: int = 1000) -> None:
+        self.dtype = None
+        self.rows = 0
+        self.nulls = 0
+        self.summary = {}
+        self.distinct = HyperLogLog(precision)
+        self.frequencies = CountMinSketch(width, depth)
+        self.n_candidates = n_candidates
+        self.candidates = pd.DataFrame({"count": pd.Series(dtype="int64"), "error": pd.Series(dtype="int64")})
+
+    def update(self, series: pd.Series) -> None:
+        counts = float_keys(series.value_counts(dropna=True, sort=False))
+        self.dtype = common_dtype(self.dtype, series.dtype)
+        self.rows += len(series)
+        self.nulls += len(series) - int(counts.sum())
+        self._update_summary(numeric_summary(counts))
+        if not len(counts):
+            return
+        hashes = hash_values(counts.index.to_numpy())
+        self.distinct.update(hashes)
+        self.frequencies.update(hashes, counts.to_numpy(dtype=np.float64))
+        self._update_candidates(counts)
+
+    def _update_candidates(self, counts: pd.Series) -> None:
+        candidates = self.candidates.copy()
+        candidates["count"] += counts.reindex(candidates.index, fill_value=0).to_numpy(dtype=np.int64)
+        new = counts.nlargest(self.n_candidates).index.difference(candidates.index)
+        estimates = self.frequencies.query(hash_values(new.to_numpy()))
+        entered = pd.DataFrame(
+            {"count": estimates, "error": estimates - counts.reindex(new).to_numpy(dtype=np.int64)}, index=new
+        )
+        merged = pd.concat([candidates, entered]) if len(candidates) else entered
+        self.candidates = merged.nlargest(self.n_candidates, "count")
+
+    def _update_summary(self, summary: dict) -> None:
+        if not summary:
+            return
+        if not self.summary:
+            self.summary = summary
+            return
+        self.summary = {
+            "min": min(self.summary["min"], summary["min"]),
+            "max": max(self.summary["max"], summary["max"]),
+            "sum": self.summary["sum"] + summary["sum"],
+        }
+
+    def report(self, n_top: int = 20) -> dict:
+        """
+        The profile_column statistics, estimated. Top counts may exceed the true ones by up to top_max_error, and
+        distinct duplicated values cannot be told from the sketches.
+        """
+        non_null = self.rows - self.nulls
+        distinct = min(round(self.distinct.estimate()), non_null)
+        top = self.candidates[self.candidates["count"] > 1].nlargest(n_top, "count")
+        # Numeric values are kept as float64 keys, shown again in the column's dtype across all chunks
+        values = top.index.astype(self.dtype) if is_number(self.dtype) else top.index
+        report = {
+            "dtype": None if self.dtype is None else str(self.dtype),
+            "rows": self.rows,
+            "nulls": self.nulls,
+            "distinct": distinct,
+            "distinct_relative_error": self.distinct.relative_error,
+            "duplicates": non_null - distinct,
+            "distinct_duplicated": None,
+            "top": [[python_value(v), int(c)] for v, c in zip(values, top["count"], strict=True)],
+            "top_max_error": int(top["error"].max()) if len(top) else 0,
+        }
+        if self.summary:
+            report.update(min=self.summary["min"], max=self.summary["max"], mean=self.summary["sum"] / non_null)
+        return report
+
+
+class FrameSketch:
+    """ColumnSketch of every column of a stream of frames, fed one chunk at a time with update."""
+
+    def __init__(self, **sketch_args: int) -> None:
+        self.sketch_args = sketch_args
+        self.rows = 0
+        self.sketches: dict[str, ColumnSketch] = {}
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.rows += len(chunk)
+        for col in chunk.columns:
+            self.sketches.setdefault(col, ColumnSketch(**self.sketch_args)).update(chunk[col])
+
+    def report(self, n_top: int = 20) -> dict:
+        return {
+            "rows": self.rows,
+            "mode": "sketch",
+            "columns": {col: sketch.report(n_top) for col, sketch in self.sketches.items()},
+        }
+
+
+def profile_chunks(chunks: Iterable[pd.DataFrame], n_top: int = 20, **sketch_args: int) -> dict:
+    """Profile a stream of frames, holding only the current chunk in memory."""
+    sketch = FrameSketch(**sketch_args)
+    for chunk in chunks:
+        sketch.update(chunk)
+    return sketch.report(n_top)
+
+
+def profile_columns(df: pd.DataFrame, n_top: int = 20) -> dict:
+    """Profile every column of an in-memory frame exactly."""
+    return {
+        "rows": len(df),
+        "mode": "exact",
+        "columns": {col: profile_column(df[col], n_top) for col in df.columns},
+    }
+
+
+@instrument("profiling.profile")
+def profile_data(path: str, cfg: DictConfig) -> dict:
+    """
+    Profile the data file at path in the profiling.mode.
+
+    Sketch mode streams profiling.chunk_size rows at a time, so files larger than memory can be profiled, while
+    exact mode loads the whole file. Columns are read with the dtypes inferred from the file.
+    """
+    if cfg.mode not in PROFILE_MODES:
+        msg = f"Unknown profiling mode '{cfg.mode}'."
+        raise ValueError(msg)
+    log.info(f"Profiling {path} in {cfg.mode} mode")
+    if cfg.mode == "exact":
+        return profile_columns(load_data(path), n_top=cfg.n_top)
+    return profile_chunks(
+        iter_data(path, cfg.chunk_size),
+        n_top=cfg.n_top,
+        precision=cfg.hll_precision,
+        width=cfg.cms_width,
+        depth=cfg.cms_depth,
+        n_candidates=cfg.n_candidates,
+    )
+
+
+def log_profile(report: dict, name: str) -> None:
+    """Log the report as profiles/<name>.json and its counts as <column>_<statistic> metrics of the active run."""
+    import mlflow  # noqa: PLC0415
+
+    mlflow.log_dict(report, f"profiles/{name}.json")
+    metrics = {"rows": report["rows"]}
+    for col, profile in report["columns"].items():
+        for key in ("nulls", "distinct", "duplicates"):
+            metrics[f"{col}_{key}"] = profile[key]
+    mlflow.log_metrics(metrics)
+    log.info(f"Profile of {report['rows']} rows logged to MLflow as profiles/{name}.json")
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+from omegaconf import DictConfig
+from prefect.context import TaskRunContext
+
+log = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def hash_file(path: str) -> str:
+    """sha256 of the file contents, read in blocks."""
+    with Path(path).open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def file_fingerprint(path: str, previous: dict | None = None) -> dict:
+    """
+    Size, mtime and content hash of a file.
+
+    The hash is only recomputed when the size or mtime differ from the previous fingerprint, so an unchanged
+    multi-GB input costs a stat rather than a full read.
+    """
+    stat = Path(path).stat()
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        sha256 = previous["sha256"]
+    else:
+        log.info(f"Hashing {path}")
+        sha256 = hash_file(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+
+class StageCache:
+    """
+    Skip a pipeline stage whose inputs and parameters are unchanged since it last wrote its outputs.
+
+    The stage fingerprint is a hash of the input file contents and the parameters. It is stored in a manifest next
+    to the first output when the stage completes, together with the output mtimes, and the stage is fresh while both
+    still match.
+    """
+
+    def __init__(self, name: str, inputs: list[str], outputs: list[str], params: dict) -> None:
+        self.name = name
+        self.inputs = [str(path) for path in inputs]
+        self.outputs = [Path(path) for path in outputs]
+        self.params = params
+        self.manifest_path = self.outputs[0].with_name(self.outputs[0].name + MANIFEST_SUFFIX)
+        self._fingerprints = None
+        self._previous_inputs = {}
+
+    def read_manifest(self) -> dict:
+        if not self.manifest_path.exists():
+            return {}
+        return json.loads(self.manifest_path.read_text())
+
+    def fingerprint(self) -> str:
+        """Hash identifying the stage inputs and parameters."""
+        # Input fingerprints already known, from this run, the manifest or the manifest invalidate removed
+        previous = {**self._previous_inputs, **self.read_manifest().get("inputs", {}), **(self._fingerprints or {})}
+        self._fingerprints = {path: file_fingerprint(path, previous.get(path)) for path in self.inputs}
+        key = {
+            "stage": self.name,
+            "inputs": [self._fingerprints[path]["sha256"] for path in self.inputs],
+            "params": self.params,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def output_mtimes(self) -> dict:
+        return {str(path): path.stat().st_mtime_ns if path.exists() else None for path in self.outputs}
+
+    def is_fresh(self) -> bool:
+        """True if the inputs and parameters match the manifest and no output was removed or rewritten since."""
+        manifest = self.read_manifest()
+        outputs = self.output_mtimes()
+        if not manifest or None in outputs.values() or manifest.get("outputs") != outputs:
+            return False
+        return manifest.get("fingerprint") == self.fingerprint()
+
+    def invalidate(self) -> None:
+        """
+        Drop the manifest before recomputing, so a failed run never leaves stale outputs marked fresh.
+
+        Its input fingerprints are kept, so commit only rehashes the inputs that changed.
+        """
+        self._previous_inputs.update(self.read_manifest().get("inputs", {}))
+        self.manifest_path.unlink(missing_ok=True)
+
+    def commit(self) -> None:
+        """Record the fingerprint of the outputs just written."""
+        manifest = {
+            "stage": self.name,
+            "fingerprint": self.fingerprint(),
+            "inputs": self._fingerprints,
+            "params": self.params,
+            "outputs": self.output_mtimes(),
+        }
+        tmp = self.manifest_path.with_name(self.manifest_path.name + ".partial")
+        tmp.write_text(json.dumps(manifest, indent=2, default=str))
+        tmp.replace(self.manifest_path)
+        log.info(f"Stage {self.name} cached with fingerprint {manifest['fingerprint'][:12]}")
+
+
+def feature_cache(
+    cfg: DictConfig, name: str, outputs: tuple[str, ...] = (), inputs: tuple[str, ...] = (), **params: object
+) -> StageCache:
+    """
+    Cache for a feature stage turning the raw ratings into the processed ratings and interaction matrix.
+
+    Stages writing more files pass them as outputs, along with any other files and params those depend on.
+    """
+    return StageCache(
+        name,
+        inputs=[cfg.data.ratings_raw, *inputs],
+        outputs=[cfg.data.ratings_processed, cfg.data.interactions, *outputs],
+        params={
+            "data_version": cfg.data.version,
+            "format": cfg.data.format,
+            "n_rows": cfg.exp.n_rows,
+            "min_movie_rating_count": cfg.exp.min_movie_rating_count,
+            **params,
+        },
+    )
+
+
+# Fingerprints computed in this process, reused by path while the file's size and mtime are unchanged
+_fingerprints: dict[str, dict] = {}
+
+
+def fingerprint_cache_key(context: TaskRunContext, parameters: dict) -> str:
+    """
+    Prefect cache key built from the task name and its parameters, with each file path replaced by its content hash.
+
+    Tasks using it should take paths and plain values, not frames, so the key is cheap to compute and a rewritten
+    input file invalidates the cached result even if its path is unchanged.
+    """
+    key = {}
+    for name, value in sorted(parameters.items()):
+        key[name] = value
+        if isinstance(value, str | Path) and Path(value).is_file():
+            _fingerprints[str(value)] = file_fingerprint(value, _fingerprints.get(str(value)))
+            key[name] = _fingerprints[str(value)]["sha256"]
+    payload = json.dumps({"task": context.task.name, "parameters": key}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
@@ -1,5 +1,9 @@
+import contextlib
 import logging
+import queue
+import threading
 import zipfile
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 
 import numpy as np
@@ -9,23 +13,25 @@ from tqdm import tqdm
 
 from movielens.conf.schema import DataColumnsConfig
 
+from .storage import cast_dtypes, get_storage, infer_format, remove_path
+
 log = logging.getLogger(__name__)
 ccfg = DataColumnsConfig
 
 
 def split(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
     """split the df into x,y"""
-    x = df[[ccfg.user_id, ccfg.movie_id]]
+    x = df.drop(columns=ccfg.rating)
     y = df[ccfg.rating]
 
     return x, y
 
 
-def remove_nulls(df: pd.DataFrame, subset: list | None = None) -> pd.DataFrame:
-    """Remove rows with null values from the DataFrame."""
+def remove_nulls(df: pd.DataFrame, subset: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+    """Remove rows with null values from the DataFrame, then cast the columns to dtypes if given."""
     df = df.dropna(subset=subset).reset_index(drop=True)
     log.debug(f"After dropping nulls: {len(df)}")
-    return df
+    return cast_dtypes(df, dtypes)
 
 
 def keep_by_value(
@@ -37,15 +43,19 @@ def keep_by_value(
     log.debug(f"After removing by range: {len(df)}")
 
 
+def valid_by_count(counts: pd.Series, min_count: float | None = None, max_count: float | None = None) -> pd.Index:
+    """Return the values whose frequency count is within the min/max bounds."""
+    valid = counts[counts > min_count] if min_count is not None else counts
+    valid = valid[valid < max_count] if max_count is not None else valid
+    return valid.index
+
+
 def keep_by_count(
     df: pd.DataFrame, col: str, min_count: float | None = None, max_count: float | None = None
 ) -> pd.DataFrame:
     """Keep rows from the DataFrame based on the frequency count of values in a given column."""
     counts = df[col].value_counts()
-
-    valid = counts[counts > min_count] if min_count is not None else counts
-    valid = valid[valid < max_count] if max_count is not None else valid
-    valid_values = valid.index
+    valid_values = valid_by_count(counts, min_count=min_count, max_count=max_count)
 
     cleaned_df = df[df[col].isin(valid_values)].reset_index(drop=True)
     log.debug(f"After remove by count: {len(df)}")
@@ -64,29 +74,136 @@ def balance_col(df: pd.DataFrame, col: str, random_state: int) -> pd.DataFrame:
     return balanced_df
 
 
-def load_data(path: str, n: int | None = None) -> pd.DataFrame:
-    """Load movielens data to df. Ratings by default."""
+def load_data(path: str, n: int | None = None, fmt: str | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+    """Load movielens data to df. Ratings by default. The format is inferred from the suffix unless given."""
     log.info("loading data")
-    df = pd.read_csv(path)[:]
-
-    if n:
-        return df[:n]
-    return df
+    storage = get_storage(fmt or infer_format(path))
+    return storage.read(Path(path), n=n, dtypes=dtypes)
 
 
-def write_data(df: pd.DataFrame, path: str) -> pd.DataFrame:
-    """Write movielens data to df. Ratings by default."""
+def write_data(df: pd.DataFrame, path: str, fmt: str | None = None) -> pd.DataFrame:
+    """Write movielens data to df. Ratings by default. The format is inferred from the suffix unless given."""
     log.info("writing data")
     path = Path(path)
     path.parent.mkdir(exist_ok=True, parents=True)
-    if path.exists():
+    try:
+        remove_path(path)
+    except Exception:
+        msg = f"Could not delete original {path}"
+        log.exception(msg)
+        raise
+    storage = get_storage(fmt or infer_format(path))
+    storage.write(df, path)
+
+
+def iter_data(
+    path: str, chunksize: int, n: int | None = None, fmt: str | None = None, dtypes: dict | None = None
+) -> Iterator[pd.DataFrame]:
+    """Stream movielens data in chunks of at most chunksize rows, stopping after n rows in total."""
+    log.info(f"streaming data in chunks of {chunksize}")
+    storage = get_storage(fmt or infer_format(path))
+    yield from storage.iter_chunks(Path(path), chunksize, n=n, dtypes=dtypes)
+
+
+def count_rows(path: str, fmt: str | None = None) -> int:
+    """Number of rows in the data file at path, read from the file metadata where the format has it."""
+    return get_storage(fmt or infer_format(path)).num_rows(Path(path))
+
+
+def read_slice(path: str, start: int, stop: int, fmt: str | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+    """Read rows [start, stop) of the data file at path, without loading the rest where the format allows."""
+    return get_storage(fmt or infer_format(path)).read_slice(Path(path), start, stop, dtypes=dtypes)
+
+
+def prefetch(items: Iterable, depth: int = 1) -> Iterator:
+    """
+    Iterate items while a background thread produces up to depth of the next ones.
+
+    Reading and parsing the next chunk then overlaps with the work on the current one, as file reads and most of
+    pyarrow's decoding release the GIL. An exception in the producer is raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=max(depth, 1))
+    done = object()
+    stop = threading.Event()
+
+    def produce() -> None:
         try:
-            path.unlink()
-        except Exception:
-            msg = "Could not delete original csv"
-            log.exception(msg)
-            raise
-    df.to_csv(path, index=False)
+            for item in items:
+                if stop.is_set():
+                    return
+                buffer.put((item, None))
+            buffer.put((done, None))
+        except Exception as e:  # noqa: BLE001
+            buffer.put((done, e))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # Unblock a producer waiting on a full buffer when the consumer stops early
+        stop.set()
+        while thread.is_alive():
+            with contextlib.suppress(queue.Empty):
+                buffer.get_nowait()
+            thread.join(timeout=0.01)
+
+
+def write_data_chunks(chunks: Iterable[pd.DataFrame], path: str, fmt: str | None = None) -> int:
+    """Write a stream of chunks to a single file without holding them all in memory. Returns the rows written."""
+    log.info("writing data in chunks")
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    remove_path(path)
+    storage = get_storage(fmt or infer_format(path))
+    return storage.write_chunks(chunks, path)
+
+
+def count_by_chunks(chunks: Iterable[pd.DataFrame], col: str) -> pd.Series:
+    """Return the frequency count of values in a column over a stream of chunks."""
+    counts = pd.Series(dtype="int64")
+    for chunk in chunks:
+        counts = counts.add(chunk[col].value_counts(), fill_value=0)
+    return counts.astype("int64")
+
+
+def to_columnar(path: str, fmt: str, dtypes: dict | None = None, chunksize: int = 1_000_000) -> Path:
+    """
+    Return a columnar copy of a csv file, converting it once on first use.
+
+    The copy sits next to the csv with the format as its suffix, e.g. ratings.csv -> ratings.parquet, and is
+    rebuilt if the csv is newer. Csv input with fmt="csv" is returned unchanged.
+
+    Args:
+        path (str): The path to the source csv file.
+        fmt (str): The target storage format, one of STORAGE_REGISTRY.
+        dtypes (dict): Column dtypes applied while parsing the csv.
+        chunksize (int): Rows converted at a time, bounding memory use.
+
+    """
+    path = Path(path)
+    if fmt == "csv" or infer_format(path) != "csv":
+        return path
+
+    target = path.with_suffix(f".{fmt}")
+    if target.exists() and target.stat().st_mtime >= path.stat().st_mtime:
+        return target
+
+    log.info(f"Converting {path} to {fmt}")
+    # Write to a temporary name first so an interrupted conversion is never mistaken for a finished one
+    partial = target.with_name(f"{target.name}.partial")
+    chunks = iter_data(path, chunksize, fmt="csv", dtypes=dtypes)
+    write_data_chunks(chunks, partial, fmt=fmt)
+    remove_path(target)
+    partial.rename(target)
+    log.info(f"Conversion complete. Columnar copy saved to {target}")
+    return target
 
 
 def unzip_file(zip_path: str, extract_to: str) -> None:
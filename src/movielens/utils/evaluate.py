@@ -1,13 +1,17 @@
 # src/evaluation.py
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
 from movielens.conf.schema import DataColumnsConfig
 from movielens.models.base import BaseRecommender
 
+from .instrument import instrument
+
 log = logging.getLogger(__name__)
 ccfg = DataColumnsConfig
 
@@ -15,6 +19,7 @@ ccfg = DataColumnsConfig
 log = logging.getLogger(__name__)
 
 
+@instrument("evaluation.rating_metrics")
 def evaluate_model(model: BaseRecommender, df: pd.DataFrame) -> dict:
     """
     Evaluate the model on the test set using multiple metrics.
@@ -48,6 +53,7 @@ def evaluate_model(model: BaseRecommender, df: pd.DataFrame) -> dict:
     return {"metrics": {"rmse": rmse, "mae": mae, "r2": r2}, "preds": preds, "truths": truths}
 
 
+@instrument("evaluation.rating_metrics")
 def evaluate_model_xy(model: BaseRecommender, x: np.ndarray, y: np.ndarray) -> dict:
     """
     Evaluate the model on the test set using multiple metrics.
@@ -70,7 +76,7 @@ def evaluate_model_xy(model: BaseRecommender, x: np.ndarray, y: np.ndarray) -> d
     # Predict ratings using the model. Assume cfg contains keys for column names.
     log.info(f"{model}, {len(x)}, {len(y)}")
 
-    preds = model.predict(x)
+    preds = model.predict_frame(x)
     truths = y
 
     log.info(f"{len(truths)}, {len(preds)}")
@@ -83,3 +89,100 @@ def evaluate_model_xy(model: BaseRecommender, x: np.ndarray, y: np.ndarray) -> d
     log.info(f"Evaluation metrics: RMSE={rmse}, MAE={mae}, R2={r2}")
 
     return {"metrics": {"rmse": rmse, "mae": mae, "r2": r2}, "preds": preds, "truths": truths}
+
+
+def ranking_sums(recs: np.ndarray, truth: sp.csr_matrix, k: int) -> dict:
+    """
+    Sum precision, recall, NDCG and average precision at k over the rows of a top-k array.
+
+    Row i of recs holds the recommended item ids for user i (best first, -1 padded) and row i of truth has the
+    relevant item ids of the same user as its columns. Rows without relevant items are skipped. All users are
+    scored at once: hits are found by binary search of (row, item) keys against the sorted truth keys.
+    """
+    recs = recs[:, :k]
+    truth = truth.tocsr()
+    truth.sort_indices()
+    n_rel = np.diff(truth.indptr)
+    rows = np.arange(len(recs))
+
+    n_cols = max(truth.shape[1], 1)
+    truth_keys = np.repeat(rows, n_rel).astype(np.int64) * n_cols + truth.indices
+    rec_keys = rows[:, None].astype(np.int64) * n_cols + recs
+    pos = np.searchsorted(truth_keys, rec_keys).clip(max=max(len(truth_keys) - 1, 0))
+    in_range = (recs >= 0) & (recs < n_cols)
+    hits = in_range & (truth_keys[pos] == rec_keys) if len(truth_keys) else np.zeros(recs.shape, dtype=bool)
+
+    scored = n_rel > 0
+    hits, n_rel = hits[scored].astype(np.float64), n_rel[scored]
+    n_ideal = np.minimum(n_rel, k)
+    discounts = 1.0 / np.log2(np.arange(2, recs.shape[1] + 2))
+    ideal_dcg = np.cumsum(1.0 / np.log2(np.arange(2, k + 2)))[n_ideal - 1]
+    precision_at = np.cumsum(hits, axis=1) / np.arange(1, recs.shape[1] + 1)
+
+    return {
+        "users": int(scored.sum()),
+        "precision": float((hits.sum(axis=1) / k).sum()),
+        "recall": float((hits.sum(axis=1) / n_rel).sum()),
+        "ndcg": float(((hits * discounts).sum(axis=1) / ideal_dcg).sum()),
+        "map": float(((precision_at * hits).sum(axis=1) / n_ideal).sum()),
+    }
+
+
+def ranking_metrics(recs: np.ndarray, truth: sp.csr_matrix, k: int, n_jobs: int = 1, chunk_size: int = 50_000) -> dict:
+    """
+    Mean precision, recall, NDCG and MAP at k over users with at least one relevant item.
+
+    With n_jobs > 1 and more than chunk_size users, chunks of users are scored in a process pool.
+    """
+    truth = truth.tocsr()
+    starts = range(0, len(recs), chunk_size)
+    chunks = [(recs[s : s + chunk_size], truth[s : s + chunk_size], k) for s in starts]
+    if n_jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(ranking_sums, *zip(*chunks, strict=True)))
+    else:
+        parts = [ranking_sums(*chunk) for chunk in chunks]
+
+    users = sum(part["users"] for part in parts)
+    names = ["precision", "recall", "ndcg", "map"]
+    return {f"{name}_at_{k}": sum(part[name] for part in parts) / users if users else 0.0 for name in names}
+
+
+@instrument("evaluation.ranking_metrics")
+def evaluate_ranking(  # noqa: PLR0913
+    model: BaseRecommender,
+    users: np.ndarray,
+    movies: np.ndarray,
+    ratings: np.ndarray,
+    *,
+    k: int = 10,
+    relevance_threshold: float = 4.0,
+    max_users: int | None = None,
+    n_jobs: int = 1,
+    seed: int = 42,
+) -> dict:
+    """
+    Evaluate top-k recommendations against held-out ratings.
+
+    A test rating at or above relevance_threshold makes the movie relevant for that user. Every test user with a
+    relevant movie gets one row of recommendations from model.recommend_batch, optionally capped to a random
+    sample of max_users users.
+    """
+    users, movies, ratings = np.asarray(users), np.asarray(movies), np.asarray(ratings)
+    relevant = ratings >= relevance_threshold
+    eval_users, rows = np.unique(users[relevant], return_inverse=True)
+    if max_users and len(eval_users) > max_users:
+        keep = np.sort(np.random.default_rng(seed).choice(len(eval_users), size=max_users, replace=False))
+        mask = np.isin(rows, keep)
+        eval_users, rows = eval_users[keep], np.searchsorted(keep, rows[mask])
+        relevant[relevant] = mask
+    log.info(f"Ranking evaluation over {len(eval_users)} users at k={k}")
+
+    truth = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, movies[relevant])),
+        shape=(len(eval_users), int(movies.max()) + 1 if len(movies) else 1),
+    )
+    recs = model.recommend_batch(eval_users, k)
+    metrics = ranking_metrics(recs, truth, k, n_jobs=n_jobs)
+    log.info(f"Ranking metrics: {metrics}")
+    return metrics
@@ -0,0 +1,236 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class StageRecord:
+    """Measurements of one run of a pipeline stage."""
+
+    name: str
+    start: float
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_rss_mb: float | None = None
+    rows: int | None = None
+    thread: int = field(default_factory=threading.get_ident)
+
+    @property
+    def rows_per_s(self) -> float | None:
+        return self.rows / self.wall_s if self.rows is not None and self.wall_s > 0 else None
+
+
+class Instrumentation:
+    """
+    Collects stage records for the current process until they are logged.
+
+    Records are kept in memory because most stages, e.g. the feature flow, finish before the MLflow run exists.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = True
+        self.trace_path = None
+        self.profile_dir = None
+        self.records: list[StageRecord] = []
+        # Stages open in any thread, and whether one of them is profiling, as RSS and profilers are process-wide
+        self.open_stages = 0
+        self.profiling = False
+        self._lock = threading.Lock()
+
+    def configure(self, cfg: DictConfig) -> None:
+        """Apply the instrumentation config section."""
+        self.enabled = cfg.enabled
+        self.trace_path = cfg.trace
+        self.profile_dir = cfg.profile_dir if cfg.profile else None
+
+    def add(self, record: StageRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def open_stage(self) -> tuple[bool, bool]:
+        """Count a stage opening: whether it is the only open stage and whether it gets the profiler."""
+        with self._lock:
+            outermost = self.open_stages == 0
+            self.open_stages += 1
+            profile = bool(self.profile_dir) and not self.profiling
+            self.profiling = self.profiling or profile
+        return outermost, profile
+
+    def close_stage(self, *, profiled: bool) -> None:
+        with self._lock:
+            self.open_stages -= 1
+            self.profiling = self.profiling and not profiled
+
+    def drain(self) -> list[StageRecord]:
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def _read_status(field: str) -> int | None:
+    """A memory field of /proc/self/status in bytes, None where procfs is unavailable."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss() -> int | None:
+    """Reset the process RSS high-water mark (Linux only) and return the current RSS in bytes."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        return None
+    return _read_status("VmRSS")
+
+
+def peak_rss() -> int | None:
+    """The process RSS high-water mark in bytes since the last reset (Linux only)."""
+    return _read_status("VmHWM")
+
+
+def current_rss() -> int | None:
+    """The process RSS in bytes (Linux only)."""
+    return _read_status("VmRSS")
+
+
+def _stage_peak(start: tuple[int | None, int | None], end: tuple[int | None, int | None]) -> float | None:
+    """
+    Peak RSS in MB of a stage from the (RSS, high-water mark) at its start and end: the high-water mark if the stage
+    raised it, otherwise the larger of its start and end RSS, a lower bound below an earlier peak.
+    """
+    (start_rss, start_hwm), (end_rss, end_hwm) = start, end
+    if None in (start_rss, start_hwm, end_rss, end_hwm):
+        return None
+    peak = end_hwm if end_hwm > start_hwm else max(start_rss, end_rss)
+    return peak / 2**20
+
+
+@contextmanager
+def stage(name: str, rows: int | None = None) -> Iterator[StageRecord]:
+    """
+    Measure wall time, CPU time and peak RSS of the enclosed block as the stage name.
+
+    rows, set up front or on the yielded record, gives the stage throughput. The RSS high-water mark is process-wide,
+    so it is only reset when no stage is open in any thread; a stage's peak is the high-water mark if it raised it
+    during the stage. Only the outermost open stage is profiled, as a second profiler would displace the first.
+    """
+    if not INSTRUMENTATION.enabled:
+        yield StageRecord(name, time.time(), rows=rows)
+        return
+
+    record = StageRecord(name, time.time(), rows=rows)
+    outermost, profiled = INSTRUMENTATION.open_stage()
+    start = (reset_peak_rss() if outermost else current_rss(), peak_rss())
+    profiler = cProfile.Profile() if profiled else None
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+        record.wall_s = time.perf_counter() - wall
+        record.cpu_s = time.process_time() - cpu
+        record.peak_rss_mb = _stage_peak(start, (current_rss(), peak_rss()))
+        INSTRUMENTATION.close_stage(profiled=profiled)
+        INSTRUMENTATION.add(record)
+        if profiler:
+            Path(INSTRUMENTATION.profile_dir).mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(Path(INSTRUMENTATION.profile_dir) / f"{name}.prof")
+        log.debug(f"Stage {name}: {record.wall_s:.3f}s wall, {record.cpu_s:.3f}s cpu")
+
+
+def _count_rows(result: object, args: tuple) -> int | None:
+    """Rows handled by a stage: the length of the frame or array it returned, else of its first frame argument."""
+    for value in (result, *args):
+        if isinstance(value, pd.DataFrame | pd.Series | np.ndarray):
+            return len(value)
+    return None
+
+
+def instrument(name: str) -> Callable:
+    """Decorator running the function as the stage name. Place it under @task or @flow so it wraps the body."""
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):  # noqa: ANN002, ANN003, ANN202
+            with stage(name) as record:
+                result = fn(*args, **kwargs)
+                record.rows = _count_rows(result, args)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def chrome_trace(records: list[StageRecord]) -> dict:
+    """Records as complete events of the Chrome trace format, viewable in chrome://tracing or Perfetto."""
+    events = [
+        {
+            "name": record.name,
+            "cat": record.name.split(".")[0],
+            "ph": "X",
+            "ts": record.start * 1e6,
+            "dur": record.wall_s * 1e6,
+            "pid": os.getpid(),
+            "tid": record.thread,
+            "args": {"cpu_s": record.cpu_s, "peak_rss_mb": record.peak_rss_mb, "rows": record.rows},
+        }
+        for record in records
+    ]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def log_stages() -> None:
+    """
+    Log every stage recorded so far to the active MLflow run and clear them.
+
+    Each stage becomes <name>_wall_s, <name>_cpu_s, <name>_peak_rss_mb and <name>_rows_per_s metrics, with the step
+    counting repeated runs of the same stage. The Chrome trace and any cProfile dumps are logged as artifacts.
+    """
+    import mlflow  # noqa: PLC0415
+
+    records = INSTRUMENTATION.drain()
+    if not records or not mlflow.active_run():
+        return
+    runs = {}
+    for record in records:
+        step = runs[record.name] = runs.get(record.name, -1) + 1
+        metrics = {"wall_s": record.wall_s, "cpu_s": record.cpu_s}
+        if record.peak_rss_mb is not None:
+            metrics["peak_rss_mb"] = record.peak_rss_mb
+        if record.rows_per_s is not None:
+            metrics["rows_per_s"] = record.rows_per_s
+        mlflow.log_metrics({f"{record.name}_{key}": value for key, value in metrics.items()}, step=step)
+
+    if INSTRUMENTATION.trace_path:
+        trace_path = Path(INSTRUMENTATION.trace_path)
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        trace_path.write_text(json.dumps(chrome_trace(records)))
+        mlflow.log_artifact(trace_path, artifact_path="instrumentation")
+    if INSTRUMENTATION.profile_dir and Path(INSTRUMENTATION.profile_dir).exists():
+        mlflow.log_artifacts(INSTRUMENTATION.profile_dir, artifact_path="instrumentation/profiles")
+    log.info(f"Logged {len(records)} stage measurements")
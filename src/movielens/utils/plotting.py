@@ -1,14 +1,43 @@
 # plotting.py
 import logging
 
-import matplotlib.pyplot as plt
 import mlflow
 import numpy as np
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+from mlflow import MlflowClient
 from omegaconf import DictConfig
+from prefect import task
+from prefect.cache_policies import NO_CACHE
+
+from .instrument import instrument
 
 log = logging.getLogger(__name__)
 
 
+def subsample(truths: np.ndarray, preds: np.ndarray, max_points: int | None, seed: int) -> tuple:
+    """At most max_points aligned pairs, drawn without replacement with a fixed seed so plots are reproducible."""
+    if not max_points or len(truths) <= max_points:
+        return truths, preds
+    rows = np.sort(np.random.default_rng(seed).choice(len(truths), max_points, replace=False))
+    return truths[rows], preds[rows]
+
+
+def calibration_curve(truths: np.ndarray, preds: np.ndarray, n_bins: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mean prediction and mean true rating in each of n_bins quantile bins of the predictions.
+
+    Quantile edges give every bin about the same number of points, so sparse tails do not produce noisy bins.
+    """
+    edges = np.unique(np.quantile(preds, np.linspace(0, 1, n_bins + 1)))
+    bins = np.clip(np.searchsorted(edges, preds, side="right") - 1, 0, max(len(edges) - 2, 0))
+    counts = np.bincount(bins, minlength=len(edges) - 1)
+    filled = counts > 0
+    mean_pred = np.bincount(bins, weights=preds, minlength=len(counts))[filled] / counts[filled]
+    mean_truth = np.bincount(bins, weights=truths, minlength=len(counts))[filled] / counts[filled]
+    return mean_pred, mean_truth
+
+
 class Plotter:
     def __init__(self, cfg: DictConfig) -> None:
         """
@@ -17,46 +46,79 @@ class Plotter:
         """
         self.cfg = cfg
 
-    def get_predictions_vs_truth_figure(self, truths: list, preds: list) -> plt:
+    def get_predictions_vs_truth_figure(self, truths: np.ndarray, preds: np.ndarray) -> Figure:
         """
-        Generate a Matplotlib figure comparing predictions against true values.
+        Generate a Matplotlib figure of the joint density of predictions and true values as a 2D histogram.
         """
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.scatter(truths, preds, alpha=0.6)
-        ax.plot([min(truths), max(truths)], [min(truths), max(truths)], color="red", lw=2)
+        low, high = float(min(truths.min(), preds.min())), float(max(truths.max(), preds.max()))
+        counts, x_edges, y_edges = np.histogram2d(truths, preds, bins=self.cfg.plots.bins, range=[[low, high]] * 2)
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap="viridis")
+        fig.colorbar(mesh, ax=ax, label="Count")
+        ax.plot([low, high], [low, high], color="red", lw=2)
         ax.set_xlabel("True Ratings")
         ax.set_ylabel("Predicted Ratings")
         ax.set_title("Predictions vs. True Ratings")
         fig.tight_layout()
         return fig
 
-    def get_error_distribution_figure(self, truths: list, preds: list) -> plt:
+    def get_error_distribution_figure(self, truths: np.ndarray, preds: np.ndarray) -> Figure:
         """
         Generate a Matplotlib figure showing a histogram of prediction errors.
         """
-        truths_arr = np.array(truths)
-        preds_arr = np.array(preds)
-        errors = preds_arr - truths_arr
-
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.hist(errors, bins=30, alpha=0.7)
+        counts, edges = np.histogram(preds - truths, bins=self.cfg.plots.bins)
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        ax.stairs(counts, edges, fill=True, alpha=0.7)
         ax.set_xlabel("Prediction Error")
         ax.set_ylabel("Frequency")
         ax.set_title("Distribution of Prediction Errors")
         fig.tight_layout()
         return fig
 
-    def log_plots(self, truths: list, preds: list) -> None:
+    def get_calibration_figure(self, truths: np.ndarray, preds: np.ndarray) -> Figure:
+        """
+        Generate a Matplotlib figure of the mean true rating against the mean prediction per prediction quantile.
         """
-        Generate figures and log them as MLflow artifacts using mlflow.log_figure.
+        mean_pred, mean_truth = calibration_curve(truths, preds, self.cfg.plots.calibration_bins)
+        low, high = float(min(mean_pred.min(), mean_truth.min())), float(max(mean_pred.max(), mean_truth.max()))
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        ax.plot(mean_pred, mean_truth, marker="o")
+        ax.plot([low, high], [low, high], color="red", lw=2, linestyle="--")
+        ax.set_xlabel("Mean Predicted Rating")
+        ax.set_ylabel("Mean True Rating")
+        ax.set_title("Calibration by Prediction Quantile")
+        fig.tight_layout()
+        return fig
+
+    @task(cache_policy=NO_CACHE)
+    @instrument("plotting.log_plots")
+    def log_plots(self, truths: np.ndarray, preds: np.ndarray, run_id: str | None = None) -> None:
         """
-        fig1 = self.get_predictions_vs_truth_figure(truths, preds)
-        fig2 = self.get_error_distribution_figure(truths, preds)
+        Generate figures and log them as MLflow artifacts of run_id, by default the active run.
 
-        mlflow.log_figure(fig1, artifact_file="plots/pred_vs_truth.png")
-        mlflow.log_figure(fig2, artifact_file="plots/error_distribution.png")
+        Every figure is drawn from NumPy aggregates (histograms and quantile bins) rather than one marker per point,
+        optionally over a plots.max_points subsample. Figures are built with the object-oriented API rather than
+        pyplot and logged with an explicit run id, so this can run off the main thread.
+        """
+        run_id = run_id or mlflow.active_run().info.run_id
+        truths = np.asarray(truths, dtype=np.float64)
+        preds = np.asarray(preds, dtype=np.float64)
+        if len(truths) == 0:
+            log.warning("No predictions to plot")
+            return
+        plots = self.cfg.plots
+        truths, preds = subsample(truths, preds, plots.max_points, plots.seed)
 
-        plt.close(fig1)
-        plt.close(fig2)
+        client = MlflowClient()
+        figures = {
+            plots.pred_vs_truth: self.get_predictions_vs_truth_figure,
+            plots.error_distribution: self.get_error_distribution_figure,
+            plots.calibration: self.get_calibration_figure,
+        }
+        for name, get_figure in figures.items():
+            client.log_figure(run_id, get_figure(truths, preds), artifact_file=f"plots/{name}")
 
-        log.info("Plots logged to MLflow")
+        log.info(f"Plots of {len(truths)} predictions logged to MLflow")
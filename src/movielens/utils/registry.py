@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+from collections.abc import Iterator
+from pathlib import Path
+
+import mlflow
+import pandas as pd
+from mlflow.data.meta_dataset import MetaDataset
+from mlflow.data.sources import LocalArtifactDatasetSource
+
+from .analysis import FrameSketch, profile_columns
+from .cache import file_fingerprint
+from .dataset import iter_data, load_data, write_data, write_data_chunks
+
+log = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+META_FILE = "meta.json"
+DATA_FILE = "data.parquet"
+
+
+class DatasetRegistry:
+    """
+    Content-addressed store of processed datasets.
+
+    A dataset is identified by the sha256 digest of its processed file (or of every file in a processed directory)
+    and written once, as parquet, under root/<digest>. Runs log the digest, a reference to the stored copy and a
+    small profile instead of uploading the data again.
+
+    With chunk_size, datasets are copied and profiled (with sketches) a chunk at a time instead of being loaded.
+    """
+
+    def __init__(self, root: str, chunk_size: int | None = None) -> None:
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+
+    def digest(self, path: str) -> str:
+        """
+        Content digest of a processed file or directory.
+
+        File hashes are kept in root/index.json by path, size and mtime, so an unchanged dataset is not re-read.
+        """
+        path = Path(path)
+        index_path = self.root / INDEX_FILE
+        index = json.loads(index_path.read_text()) if index_path.exists() else {}
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        digest = hashlib.sha256()
+        for file in files:
+            index[str(file)] = file_fingerprint(file, index.get(str(file)))
+            digest.update(f"{file.relative_to(path) if path.is_dir() else ''}:{index[str(file)]['sha256']}".encode())
+        self.root.mkdir(parents=True, exist_ok=True)
+        index_path.write_text(json.dumps(index, indent=2))
+        return digest.hexdigest()
+
+    def register(self, path: str) -> dict:
+        """Store the processed dataset at path unless a dataset with the same digest is already stored."""
+        digest = self.digest(path)
+        entry = self.root / digest
+        if (entry / META_FILE).exists():
+            log.info(f"Dataset {digest[:12]} already registered")
+            return json.loads((entry / META_FILE).read_text())
+
+        entry.mkdir(parents=True, exist_ok=True)
+        if self.chunk_size:
+            profile = self.copy_chunks(path, entry / DATA_FILE)
+        else:
+            df = load_data(path)
+            write_data(df, entry / DATA_FILE, fmt="parquet")
+            profile = profile_columns(df)
+        meta = {"digest": digest, "source": str(path), "data": str(entry / DATA_FILE), "profile": profile}
+        # meta.json is written last, so an interrupted registration is simply redone
+        (entry / META_FILE).write_text(json.dumps(meta, indent=2))
+        log.info(f"Registered dataset {digest[:12]} at {entry}")
+        return meta
+
+    def copy_chunks(self, path: str, target: Path) -> dict:
+        """Copy the dataset to parquet a chunk at a time, profiling the chunks as they pass."""
+        sketch = FrameSketch()
+
+        def profiled(chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+            for chunk in chunks:
+                sketch.update(chunk)
+                yield chunk
+
+        write_data_chunks(profiled(iter_data(path, self.chunk_size)), target, fmt="parquet")
+        return sketch.report()
+
+
+def log_dataset(registry: DatasetRegistry, path: str, name: str = "ratings") -> dict:
+    """Register the dataset at path and log it to the active MLflow run by reference: digest, location and profile."""
+    meta = registry.register(path)
+    dataset = MetaDataset(source=LocalArtifactDatasetSource(meta["data"]), name=name, digest=meta["digest"][:16])
+    mlflow.log_input(dataset, context="training")
+    mlflow.log_param("data_digest", meta["digest"][:16])
+    mlflow.log_dict(meta["profile"], f"data/{name}_profile.json")
+    return meta
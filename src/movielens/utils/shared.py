@@ -0,0 +1,75 @@
+import logging
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Self
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SharedArraySpec:
+    """Picklable description of an array in a shared memory segment."""
+
+    name: str
+    shape: tuple
+    dtype: str
+
+    def attach(self) -> tuple[SharedMemory, np.ndarray]:
+        """Map the segment and view it as the array, without copying. Keep the segment open while the view is used."""
+        # Pool workers share the owner's resource tracker, so attaching does not make them unlink the segment on exit
+        shm = SharedMemory(name=self.name)
+        return shm, np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+
+class SharedArrays:
+    """
+    Copies of numpy arrays in shared memory, owned by the creating process.
+
+    Worker processes receive the small specs and map the same memory instead of unpickling their own copy of the
+    data. Use as a context manager so the segments are unlinked when the workers are done.
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        self.segments = []
+        self.specs = {}
+        for key, array in arrays.items():
+            shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.segments.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            self.specs[key] = SharedArraySpec(shm.name, array.shape, array.dtype.str)
+        log.info(f"Shared {len(arrays)} arrays, {sum(a.nbytes for a in arrays.values()) / 2**20:.1f}MB")
+
+    @classmethod
+    def from_frames(cls, frames: dict[str, pd.DataFrame]) -> "SharedArrays":
+        """Share the columns of each frame under <frame>/<column> keys."""
+        return cls({f"{name}/{column}": df[column].to_numpy() for name, df in frames.items() for column in df.columns})
+
+    def close(self) -> None:
+        for shm in self.segments:
+            shm.close()
+            shm.unlink()
+        self.segments = []
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def attach_frames(specs: dict[str, SharedArraySpec]) -> tuple[dict[str, pd.DataFrame], list[SharedMemory]]:
+    """
+    Rebuild the frames shared with SharedArrays.from_frames in a worker.
+
+    Returns the frames and the open segments, which must be closed only once the frames are no longer used.
+    """
+    segments, columns = [], {}
+    for key, spec in specs.items():
+        shm, array = spec.attach()
+        segments.append(shm)
+        frame, column = key.split("/", 1)
+        columns.setdefault(frame, {})[column] = array
+    return {frame: pd.DataFrame(cols, copy=False) for frame, cols in columns.items()}, segments
@@ -0,0 +1,355 @@
+import json
+import logging
+import shutil
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import feather
+
+log = logging.getLogger(__name__)
+
+
+class BaseStorage(ABC):
+    """Base class for reading and writing a DataFrame in a given file format."""
+
+    @abstractmethod
+    def read(self, path: Path, n: int | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        """Read at most n rows from path, casting to dtypes if given."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, df: pd.DataFrame, path: Path) -> None:
+        """Write the DataFrame to path."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_chunks(
+        self, path: Path, chunksize: int, n: int | None = None, dtypes: dict | None = None
+    ) -> Iterator[pd.DataFrame]:
+        """Yield chunks of at most chunksize rows, stopping after n rows in total."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_chunks(self, chunks: Iterable[pd.DataFrame], path: Path) -> int:
+        """Write chunks to path one at a time and return the number of rows written."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def num_rows(self, path: Path) -> int:
+        """Number of rows in path."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_slice(self, path: Path, start: int, stop: int, dtypes: dict | None = None) -> pd.DataFrame:
+        """Read rows [start, stop) of path, casting to dtypes if given."""
+        raise NotImplementedError
+
+
+def _limit(chunks: Iterable[pd.DataFrame], n: int | None) -> Iterator[pd.DataFrame]:
+    """Truncate a stream of chunks after n rows in total."""
+    remaining = n
+    for chunk in chunks:
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            chunk = chunk[:remaining]  # noqa: PLW2901
+            remaining -= len(chunk)
+        yield chunk
+
+
+def nullable_dtypes(dtypes: dict | None) -> dict | None:
+    """dtypes with integer types swapped for their nullable versions, e.g. int32 -> Int32, to parse missing values."""
+    if not dtypes:
+        return dtypes
+    return {
+        col: np.dtype(dtype).name.capitalize() if pd.api.types.is_integer_dtype(dtype) else dtype
+        for col, dtype in dtypes.items()
+    }
+
+
+def cast_dtypes(df: pd.DataFrame, dtypes: dict | None) -> pd.DataFrame:
+    """
+    Cast columns to dtypes, skipping any that already match.
+
+    Integer columns with missing values are cast to the nullable version of their dtype instead, so the rows can
+    still be dropped by remove_nulls and the column cast again afterwards.
+    """
+    if not dtypes:
+        return df
+    nullable = nullable_dtypes(dtypes)
+    todo = {}
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        target = nullable[col] if df[col].hasnans else dtype
+        if df[col].dtype != target:
+            todo[col] = target
+    return df.astype(todo, copy=False) if todo else df
+
+
+class CsvStorage(BaseStorage):
+    def read(self, path: Path, n: int | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        return cast_dtypes(pd.read_csv(path, nrows=n, dtype=nullable_dtypes(dtypes)), dtypes)
+
+    def write(self, df: pd.DataFrame, path: Path) -> None:
+        df.to_csv(path, index=False)
+
+    def iter_chunks(
+        self, path: Path, chunksize: int, n: int | None = None, dtypes: dict | None = None
+    ) -> Iterator[pd.DataFrame]:
+        with pd.read_csv(path, chunksize=chunksize, nrows=n, dtype=nullable_dtypes(dtypes)) as reader:
+            for chunk in reader:
+                yield cast_dtypes(chunk, dtypes)
+
+    def write_chunks(self, chunks: Iterable[pd.DataFrame], path: Path) -> int:
+        rows = 0
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+            rows += len(chunk)
+        return rows
+
+    def num_rows(self, path: Path) -> int:
+        with path.open("rb") as f:
+            return max(sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")) - 1, 0)
+
+    def read_slice(self, path: Path, start: int, stop: int, dtypes: dict | None = None) -> pd.DataFrame:
+        # Csv has no row index, so the skipped rows are still parsed: too slow to read a large file a slice at a time
+        df = pd.read_csv(path, skiprows=range(1, start + 1), nrows=stop - start, dtype=nullable_dtypes(dtypes))
+        return cast_dtypes(df, dtypes)
+
+
+class ParquetStorage(BaseStorage):
+    def read(self, path: Path, n: int | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        dataset = ds.dataset(path, format="parquet")
+        table = dataset.head(n) if n else dataset.to_table()
+        return cast_dtypes(table.to_pandas(), dtypes)
+
+    def write(self, df: pd.DataFrame, path: Path) -> None:
+        df.to_parquet(path, index=False)
+
+    def iter_chunks(
+        self, path: Path, chunksize: int, n: int | None = None, dtypes: dict | None = None
+    ) -> Iterator[pd.DataFrame]:
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunksize)
+        chunks = (cast_dtypes(batch.to_pandas(), dtypes) for batch in batches)
+        yield from _limit(chunks, n)
+
+    def write_chunks(self, chunks: Iterable[pd.DataFrame], path: Path) -> int:
+        rows = 0
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    def num_rows(self, path: Path) -> int:
+        return pq.ParquetFile(path).metadata.num_rows
+
+    def read_slice(self, path: Path, start: int, stop: int, dtypes: dict | None = None) -> pd.DataFrame:
+        """Read only the row groups overlapping the slice."""
+        parquet = pq.ParquetFile(path)
+        groups, offset, first = [], 0, None
+        for i in range(parquet.num_row_groups):
+            size = parquet.metadata.row_group(i).num_rows
+            if offset < stop and offset + size > start:
+                groups.append(i)
+                first = offset if first is None else first
+            offset += size
+        if not groups:
+            return cast_dtypes(parquet.schema_arrow.empty_table().to_pandas(), dtypes)
+        table = parquet.read_row_groups(groups)
+        return cast_dtypes(table.slice(start - first, stop - start).to_pandas(), dtypes)
+
+
+class FeatherStorage(BaseStorage):
+    """Arrow IPC files, written uncompressed so batches are read straight from a memory map."""
+
+    batch_size = 65_536
+
+    def read(self, path: Path, n: int | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        table = feather.read_table(path, memory_map=True)
+        if n:
+            table = table.slice(0, n)
+        return cast_dtypes(table.to_pandas(), dtypes)
+
+    def write(self, df: pd.DataFrame, path: Path) -> None:
+        # Uncompressed batches can be memory-mapped and sliced without decompressing the whole file
+        feather.write_feather(df.reset_index(drop=True), path, compression="uncompressed", chunksize=self.batch_size)
+
+    def iter_chunks(
+        self, path: Path, chunksize: int, n: int | None = None, dtypes: dict | None = None
+    ) -> Iterator[pd.DataFrame]:
+        table = feather.read_table(path, memory_map=True)
+        chunks = (cast_dtypes(batch.to_pandas(), dtypes) for batch in table.to_batches(max_chunksize=chunksize))
+        yield from _limit(chunks, n)
+
+    def write_chunks(self, chunks: Iterable[pd.DataFrame], path: Path) -> int:
+        rows = 0
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pa.ipc.new_file(path, table.schema)
+                writer.write_table(table, max_chunksize=self.batch_size)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    @staticmethod
+    def _batch_offsets(reader: pa.ipc.RecordBatchFileReader) -> np.ndarray:
+        """First row of every record batch, and the total row count last."""
+        sizes = [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+        return np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+
+    def num_rows(self, path: Path) -> int:
+        with pa.memory_map(str(path)) as source:
+            return int(self._batch_offsets(pa.ipc.open_file(source))[-1])
+
+    def read_slice(self, path: Path, start: int, stop: int, dtypes: dict | None = None) -> pd.DataFrame:
+        """Read only the record batches overlapping the slice."""
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            offsets = self._batch_offsets(reader)
+            first = max(int(np.searchsorted(offsets, start, side="right")) - 1, 0)
+            last = int(np.searchsorted(offsets, stop, side="left"))
+            batches = [reader.get_batch(i) for i in range(first, min(last, reader.num_record_batches))]
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+            return cast_dtypes(table.slice(start - offsets[first], stop - start).to_pandas(), dtypes)
+
+
+class NumpyStorage(BaseStorage):
+    """One .npy file per column inside a directory, read back with mmap."""
+
+    columns_file = "columns.json"
+
+    def read(self, path: Path, n: int | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        columns = json.loads((path / self.columns_file).read_text())
+        data = {col: np.load(path / f"{col}.npy", mmap_mode="r")[:n] for col in columns}
+        return cast_dtypes(pd.DataFrame(data), dtypes)
+
+    def write(self, df: pd.DataFrame, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        for col in df.columns:
+            np.save(path / f"{col}.npy", self._column_values(df[col]))
+        (path / self.columns_file).write_text(json.dumps(list(df.columns)))
+
+    def iter_chunks(
+        self, path: Path, chunksize: int, n: int | None = None, dtypes: dict | None = None
+    ) -> Iterator[pd.DataFrame]:
+        columns = json.loads((path / self.columns_file).read_text())
+        arrays = {col: np.load(path / f"{col}.npy", mmap_mode="r") for col in columns}
+        total = len(arrays[columns[0]]) if columns else 0
+        total = min(total, n) if n else total
+        for start in range(0, total, chunksize):
+            stop = min(start + chunksize, total)
+            yield cast_dtypes(pd.DataFrame({col: arr[start:stop] for col, arr in arrays.items()}), dtypes)
+
+    @staticmethod
+    def _column_values(series: pd.Series) -> np.ndarray:
+        """The column as a numpy array, with the missing values of a nullable integer column as float NaN."""
+        if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(series.dtype):
+            return (
+                series.to_numpy(dtype=np.float64, na_value=np.nan)
+                if series.hasnans
+                else series.to_numpy(dtype=series.dtype.numpy_dtype)
+            )
+        return np.ascontiguousarray(series.to_numpy())
+
+    @staticmethod
+    def _widen(raw: Path, dtype: np.dtype, wider: np.dtype, block: int = 1 << 20) -> None:
+        """Convert the values already written to raw from dtype to wider, block values at a time."""
+        widened = raw.with_suffix(".widened")
+        with raw.open("rb") as f, widened.open("wb") as out:
+            while len(values := np.fromfile(f, dtype=dtype, count=block)):
+                out.write(values.astype(wider).tobytes())
+        widened.replace(raw)
+
+    def write_chunks(self, chunks: Iterable[pd.DataFrame], path: Path) -> int:
+        """
+        Append the chunks column by column. A column whose values no longer fit its dtype, such as an integer column
+        that meets a missing value in a later chunk, is widened to the common dtype, float64 for that one; columns
+        without a common numeric dtype raise a ValueError.
+        """
+        # The .npy header needs the final length, so append raw bytes per column and prepend the header at the end
+        path.mkdir(parents=True, exist_ok=True)
+        rows = 0
+        dtypes = {}
+        for chunk in chunks:
+            for col in chunk.columns:
+                values = self._column_values(chunk[col])
+                dtype = dtypes.setdefault(col, values.dtype)
+                if not np.can_cast(values.dtype, dtype, casting="safe"):
+                    wider = np.promote_types(dtype, values.dtype)
+                    if wider.kind not in "biuf":
+                        msg = f"Column {col} changed dtype from {dtype} to {values.dtype} between chunks."
+                        raise ValueError(msg)
+                    log.info(f"Widening column {col} from {dtype} to {wider}")
+                    self._widen(path / f"{col}.bin", dtype, wider)
+                    dtypes[col] = wider
+                with (path / f"{col}.bin").open("ab") as f:
+                    f.write(values.astype(dtypes[col], copy=False).tobytes())
+            rows += len(chunk)
+
+        for col, dtype in dtypes.items():
+            raw = path / f"{col}.bin"
+            with (path / f"{col}.npy").open("wb") as out, raw.open("rb") as f:
+                header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,)}
+                np.lib.format.write_array_header_2_0(out, header)
+                shutil.copyfileobj(f, out)
+            raw.unlink()
+        (path / self.columns_file).write_text(json.dumps(list(dtypes)))
+        return rows
+
+    def num_rows(self, path: Path) -> int:
+        columns = json.loads((path / self.columns_file).read_text())
+        return len(np.load(path / f"{columns[0]}.npy", mmap_mode="r")) if columns else 0
+
+    def read_slice(self, path: Path, start: int, stop: int, dtypes: dict | None = None) -> pd.DataFrame:
+        columns = json.loads((path / self.columns_file).read_text())
+        data = {col: np.load(path / f"{col}.npy", mmap_mode="r")[start:stop] for col in columns}
+        return cast_dtypes(pd.DataFrame(data), dtypes)
+
+
+STORAGE_REGISTRY = {
+    "csv": CsvStorage,
+    "parquet": ParquetStorage,
+    "feather": FeatherStorage,
+    "numpy": NumpyStorage,
+}
+
+
+def infer_format(path: str | Path) -> str:
+    """Infer the storage format from the file suffix, e.g. ratings.parquet -> parquet."""
+    return Path(path).suffix.lstrip(".").lower()
+
+
+def get_storage(fmt: str) -> BaseStorage:
+    storage_class = STORAGE_REGISTRY.get(fmt.lower())
+    if not storage_class:
+        msg = f"Unknown storage format '{fmt}'."
+        raise ValueError(msg)
+    return storage_class()
+
+
+def remove_path(path: Path) -> None:
+    """Remove a file or a column directory if it exists."""
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
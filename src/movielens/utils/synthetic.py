@@ -0,0 +1,156 @@
+import logging
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig
+from scipy.special import ndtr
+
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
+
+from .dataset import write_data_chunks
+
+log = logging.getLogger(__name__)
+ccfg = DataColumnsConfig
+
+# Half-star rating levels and their approximate share of the ml-32m ratings
+RATING_LEVELS = np.arange(1, 11, dtype=np.float32) / 2
+RATING_PROBS = np.array([0.016, 0.030, 0.016, 0.066, 0.051, 0.196, 0.129, 0.262, 0.088, 0.146])
+# First and last rating times of ml-32m
+FIRST_TIMESTAMP = 789_652_009
+LAST_TIMESTAMP = 1_697_164_604
+SECONDS_PER_YEAR = 365 * 24 * 3600
+# Smallest default catalogue, so small datasets still have room for their heaviest users
+MIN_MOVIES = 1000
+# Rounds of redrawing movies a user already rated: popularity-weighted first, then uniform, as the heaviest users
+# run out of distinct popular movies
+WEIGHTED_ROUNDS = 5
+MAX_ROUNDS = 50
+
+
+def duplicated_pairs(users: np.ndarray, movies: np.ndarray, n_movies: int) -> np.ndarray:
+    """Mask of user-movie pairs already seen earlier in the arrays."""
+    _, first = np.unique(users.astype(np.int64) * n_movies + movies, return_index=True)
+    dup = np.ones(len(users), dtype=bool)
+    dup[first] = False
+    return dup
+
+
+def cap_counts(counts: np.ndarray, weights: np.ndarray, cap: int, rng: np.random.Generator) -> np.ndarray:
+    """Clip counts at cap and hand the excess to the uncapped entries in proportion to weights, keeping the total."""
+    counts = counts.copy()
+    while (excess := int(np.clip(counts - cap, 0, None).sum())) > 0:
+        np.minimum(counts, cap, out=counts)
+        open_weights = np.where(counts < cap, weights, 0)
+        if not open_weights.any():
+            break
+        counts += rng.multinomial(excess, open_weights / open_weights.sum())
+    return counts
+
+
+def power_law(n: int, alpha: float, offset: float) -> np.ndarray:
+    """Zipf-Mandelbrot probabilities p_i proportional to (i + offset)^-alpha over n ranks."""
+    weights = (np.arange(n) + offset) ** -float(alpha)
+    return weights / weights.sum()
+
+
+class SyntheticRatings:
+    """
+    Generator of MovieLens-like ratings at any size, produced in chunks.
+
+    User activity and movie popularity follow power laws and every user has at least min_user_ratings ratings.
+    Ratings come from a latent user + movie + noise score mapped through the ml-32m rating distribution, so the
+    marginal distribution is realistic and the biases are learnable. No user rates a movie twice, and rows are
+    grouped by user and ordered by timestamp within a user, like the raw ratings.csv. Only per-user and per-movie
+    arrays and one chunk are ever held in memory.
+    """
+
+    def __init__(self, cfg: DictConfig) -> None:
+        """Init from the synthetic config section."""
+        self.n_rows = cfg.n_rows
+        self.n_users = cfg.n_users or max(self.n_rows // 160, 1)
+        self.n_movies = cfg.n_movies or max(self.n_rows // 365, MIN_MOVIES)
+        self.chunk_size = cfg.chunk_size
+        self.seed = cfg.seed
+        rng = np.random.default_rng(self.seed)
+
+        floor = min(cfg.min_user_ratings, self.n_rows // self.n_users)
+        activity = power_law(self.n_users, cfg.user_alpha, cfg.user_offset)
+        counts = floor + rng.multinomial(self.n_rows - floor * self.n_users, activity)
+        counts = cap_counts(counts, activity, self.n_movies // 2, rng)
+        # Ids are not ranked by activity or popularity, as in the real data
+        self.user_counts = rng.permutation(counts)
+        self.movie_ids = rng.permutation(self.n_movies).astype(np.int32) + 1
+        self.movie_cdf = np.cumsum(power_law(self.n_movies, cfg.movie_alpha, cfg.movie_offset))
+
+        self.user_bias = rng.normal(0, cfg.user_bias_std, self.n_users)
+        self.movie_bias = rng.normal(0, cfg.movie_bias_std, self.n_movies)
+        self.noise_std = cfg.noise_std
+        self.user_start = rng.uniform(FIRST_TIMESTAMP, LAST_TIMESTAMP, self.n_users)
+        self.user_span = rng.exponential(cfg.mean_active_years * SECONDS_PER_YEAR, self.n_users)
+
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        """Yield the ratings in chunks of whole users, about chunk_size rows each."""
+        # offsets[i] is the number of rows before user i
+        offsets = np.r_[0, np.cumsum(self.user_counts)]
+        start_user, chunk = 0, 0
+        while start_user < self.n_users:
+            stop_user = int(np.searchsorted(offsets, offsets[start_user] + self.chunk_size, side="right")) - 1
+            stop_user = min(max(stop_user, start_user + 1), self.n_users)
+            yield self.users_frame(start_user, stop_user, np.random.default_rng([self.seed, chunk]))
+            start_user, chunk = stop_user, chunk + 1
+
+    def users_frame(self, start: int, stop: int, rng: np.random.Generator) -> pd.DataFrame:
+        """All ratings of the users with indices in [start, stop)."""
+        users = np.repeat(np.arange(start, stop), self.user_counts[start:stop])
+        movies = self.sample_movies(users, rng)
+        keep = ~duplicated_pairs(users, movies, self.n_movies)
+        users, movies = users[keep], movies[keep]
+
+        score = self.user_bias[users] + self.movie_bias[movies] + rng.normal(0, self.noise_std, len(users))
+        scale = np.sqrt(self.user_bias.var() + self.movie_bias.var() + self.noise_std**2)
+        ratings = RATING_LEVELS[np.searchsorted(np.cumsum(RATING_PROBS)[:-1], ndtr(score / scale))]
+
+        timestamps = self.user_start[users] + rng.exponential(self.user_span[users])
+        timestamps = np.minimum(timestamps, LAST_TIMESTAMP).astype(np.int64)
+        order = np.lexsort((timestamps, users))
+        return pd.DataFrame(
+            {
+                ccfg.user_id: users[order] + 1,
+                ccfg.movie_id: self.movie_ids[movies[order]],
+                ccfg.rating: ratings[order],
+                ccfg.timestamp: timestamps[order],
+            }
+        ).astype(RATINGS_DTYPES)
+
+    def sample_movies(self, users: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Movie indices by popularity, one per row, redrawing movies a user already rated.
+
+        Each round only re-checks the users that still had a repeat, so the few heavy users drive the cost. Users
+        rate at most half the catalogue, so repeats left after MAX_ROUNDS are rare; they are dropped later.
+        """
+        movies = np.searchsorted(self.movie_cdf, rng.random(len(users)) * self.movie_cdf[-1])
+        rows = np.arange(len(users))
+        for attempt in range(MAX_ROUNDS):
+            dup = duplicated_pairs(users[rows], movies[rows], self.n_movies)
+            if not dup.any():
+                break
+            redraw = rows[dup]
+            if attempt < WEIGHTED_ROUNDS:
+                movies[redraw] = np.searchsorted(self.movie_cdf, rng.random(len(redraw)) * self.movie_cdf[-1])
+            else:
+                movies[redraw] = rng.integers(0, self.n_movies, len(redraw))
+            rows = rows[np.isin(users[rows], users[redraw])]
+        return movies
+
+    def frame(self) -> pd.DataFrame:
+        """All ratings in memory, for sizes that fit."""
+        return pd.concat(self.chunks(), ignore_index=True)
+
+    def write(self, path: str, fmt: str | None = None) -> int:
+        """Stream the ratings to path chunk by chunk and return the number of rows written."""
+        log.info(f"Generating {self.n_rows} ratings for {self.n_users} users and {self.n_movies} movies into {path}")
+        rows = write_data_chunks(self.chunks(), path, fmt=fmt)
+        log.info(f"Wrote {rows} synthetic ratings to {path}")
+        return rows
@@ -0,0 +1,156 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from pandera import Check, Column, DataFrameSchema
+from pandera.errors import SchemaError, SchemaErrorReason
+
+log = logging.getLogger(__name__)
+
+NULLS = SchemaErrorReason.SERIES_CONTAINS_NULLS
+CHECK = SchemaErrorReason.DATAFRAME_CHECK
+
+# Bounds (min, include_min, max, include_max) of the element-wise checks the fast path evaluates as reductions
+BOUND_CHECKS = {
+    "in_range": lambda s: (s["min_value"], s["include_min"], s["max_value"], s["include_max"]),
+    "greater_than": lambda s: (s["min_value"], False, None, True),
+    "greater_than_or_equal_to": lambda s: (s["min_value"], True, None, True),
+    "less_than": lambda s: (None, True, s["max_value"], False),
+    "less_than_or_equal_to": lambda s: (None, True, s["max_value"], True),
+}
+
+
+def out_of_bounds(values: np.ndarray, bounds: tuple) -> np.ndarray:
+    """Mask of values outside the bounds. NaN compares False, so nulls are never out of bounds."""
+    low, include_low, high, include_high = bounds
+    mask = np.zeros(len(values), dtype=bool)
+    if low is not None:
+        mask |= values < low if include_low else values <= low
+    if high is not None:
+        mask |= values > high if include_high else values >= high
+    return mask
+
+
+def within_bounds(low_value: float, high_value: float, bounds: tuple) -> bool:
+    """Whether a column with this min and max satisfies the bounds."""
+    low, include_low, high, include_high = bounds
+    if low is not None and (low_value < low if include_low else low_value <= low):
+        return False
+    return high is None or (high_value <= high if include_high else high_value < high)
+
+
+def schema_error(  # noqa: PLR0913
+    schema: DataFrameSchema,
+    df: pd.DataFrame,
+    column: str,
+    mask: np.ndarray,
+    *,
+    reason: SchemaErrorReason,
+    description: str,
+    n_examples: int,
+    check: Check | None = None,
+) -> SchemaError:
+    """A SchemaError reporting the number of failing rows and the first n_examples, like pandera's own."""
+    failures = df[column][mask].head(n_examples)
+    failure_cases = pd.DataFrame({"index": failures.index, "failure_case": failures.to_numpy()})
+    message = (
+        f"Column '{column}' failed {description} check on {int(mask.sum())} of {len(df)} rows, "
+        f"failure cases: {', '.join(map(str, failure_cases['failure_case']))}"
+    )
+    return SchemaError(
+        schema, df, message, failure_cases=failure_cases, check=check, reason_code=reason, column_name=column
+    )
+
+
+def value_range(schema: DataFrameSchema, df: pd.DataFrame, name: str, column: Column, n_examples: int) -> tuple:
+    """Min and max of a numeric column, raising on NaN in a non-nullable one."""
+    values = df[name].to_numpy()
+    low_value, high_value = values.min(), values.max()
+    # NaN propagates through min and max, so the same two reductions also detect nulls in float columns
+    if np.isnan(low_value) or np.isnan(high_value):
+        if not column.nullable:
+            nulls = np.isnan(values)
+            raise schema_error(schema, df, name, nulls, reason=NULLS, description="not-null", n_examples=n_examples)
+        low_value, high_value = np.nanmin(values), np.nanmax(values)
+    return low_value, high_value
+
+
+def check_column(schema: DataFrameSchema, df: pd.DataFrame, name: str, column: Column, n_examples: int) -> None:
+    """Check one column's dtype, nulls and bound checks, computing row masks only once a check has failed."""
+    series = df[name]
+    if column.dtype is not None and str(series.dtype) != str(column.dtype):
+        msg = f"expected series '{name}' to have type {column.dtype}, got {series.dtype}"
+        raise SchemaError(schema, df, msg, reason_code=SchemaErrorReason.WRONG_DATATYPE, column_name=name)
+    if series.empty:
+        return
+
+    bounds = [
+        (check, BOUND_CHECKS[check.name](check.statistics)) for check in column.checks if check.name in BOUND_CHECKS
+    ]
+    # Only NumPy-backed numbers are reduced directly; extension arrays would be copied to objects
+    numeric = isinstance(series.dtype, np.dtype) and series.dtype.kind in "iuf"
+    if len(bounds) < len(column.checks) or (bounds and not numeric):
+        # Other checks and non-numeric columns are left to pandera
+        DataFrameSchema({name: column}).validate(df[[name]])
+        return
+    if not numeric:
+        if not column.nullable and series.hasnans:
+            nulls = series.isna().to_numpy()
+            raise schema_error(schema, df, name, nulls, reason=NULLS, description="not-null", n_examples=n_examples)
+        return
+
+    low_value, high_value = value_range(schema, df, name, column, n_examples)
+    for check, bound in bounds:
+        if not within_bounds(low_value, high_value, bound):
+            mask = out_of_bounds(series.to_numpy(), bound)
+            raise schema_error(
+                schema,
+                df,
+                name,
+                mask,
+                reason=CHECK,
+                description=check.error or check.name,
+                n_examples=n_examples,
+                check=check,
+            )
+
+
+def fast_validate(
+    df: pd.DataFrame,
+    schema: DataFrameSchema,
+    sample_size: int | None = None,
+    seed: int = 0,
+    n_examples: int = 5,
+) -> pd.DataFrame:
+    """
+    Validate df against schema from dtype metadata and one min/max reduction per column instead of pandera.
+
+    Covers column presence, dtypes, nullability and range checks; columns with other checks are validated by pandera.
+    A random sample of sample_size rows is then validated by pandera in full detail. Raises SchemaError with the
+    count and first n_examples of the failing rows.
+    """
+    missing = [name for name, column in schema.columns.items() if column.required and name not in df.columns]
+    if missing:
+        msg = f"column(s) {missing} not in dataframe"
+        raise SchemaError(schema, df, msg, reason_code=SchemaErrorReason.COLUMN_NOT_IN_DATAFRAME)
+    for name, column in schema.columns.items():
+        if name in df.columns:
+            check_column(schema, df, name, column, n_examples)
+
+    if sample_size and len(df):
+        # Generator.choice draws without a full permutation, unlike DataFrame.sample
+        rows = np.random.default_rng(seed).choice(len(df), min(sample_size, len(df)), replace=False)
+        schema.validate(df.take(np.sort(rows)))
+    return df
+
+
+def validate_frame(
+    df: pd.DataFrame, schema: DataFrameSchema, mode: str, sample_size: int | None = None, seed: int = 0
+) -> pd.DataFrame:
+    """Validate df with pandera on every row (full) or with the vectorized fast path (fast)."""
+    if mode == "full":
+        return schema.validate(df)
+    if mode == "fast":
+        return fast_validate(df, schema, sample_size=sample_size, seed=seed)
+    msg = f"Unknown validation mode '{mode}'."
+    raise ValueError(msg)
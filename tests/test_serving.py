@@ -0,0 +1,57 @@
+from http import HTTPStatus
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from omegaconf import OmegaConf
+
+from movielens.conf.schema import DataColumnsConfig
+from movielens.models.classic import SKLearnRegression
+from movielens.serving.app import create_app
+
+ccfg = DataColumnsConfig
+
+
+@pytest.fixture
+def classic_model() -> SKLearnRegression:
+    rng = np.random.default_rng(0)
+    n = 500
+    x = pd.DataFrame(
+        {
+            ccfg.user_id: rng.integers(1, 20, n),
+            ccfg.movie_id: rng.integers(1, 50, n),
+            ccfg.timestamp: rng.integers(1_000_000_000, 1_100_000_000, n),
+        }
+    )
+    model = SKLearnRegression()
+    model.fit(x, rng.choice(np.arange(0.5, 5.5, 0.5), n))
+    return model
+
+
+@pytest.fixture
+def client(classic_model: SKLearnRegression) -> TestClient:
+    cfg = OmegaConf.create({"serving": {"max_batch_size": 8, "max_wait_ms": 1}})
+    with TestClient(create_app(cfg, model=classic_model)) as client:
+        yield client
+
+
+def test_predict_classic(client: TestClient, classic_model: SKLearnRegression) -> None:
+    response = client.post("/predict", json={"user_id": 3, "movie_id": 7})
+    assert response.status_code == HTTPStatus.OK
+    expected = classic_model.predict([3], [7])[0]
+    assert response.json()["rating"] == pytest.approx(expected)
+
+
+def test_predict_classic_unseen_ids(client: TestClient) -> None:
+    response = client.post("/predict", json={"user_id": 10_000, "movie_id": 10_000})
+    assert response.status_code == HTTPStatus.OK
+    assert np.isfinite(response.json()["rating"])
+
+
+def test_recommend_classic(client: TestClient) -> None:
+    n = 5
+    response = client.get("/recommend/3", params={"n": n})
+    assert response.status_code == HTTPStatus.OK
+    movies = response.json()["movies"]
+    assert 0 < len(movies) <= n
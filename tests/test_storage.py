@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from movielens.conf.schema import RATINGS_DTYPES, DataColumnsConfig
+from movielens.utils.dataset import load_data, remove_nulls, to_columnar, write_data_chunks
+
+ccfg = DataColumnsConfig
+
+RATINGS_CSV = """userId,movieId,rating,timestamp
+1,10,4.0,100
+1,11,3.5,101
+2,10,5.0,102
+2,,2.0,103
+3,12,1.0,104
+3,13,4.5,105
+4,10,3.0,106
+"""
+
+
+@pytest.fixture
+def ratings_csv(tmp_path: Path) -> Path:
+    path = tmp_path / "ratings.csv"
+    path.write_text(RATINGS_CSV)
+    return path
+
+
+@pytest.mark.parametrize("chunksize", [3, 4])
+def test_numpy_chunks_keep_ids_after_null_in_later_chunk(ratings_csv: Path, chunksize: int) -> None:
+    path = to_columnar(str(ratings_csv), fmt="numpy", dtypes=RATINGS_DTYPES, chunksize=chunksize)
+    df = load_data(str(path), dtypes=RATINGS_DTYPES)
+    assert df[ccfg.movie_id].isna().tolist() == [False, False, False, True, False, False, False]
+    assert df[ccfg.movie_id].dropna().tolist() == [10, 11, 10, 12, 13, 10]
+    clean = remove_nulls(df, dtypes=RATINGS_DTYPES)
+    assert clean[ccfg.movie_id].dtype == np.int32
+    assert clean[ccfg.movie_id].tolist() == [10, 11, 10, 12, 13, 10]
+
+
+def test_numpy_chunks_with_null_in_first_chunk(ratings_csv: Path) -> None:
+    path = to_columnar(str(ratings_csv), fmt="numpy", dtypes=RATINGS_DTYPES, chunksize=5)
+    df = remove_nulls(load_data(str(path), dtypes=RATINGS_DTYPES), dtypes=RATINGS_DTYPES)
+    assert df[ccfg.movie_id].tolist() == [10, 11, 10, 12, 13, 10]
+
+
+def test_numpy_chunks_reject_incompatible_dtypes(tmp_path: Path) -> None:
+    chunks = [pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": ["x", "y"]})]
+    with pytest.raises(ValueError, match="changed dtype"):
+        write_data_chunks(chunks, str(tmp_path / "data.numpy"), fmt="numpy")